@@ -0,0 +1,208 @@
+# admission.py
+"""
+Completion-time estimates for transcription jobs, and back-pressure when the
+queue is too long.
+
+A job's completion time is estimated from the work ahead of it and its own
+length. Work is measured in seconds of audio and turned into wall time with a
+rolling real-time factor: the median, over the last ETA_SAMPLE_JOBS completed
+jobs, of processing time divided by audio duration (both stored in the job
+metadata by the queue processor). Reading those files is left to refresh(),
+which the backend and the queue processor each run from a background loop
+every ETA_REFRESH_SECONDS; estimates only read the last value. The work ahead
+is every earlier queued job plus what is left of the ones processing, shared
+between the queue processor's parallel workers.
+
+When ADMISSION_MAX_WAIT_SECONDS is set and a new job would wait longer than
+that to start, ADMISSION_MODE decides what happens:
+  reject  the upload is refused with 429 and a Retry-After of roughly when
+          the backlog will be back under the threshold
+  defer   the job is accepted into the "deferred" lane, which the queue
+          processor only runs during OFF_PEAK_HOURS or on otherwise idle
+          workers
+"""
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from statistics import median
+from typing import Any, Dict, Optional, Tuple
+
+from job_index import JobIndex, job_index
+from model_router import model_router
+from utils import load_metadata_json
+
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "0"))  # 0 = accept everything
+ADMISSION_MODE = os.getenv("ADMISSION_MODE", "reject").lower()
+# Local hours, "start-end" (wrapping past midnight allowed)
+OFF_PEAK_HOURS = os.getenv("OFF_PEAK_HOURS", "20-7")
+
+ETA_SAMPLE_JOBS = int(os.getenv("ETA_SAMPLE_JOBS", "50"))
+ETA_REFRESH_SECONDS = float(os.getenv("ETA_REFRESH_SECONDS", "60"))
+# Used until enough jobs have completed to measure it
+ETA_DEFAULT_RTF = float(os.getenv("ETA_DEFAULT_RTF", "0.5"))
+# Duration guess for uploads whose length can't be read (browser webm has no duration header)
+ETA_FALLBACK_BYTES_PER_SECOND = float(os.getenv("ETA_FALLBACK_BYTES_PER_SECOND", "16000"))
+ETA_DEFAULT_DURATION_SECONDS = float(os.getenv("ETA_DEFAULT_DURATION_SECONDS", "600"))
+
+# Same default as the queue processor
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "0")) or len(model_router.endpoints)
+
+NORMAL_LANE = "normal"
+DEFERRED_LANE = "deferred"
+
+
+def _off_peak_window() -> Tuple[int, int]:
+    start, end = OFF_PEAK_HOURS.split("-", 1)
+    return int(start), int(end)
+
+
+def is_off_peak(now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now()
+    start, end = _off_peak_window()
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+
+def next_off_peak(now: Optional[datetime] = None) -> datetime:
+    """Start of the next off-peak window (now, if we're in one)."""
+    now = now or datetime.now()
+    if is_off_peak(now):
+        return now
+    start, _ = _off_peak_window()
+    at = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    return at if at > now else at + timedelta(days=1)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, wait_s: float, retry_after_s: int):
+        super().__init__(f"Projected wait of {wait_s:.0f}s exceeds {ADMISSION_MAX_WAIT_SECONDS:.0f}s")
+        self.wait_s = wait_s
+        self.retry_after_s = retry_after_s
+
+
+class CompletionEstimator:
+    def __init__(self, index: JobIndex, workers: int = QUEUE_WORKERS):
+        self.index = index
+        self.workers = max(1, workers)
+        self._samples: Dict[str, float] = {}
+        self._rtf = ETA_DEFAULT_RTF
+        self._refresh_lock = threading.Lock()
+
+    def rtf(self) -> float:
+        """Rolling real-time factor (processing seconds per second of audio), as of the last refresh()."""
+        return self._rtf
+
+    def refresh(self) -> None:
+        """Recompute the real-time factor from the latest completed jobs. Blocking (reads their metadata)."""
+        with self._refresh_lock:
+            _, jobs = self.index.query(status="completed", limit=ETA_SAMPLE_JOBS)
+            samples = {}
+            for job in jobs:
+                audio_id = job["audio_id"]
+                if audio_id in self._samples:
+                    samples[audio_id] = self._samples[audio_id]
+                    continue
+                metadata = load_metadata_json(audio_id)
+                duration = metadata.get("duration_s")
+                total = (metadata.get("timings") or {}).get("total_s")
+                if duration and total:
+                    samples[audio_id] = total / duration
+            self._samples = samples
+            if samples:
+                self._rtf = median(samples.values())
+
+    @staticmethod
+    def duration_of(job: Dict[str, Any]) -> float:
+        return job.get("duration_s") or ETA_DEFAULT_DURATION_SECONDS
+
+    def wait_seconds(self, before: Optional[str] = None) -> float:
+        """
+        Projected seconds until a normal-lane job starts: the normal-lane jobs
+        queued ahead of it (created before `before`, or all of them) plus the
+        remainder of those processing, spread over the workers.
+        """
+        rtf = self.rtf()
+        now = datetime.now()
+        _, queued = self.index.query(status="queued", limit=100000)
+        _, processing = self.index.query(status="processing", limit=100000)
+
+        work = 0.0
+        for job in queued:
+            if job.get("lane", NORMAL_LANE) != NORMAL_LANE:
+                continue
+            if before is not None and str(job.get("created_at") or "") >= before:
+                continue
+            work += self.duration_of(job) * rtf
+        for job in processing:
+            expected = self.duration_of(job) * rtf
+            try:
+                elapsed = (now - datetime.fromisoformat(job["processing_started_at"])).total_seconds()
+            except (KeyError, TypeError, ValueError):
+                elapsed = 0.0
+            work += max(expected - elapsed, 0.0)
+        return work / self.workers
+
+    def estimate(self, duration_s: Optional[float], lane: str = NORMAL_LANE,
+                 created_at: Optional[str] = None, started_at: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Estimate for one job. A processing job passes started_at; a queued one
+        its created_at, so only jobs ahead of it count.
+        """
+        rtf = self.rtf()
+        now = datetime.now()
+        processing_s = (duration_s or ETA_DEFAULT_DURATION_SECONDS) * rtf
+        if started_at:
+            try:
+                elapsed = (now - datetime.fromisoformat(started_at)).total_seconds()
+            except ValueError:
+                elapsed = 0.0
+            wait_s = 0.0
+            processing_s = max(processing_s - elapsed, 0.0)
+        elif lane == DEFERRED_LANE:
+            wait_s = max((next_off_peak(now) - now).total_seconds(), self.wait_seconds(before=created_at))
+        else:
+            wait_s = self.wait_seconds(before=created_at)
+        return {
+            "lane": lane,
+            "audio_duration_s": round(duration_s, 1) if duration_s else None,
+            "estimated_wait_s": round(wait_s),
+            "estimated_processing_s": round(processing_s),
+            "estimated_completion_at": (now + timedelta(seconds=wait_s + processing_s)).isoformat(timespec="seconds"),
+            "rtf": round(rtf, 3),
+        }
+
+    def admit(self) -> str:
+        """
+        Lane for a new job, or AdmissionRejected. Checked before the audio
+        arrives, so it depends only on the queue ahead.
+        """
+        if ADMISSION_MAX_WAIT_SECONDS <= 0:
+            return NORMAL_LANE
+        wait_s = self.wait_seconds()
+        if wait_s <= ADMISSION_MAX_WAIT_SECONDS:
+            return NORMAL_LANE
+        if ADMISSION_MODE == "defer":
+            return DEFERRED_LANE
+        # The backlog drains in real time, so it's under the threshold again in about this long
+        raise AdmissionRejected(wait_s, max(30, math.ceil(wait_s - ADMISSION_MAX_WAIT_SECONDS)))
+
+
+def estimate_job(job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Estimate for a queued or processing job from its metadata or index entry; None otherwise."""
+    status = job.get("status")
+    if status == "queued":
+        return estimator.estimate(job.get("duration_s"), job.get("lane", NORMAL_LANE), created_at=job.get("created_at"))
+    if status == "processing":
+        return estimator.estimate(
+            job.get("duration_s"), job.get("lane", NORMAL_LANE), started_at=job.get("processing_started_at"),
+        )
+    return None
+
+
+def fallback_duration(size_bytes: int) -> float:
+    return size_bytes / ETA_FALLBACK_BYTES_PER_SECOND
+
+
+estimator = CompletionEstimator(job_index)
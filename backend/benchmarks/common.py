@@ -0,0 +1,91 @@
+# benchmarks/common.py
+"""Small helpers shared by the benchmark scripts."""
+import io
+import math
+import socket
+import struct
+import time
+import wave
+from typing import Dict, List, Sequence
+
+import requests
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_http(url: str, timeout: float = 30.0) -> None:
+    """Poll url until it answers (any status) or raise after timeout."""
+    deadline = time.monotonic() + timeout
+    last_error = None
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=2)
+            return
+        except Exception as e:
+            last_error = e
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s: {last_error}")
+
+
+def make_wav_bytes(seconds: float, sample_rate: int = 16000, tone_hz: float = 220.0) -> bytes:
+    """A mono 16-bit PCM tone, so the converter and model see real audio."""
+    buffer = io.BytesIO()
+    write_wav(buffer, seconds, sample_rate, tone_hz)
+    return buffer.getvalue()
+
+
+def write_wav(dest, seconds: float, sample_rate: int = 16000, tone_hz: float = 220.0) -> None:
+    """Write a tone to a path or file object; one second is synthesised and repeated."""
+    second = b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * tone_hz * i / sample_rate)))
+        for i in range(sample_rate)
+    )
+    frames = int(seconds * sample_rate)
+    with wave.open(dest, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        whole, rest = divmod(frames, sample_rate)
+        for _ in range(whole):
+            w.writeframes(second)
+        w.writeframes(second[:rest * 2])
+
+
+def wav_duration(path: str) -> float:
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / float(w.getframerate())
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def format_table(headers: List[str], rows: List[List]) -> str:
+    cells = [headers] + [[f"{c:.1f}" if isinstance(c, float) else str(c) for c in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = []
+    for n, row in enumerate(cells):
+        lines.append("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths))))
+        if n == 0:
+            lines.append("  ".join("-" * w for w in widths))
+    return "\n".join(lines)
@@ -0,0 +1,155 @@
+# benchmarks/fake_model.py
+"""
+Stub for the model service's POST /transcribe, /transcribe-stream and
+/transcribe-features (the body is only checksummed, not parsed as features).
+
+Service time is `latency + rtf * audio_seconds`, where audio_seconds is read
+from the WAV header of the requested file or streamed body (0 if it can't be
+read). `capacity` requests are served at once, like GPU slots; the rest wait
+their turn. With stall_seconds set, each request waits that long before
+reading its body, so the sender fills its socket buffer. The transcript is a couple of diarized lines per minute of audio,
+in the same format the real model writes.
+
+    python -m benchmarks.fake_model --port 5005 --latency 0.2 --rtf 0.05
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import wav_duration
+
+
+class FakeModel:
+    def __init__(self, latency: float = 0.5, rtf: float = 0.0, capacity: int = 1, stall_seconds: float = 0.0):
+        self.latency = latency
+        self.rtf = rtf
+        self.capacity = capacity
+        self.stall_seconds = stall_seconds
+        self._slots = threading.Semaphore(capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.served = 0
+        self.busy_seconds = 0.0
+
+    def service_time(self, audio_seconds: float) -> float:
+        return self.latency + self.rtf * audio_seconds
+
+    def transcribe(self, audio_path: str) -> dict:
+        try:
+            audio_seconds = wav_duration(audio_path) if audio_path and os.path.exists(audio_path) else 0.0
+        except Exception:
+            audio_seconds = 0.0
+        return self.transcribe_seconds(audio_seconds)
+
+    def transcribe_bytes(self, data: bytes) -> dict:
+        try:
+            audio_seconds = wav_duration(io.BytesIO(data))
+        except Exception:
+            audio_seconds = 0.0
+        return self.transcribe_seconds(audio_seconds)
+
+    def transcribe_seconds(self, audio_seconds: float) -> dict:
+        with self._slots:
+            with self._lock:
+                self.in_flight += 1
+            started = time.monotonic()
+            time.sleep(self.service_time(audio_seconds))
+            with self._lock:
+                self.in_flight -= 1
+                self.served += 1
+                self.busy_seconds += time.monotonic() - started
+        return {"transcript": fake_transcript(audio_seconds), "audio_seconds": audio_seconds}
+
+
+def fake_transcript(audio_seconds: float) -> str:
+    lines = []
+    t = 0.0
+    n = 0
+    while t < max(audio_seconds, 1.0):
+        end = min(t + 30.0, max(audio_seconds, 1.0))
+        m1, s1 = divmod(t, 60.0)
+        m2, s2 = divmod(end, 60.0)
+        lines.append(
+            f"[SPEAKER_0{n % 2} {int(m1):02d}:{s1:04.1f} - {int(m2):02d}:{s2:04.1f}]: "
+            f"Synthetic benchmark segment {n} about blood pressure and medication review."
+        )
+        t = end
+        n += 1
+    return "\n".join(lines) + "\n"
+
+
+def _make_handler(model: FakeModel):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+            pass
+
+        def _send(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/health"):
+                self._send(200, {
+                    "status": "ok", "capacity": model.capacity, "in_flight": model.in_flight, "served": model.served,
+                })
+            else:
+                self._send(404, {"detail": "Not found"})
+
+        def _read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+
+        def do_POST(self):
+            time.sleep(model.stall_seconds)
+            body = self._read_body()
+            if self.path.startswith(("/transcribe-stream", "/transcribe-features")):
+                if hashlib.sha256(body).hexdigest() != (self.headers.get("X-Audio-SHA256") or "").lower():
+                    self._send(400, {"detail": "Audio checksum mismatch"})
+                    return
+                self._send(200, model.transcribe_bytes(body))
+            elif self.path.startswith("/transcribe"):
+                self._send(200, model.transcribe(json.loads(body or b"{}").get("audio_path")))
+            else:
+                self._send(404, {"detail": "Not found"})
+
+    return Handler
+
+
+def serve(model: FakeModel, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start serving model in a daemon thread; the bound port is server.server_port."""
+    server = ThreadingHTTPServer((host, port), _make_handler(model))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-model", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--latency", type=float, default=0.5, help="fixed seconds per request")
+    parser.add_argument("--rtf", type=float, default=0.0, help="extra seconds per second of audio")
+    parser.add_argument("--capacity", type=int, default=1, help="requests served concurrently")
+    args = parser.parse_args()
+
+    server = serve(FakeModel(args.latency, args.rtf, args.capacity), port=args.port)
+    print(f"Fake model on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
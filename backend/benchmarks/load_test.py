@@ -0,0 +1,439 @@
+# benchmarks/load_test.py
+"""
+Load test the backend without the hosted Supabase project or a GPU.
+
+Starts, in one go:
+  - the fake PostgREST (benchmarks/fake_supabase.py), seeded with clinicians,
+    today's appointments and some finished transcripts, and the fake model
+    service (benchmarks/fake_model.py), together in a child process so they
+    don't compete with the load generator for the GIL
+  - backend/main.py in a subprocess with an event-loop lag sampler
+    (benchmarks/serve_backend.py), storage in a temp directory
+  - optionally the queue processor, so uploads run through to "completed"
+    (needs ffmpeg, like production)
+
+then drives a weighted mix of dashboard traffic from --concurrency virtual
+users and reports req/s and p50/p95/p99 latency per route plus event-loop
+lag. --output saves the numbers as JSON; --compare prints the change against
+an earlier run. Run from the backend directory:
+
+    python -m benchmarks.load_test --duration 30 --concurrency 50
+    python -m benchmarks.load_test --mix batch_status=3,card_status=1 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks import fake_model, fake_supabase
+from benchmarks.common import format_table, free_port, make_wav_bytes, summarize, wait_for_http
+from benchmarks.fake_model import fake_transcript
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_MIX = "card_status=30,batch_status=15,job_status=20,schedule=10,transcript=8,edit=8,upload=5,bulk=4"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.enabled = True
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            if self.enabled:
+                self.errors[route] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        if self.enabled:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][response.status_code] += 1
+            if response.status_code >= 500:
+                self.errors[route] += 1
+        return response
+
+
+class Clinic:
+    """What the virtual users know about the seeded data."""
+
+    def __init__(self, schedule: Dict[int, List[int]], transcripts: List[Dict[str, Any]], day: str):
+        self.schedule = schedule
+        self.user_ids = list(schedule)
+        self.transcripts = transcripts
+        self.day = day
+        self.versions = {t["audio_id"]: 0 for t in transcripts}
+        self.etags: Dict[str, str] = {}
+        self.uploaded: List[str] = []
+        self.wav = make_wav_bytes(2.0)
+
+
+# ----------------------------- scenarios -----------------------------------
+
+async def card_status(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    user_id = rng.choice(clinic.user_ids)
+    appointment_id = rng.choice(clinic.schedule[user_id])
+    await rec.request(client, "GET /appointments/{id}/status", "GET", f"/appointments/{appointment_id}/status")
+
+
+async def batch_status(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    user_id = rng.choice(clinic.user_ids)
+    await rec.request(client, "POST /appointments/status", "POST", "/appointments/status", json={
+        "user_id": user_id, "date_from": clinic.day, "date_to": clinic.day,
+    })
+
+
+async def job_status(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    pool = clinic.uploaded or [t["audio_id"] for t in clinic.transcripts]
+    audio_id = rng.choice(pool)
+    headers = {"If-None-Match": clinic.etags[audio_id]} if audio_id in clinic.etags else {}
+    response = await rec.request(client, "GET /transcribe/status/{id}", "GET", f"/transcribe/status/{audio_id}", headers=headers)
+    if response is not None and response.headers.get("ETag"):
+        clinic.etags[audio_id] = response.headers["ETag"]
+
+
+async def schedule(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    user_id = rng.choice(clinic.user_ids)
+    await rec.request(client, "GET /appointments/user/{id}", "GET", f"/appointments/user/{user_id}", params={
+        "is_dummy": "false", "date_from": clinic.day, "date_to": clinic.day, "limit": 500,
+    })
+
+
+async def transcript(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    audio_id = rng.choice(clinic.transcripts)["audio_id"]
+    await rec.request(client, "GET /transcribe/text/{id}", "GET", f"/transcribe/text/{audio_id}")
+
+
+async def edit(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    audio_id = rng.choice(clinic.transcripts)["audio_id"]
+    response = await rec.request(client, "POST /transcribe/patch/{id}", "POST", f"/transcribe/patch/{audio_id}", json={
+        "base_version": clinic.versions[audio_id],
+        "ops": [{"pos": rng.randint(0, 40), "delete": 0, "insert": " "}],
+    })
+    if response is None:
+        return
+    if response.status_code == 200:
+        clinic.versions[audio_id] = response.json()["version"]
+    elif response.status_code == 409:
+        clinic.versions[audio_id] = response.json()["current_version"]
+
+
+async def upload(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    user_id = rng.choice(clinic.user_ids)
+    appointment_id = rng.choice(clinic.schedule[user_id])
+    response = await rec.request(
+        client, "POST /transcribe", "POST", "/transcribe",
+        data={"appointment_id": str(appointment_id), "user_id": str(user_id), "room": "Room 1"},
+        files={"file": ("consultation.wav", clinic.wav, "audio/wav")},
+    )
+    if response is not None and response.status_code == 200:
+        clinic.uploaded.append(response.json()["audio_id"])
+
+
+async def bulk(client, rec: Recorder, clinic: Clinic, rng: random.Random):
+    user_id = rng.choice(clinic.user_ids)
+    batch = rng.randint(0, 10_000)
+    await rec.request(client, "POST /appointments/bulk", "POST", "/appointments/bulk", json={
+        "user_id": user_id,
+        "appointments": [{
+            "patientName": f"Imported {batch}-{i}",
+            "date": clinic.day,
+            "time": f"{8 + i // 60 % 10:02d}:{i % 60:02d}:00",
+            "meetingType": "GP",
+        } for i in range(200)],
+    })
+
+
+SCENARIOS = {
+    "card_status": card_status,
+    "batch_status": batch_status,
+    "job_status": job_status,
+    "schedule": schedule,
+    "transcript": transcript,
+    "edit": edit,
+    "upload": upload,
+    "bulk": bulk,
+}
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ----------------------------- setup ---------------------------------------
+
+def seed_transcripts(store: fake_supabase.FakePostgrest, schedule_by_user: Dict[int, List[int]], dirs: Dict[str, str],
+                     per_user: int, day: str) -> List[Dict[str, Any]]:
+    """Finished consultations: metadata + transcript on disk, matching DB rows."""
+    seeded = []
+    for user_id, appointment_ids in schedule_by_user.items():
+        for appointment_id in appointment_ids[:per_user]:
+            audio_id = f"{user_id}_GP_bench-{appointment_id}"
+            metadata = {
+                "audio_id": audio_id,
+                "status": "completed",
+                "appointment_id": appointment_id,
+                "user_id": user_id,
+                "meeting_type": "gp",
+                "appointment_time": f"{day}T09:00:00Z",
+                "created_at": datetime.now().isoformat(),
+            }
+            with open(os.path.join(dirs["JSON_FILES_DIR"], f"{audio_id}.json"), "w") as f:
+                json.dump(metadata, f)
+            with open(os.path.join(dirs["TRANSCRIPTION_FILES_DIR"], f"{audio_id}.txt"), "w") as f:
+                f.write(fake_transcript(600))
+            store.seed("audio_recordings", [{
+                "audio_id": audio_id, "user_id": user_id, "appointment_id": appointment_id,
+                "status": "transcribed", "upload_time": datetime.now().isoformat(),
+            }])
+            store.seed("transcriptions", [{"audio_id": audio_id, "transcribed_at": datetime.now().isoformat()}])
+            seeded.append(metadata)
+    return seeded
+
+
+def run_stubs(conn, dirs: Dict[str, str], day: str, options: Dict[str, Any]) -> None:
+    """Child process: seed and serve the fake Supabase and model until told to stop."""
+    store = fake_supabase.FakePostgrest()
+    schedule_by_user = fake_supabase.seed_clinic(store, options["users"], options["appointments_per_user"], day)
+    transcripts = seed_transcripts(store, schedule_by_user, dirs, options["transcripts_per_user"], day)
+    supabase_server = fake_supabase.serve(store)
+    model_server = fake_model.serve(fake_model.FakeModel(options["model_latency"], options["model_rtf"]))
+    conn.send({
+        "supabase_port": supabase_server.server_port,
+        "model_port": model_server.server_port,
+        "schedule": schedule_by_user,
+        "transcripts": transcripts,
+    })
+    conn.recv()
+    conn.send(store.request_count)
+
+
+def start_backend(env: Dict[str, str], port: int, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve_backend", "--port", str(port)],
+        cwd=str(BACKEND_DIR), env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def run_load(base_url: str, clinic: Clinic, mix: Dict[str, float], concurrency: int,
+                   duration: float, warmup: float, think: float, seed: int) -> Recorder:
+    rec = Recorder()
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def virtual_user(n: int, until: float):
+            rng = random.Random(seed * 1000 + n)
+            while time.monotonic() < until:
+                await SCENARIOS[rng.choices(names, weights)[0]](client, rec, clinic, rng)
+                if think:
+                    await asyncio.sleep(rng.expovariate(1 / think))
+
+        if warmup > 0:
+            rec.enabled = False
+            until = time.monotonic() + warmup
+            await asyncio.gather(*(virtual_user(n, until) for n in range(concurrency)))
+            rec.enabled = True
+
+        await client.get("/__bench/loop-lag", params={"reset": "true"})
+        until = time.monotonic() + duration
+        await asyncio.gather(*(virtual_user(n, until) for n in range(concurrency)))
+    return rec
+
+
+def build_report(rec: Recorder, duration: float, lag: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+    routes = {}
+    for route, values in sorted(rec.latencies.items()):
+        stats = summarize(values)
+        routes[route] = {
+            "requests": stats["count"],
+            "rps": stats["count"] / duration,
+            "p50_ms": stats["p50"] * 1000,
+            "p95_ms": stats["p95"] * 1000,
+            "p99_ms": stats["p99"] * 1000,
+            "max_ms": stats["max"] * 1000,
+            "errors": rec.errors.get(route, 0),
+            "statuses": {str(k): v for k, v in sorted(rec.statuses[route].items())},
+        }
+    everything = [v for values in rec.latencies.values() for v in values]
+    total = summarize(everything)
+    return {
+        "config": config,
+        "routes": routes,
+        "total": {
+            "requests": total["count"],
+            "rps": total["count"] / duration,
+            "p50_ms": total["p50"] * 1000,
+            "p95_ms": total["p95"] * 1000,
+            "p99_ms": total["p99"] * 1000,
+            "errors": sum(rec.errors.values()),
+        },
+        "loop_lag_ms": lag.get("lag_ms", {}),
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    headers = ["route", "req", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors", "statuses"]
+    rows = []
+    for route, r in report["routes"].items():
+        statuses = " ".join(f"{k}:{v}" for k, v in r["statuses"].items())
+        rows.append([route, r["requests"], r["rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"], r["errors"], statuses])
+    t = report["total"]
+    rows.append(["TOTAL", t["requests"], t["rps"], t["p50_ms"], t["p95_ms"], t["p99_ms"], t["errors"], ""])
+    print(format_table(headers, rows))
+
+    lag = report["loop_lag_ms"]
+    if lag:
+        print(f"\nEvent-loop lag: p50 {lag['p50']:.2f} ms  p95 {lag['p95']:.2f} ms  "
+              f"p99 {lag['p99']:.2f} ms  max {lag['max']:.2f} ms")
+
+    if baseline:
+        print("\nChange vs baseline (req/s, p95):")
+        rows = []
+        for route, r in list(report["routes"].items()) + [("TOTAL", report["total"])]:
+            before = baseline["total"] if route == "TOTAL" else baseline["routes"].get(route)
+            if not before:
+                continue
+            rows.append([
+                route,
+                f"{before['rps']:.1f} -> {r['rps']:.1f} ({(r['rps'] / before['rps'] - 1) * 100 if before['rps'] else 0:+.0f}%)",
+                f"{before['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms",
+            ])
+        print(format_table(["route", "req/s", "p95"], rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds first")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a user's requests (s)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,... from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=20, help="seeded clinicians")
+    parser.add_argument("--appointments-per-user", type=int, default=40)
+    parser.add_argument("--transcripts-per-user", type=int, default=10)
+    parser.add_argument("--model-latency", type=float, default=0.5)
+    parser.add_argument("--model-rtf", type=float, default=0.0)
+    parser.add_argument("--with-queue", action="store_true", help="also run the queue processor (needs ffmpeg)")
+    parser.add_argument("--backend-url", help="use an already running backend instead of starting one")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the backend")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the temp storage directory")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    day = date.today().isoformat()
+    workdir = tempfile.mkdtemp(prefix="cliniscribe-bench-")
+    dirs = {
+        "AUDIO_FILES_DIR": os.path.join(workdir, "audio_files"),
+        "JSON_FILES_DIR": os.path.join(workdir, "json_files"),
+        "TRANSCRIPTION_FILES_DIR": os.path.join(workdir, "transcription_files"),
+    }
+    for path in dirs.values():
+        os.makedirs(path)
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    stubs = multiprocessing.Process(target=run_stubs, args=(child_conn, dirs, day, vars(args)), daemon=True)
+    stubs.start()
+    seeded = parent_conn.recv()
+    schedule_by_user = seeded["schedule"]
+
+    processes = []
+    base_url = args.backend_url
+    try:
+        if not base_url:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            env = dict(os.environ)
+            env.update(dirs)
+            env.update({
+                "SUPABASE_URL": f"http://127.0.0.1:{seeded['supabase_port']}",
+                "SUPABASE_ANON_KEY": fake_supabase.FAKE_KEY,
+                "MODEL_API_URL": f"http://127.0.0.1:{seeded['model_port']}",
+                "BACKEND_API_URL": base_url,
+                "JOB_EVENTS_TOKEN": secrets.token_hex(16),
+                "DATA_BACKEND": "supabase",
+                "PYTHONUNBUFFERED": "1",
+            })
+            for item in args.env:
+                key, _, value = item.partition("=")
+                env[key] = value
+            processes.append(start_backend(env, port, os.path.join(workdir, "backend.log")))
+            wait_for_http(f"{base_url}/__bench/loop-lag")
+            if args.with_queue:
+                processes.append(subprocess.Popen(
+                    [sys.executable, "queue_processor.py"], cwd=str(BACKEND_DIR), env=env,
+                    stdout=open(os.path.join(workdir, "queue.log"), "w"), stderr=subprocess.STDOUT,
+                ))
+
+        clinic = Clinic(schedule_by_user, seeded["transcripts"], day)
+        print(f"Driving {base_url} with {args.concurrency} users for {args.duration:.0f}s "
+              f"(+{args.warmup:.0f}s warm-up); mix: {args.mix}")
+        rec = asyncio.run(run_load(
+            base_url, clinic, mix, args.concurrency, args.duration, args.warmup, args.think, args.seed,
+        ))
+        try:
+            lag = httpx.get(f"{base_url}/__bench/loop-lag", timeout=10).json()
+        except Exception:
+            lag = {}
+
+        config = {k: v for k, v in vars(args).items() if k not in ("output", "compare", "keep")}
+        report = build_report(rec, args.duration, lag, config)
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print()
+        print_report(report, baseline)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.output}")
+    finally:
+        for process in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        parent_conn.send("stop")
+        if parent_conn.poll(10):
+            print(f"Fake Supabase served {parent_conn.recv()} requests")
+        stubs.terminate()
+        if args.keep:
+            print(f"Storage and logs kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# benchmarks/pipeline.py
+"""
+End-to-end pipeline benchmark: how many consultation-hours per hour does a
+deployment process, and which stage holds it back?
+
+For each worker count in --workers it starts from empty storage and:
+  1. generates --jobs synthetic WAV consultations (durations drawn from
+     --min-minutes..--max-minutes)
+  2. starts the fake Supabase + fake model (service time = latency + rtf *
+     audio seconds, --model-capacity requests at once), the backend and the
+     queue processor with QUEUE_WORKERS=<n>
+  3. uploads every file through POST /transcribe at once
+  4. waits until every job has finished and reads the stage timings the queue
+     processor stores in each job's metadata
+
+and reports throughput, queue-wait distribution and the time split per stage
+(enqueue = upload request, dequeue = wait in the queue, conversion, model,
+DB writes). Needs ffmpeg for the conversion stage, like production. Run from
+the backend directory:
+
+    python -m benchmarks.pipeline --jobs 12 --workers 1,2,4 --model-rtf 0.05
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks import fake_model, fake_supabase
+from benchmarks.common import format_table, free_port, summarize, wait_for_http, write_wav
+from benchmarks.load_test import BACKEND_DIR, start_backend
+
+STAGES = ["enqueue", "queue_wait", "conversion", "conversion_wait", "model", "db"]
+
+
+def run_stubs(conn, jobs: int, day: str, latency: float, rtf: float, capacity: int) -> None:
+    """Child process: one clinician with a slot per job, plus the fake model."""
+    store = fake_supabase.FakePostgrest()
+    schedule = fake_supabase.seed_clinic(store, 1, jobs, day)
+    model = fake_model.FakeModel(latency, rtf, capacity)
+    supabase_server = fake_supabase.serve(store)
+    model_server = fake_model.serve(model)
+    conn.send({
+        "supabase_port": supabase_server.server_port,
+        "model_port": model_server.server_port,
+        "schedule": schedule,
+    })
+    conn.recv()
+    conn.send({"model_busy_s": model.busy_seconds, "model_served": model.served})
+
+
+def run_queue_processor(conn, env: Dict[str, str]) -> None:
+    """Child process: queue_processor.process_queue until told to stop."""
+    os.environ.update(env)
+    sys.path.insert(0, str(BACKEND_DIR))
+    log = open(os.path.join(env["BENCH_WORKDIR"], "queue.log"), "w")
+    sys.stdout = log
+    sys.stderr = log
+    import queue_processor
+
+    stop = threading.Event()
+    thread = threading.Thread(target=queue_processor.process_queue, args=(stop,), daemon=True)
+    thread.start()
+    conn.recv()
+    stop.set()
+    thread.join(timeout=60)
+    conn.send("stopped")
+
+
+def generate_audio(directory: str, count: int, min_minutes: float, max_minutes: float, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    files = []
+    for n in range(count):
+        seconds = round(rng.uniform(min_minutes, max_minutes) * 60, 1)
+        path = os.path.join(directory, f"consultation-{n:03d}.wav")
+        write_wav(path, seconds)
+        files.append({"path": path, "seconds": seconds})
+    return files
+
+
+def wait_for_jobs(json_dir: str, audio_ids: List[str], timeout: float) -> Dict[str, Dict[str, Any]]:
+    """Poll metadata until every job is finished (timings written) or errored."""
+    deadline = time.monotonic() + timeout
+    done: Dict[str, Dict[str, Any]] = {}
+    while time.monotonic() < deadline and len(done) < len(audio_ids):
+        for audio_id in audio_ids:
+            if audio_id in done:
+                continue
+            try:
+                with open(os.path.join(json_dir, f"{audio_id}.json")) as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if metadata.get("status") == "error" or (metadata.get("status") == "completed" and "timings" in metadata):
+                done[audio_id] = metadata
+        time.sleep(0.2)
+    return done
+
+
+def run_once(args, workers: int, audio: List[Dict[str, Any]]) -> Dict[str, Any]:
+    day = date.today().isoformat()
+    workdir = tempfile.mkdtemp(prefix="cliniscribe-pipeline-")
+    dirs = {
+        "AUDIO_FILES_DIR": os.path.join(workdir, "audio_files"),
+        "JSON_FILES_DIR": os.path.join(workdir, "json_files"),
+        "TRANSCRIPTION_FILES_DIR": os.path.join(workdir, "transcription_files"),
+    }
+    for path in dirs.values():
+        os.makedirs(path)
+
+    ctx = multiprocessing.get_context("spawn")
+    stubs_conn, stubs_child = ctx.Pipe()
+    stubs = ctx.Process(
+        target=run_stubs,
+        args=(stubs_child, len(audio), day, args.model_latency, args.model_rtf, args.model_capacity),
+        daemon=True,
+    )
+    stubs.start()
+    seeded = stubs_conn.recv()
+    user_id, appointment_ids = next(iter(seeded["schedule"].items()))
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ)
+    env.update(dirs)
+    env.update({
+        "SUPABASE_URL": f"http://127.0.0.1:{seeded['supabase_port']}",
+        "SUPABASE_ANON_KEY": fake_supabase.FAKE_KEY,
+        "MODEL_API_URL": f"http://127.0.0.1:{seeded['model_port']}",
+        "BACKEND_API_URL": base_url,
+        "JOB_EVENTS_TOKEN": secrets.token_hex(16),
+        "DATA_BACKEND": "supabase",
+        "QUEUE_WORKERS": str(workers),
+        "QUEUE_POLL_SECONDS": str(args.poll),
+        "PYTHONUNBUFFERED": "1",
+        "BENCH_WORKDIR": workdir,
+    })
+    backend = start_backend(env, port, os.path.join(workdir, "backend.log"))
+    queue_conn, queue_child = ctx.Pipe()
+    queue = ctx.Process(target=run_queue_processor, args=(queue_child, env), daemon=True)
+
+    try:
+        wait_for_http(f"{base_url}/__bench/loop-lag")
+        queue.start()
+
+        session = requests.Session()
+
+        def upload(job):
+            item, appointment_id = job
+            started = time.monotonic()
+            with open(item["path"], "rb") as f:
+                response = session.post(f"{base_url}/transcribe", data={
+                    "appointment_id": str(appointment_id), "user_id": str(user_id), "room": "Room 1",
+                }, files={"file": (os.path.basename(item["path"]), f, "audio/wav")}, timeout=600)
+            response.raise_for_status()
+            return response.json()["audio_id"], time.monotonic() - started, item["seconds"]
+
+        wall_started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(16, len(audio))) as pool:
+            uploads = list(pool.map(upload, zip(audio, appointment_ids)))
+        enqueue = {audio_id: elapsed for audio_id, elapsed, _ in uploads}
+        seconds = {audio_id: s for audio_id, _, s in uploads}
+
+        finished = wait_for_jobs(dirs["JSON_FILES_DIR"], list(enqueue), args.timeout)
+        wall = time.monotonic() - wall_started
+    finally:
+        if queue.is_alive():
+            queue_conn.send("stop")
+            if queue_conn.poll(90):
+                queue_conn.recv()
+            queue.terminate()
+        backend.terminate()
+        try:
+            backend.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            backend.kill()
+        stubs_conn.send("stop")
+        model_stats = stubs_conn.recv() if stubs_conn.poll(10) else {}
+        stubs.terminate()
+        if args.keep:
+            print(f"  storage and logs kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    completed = {a: m for a, m in finished.items() if m.get("status") == "completed"}
+    stage_values: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    for audio_id, metadata in finished.items():
+        timings = metadata.get("timings") or {}
+        stage_values["enqueue"].append(enqueue[audio_id])
+        for stage in STAGES[1:]:
+            if f"{stage}_s" in timings:
+                stage_values[stage].append(timings[f"{stage}_s"])
+
+    audio_hours = sum(seconds[a] for a in completed) / 3600.0
+    return {
+        "workers": workers,
+        "jobs": len(enqueue),
+        "completed": len(completed),
+        "errors": len(finished) - len(completed),
+        "unfinished": len(enqueue) - len(finished),
+        "wall_s": wall,
+        "audio_hours": audio_hours,
+        "consultation_hours_per_hour": audio_hours / (wall / 3600.0) if wall else 0.0,
+        "stages": {stage: summarize(values) for stage, values in stage_values.items()},
+        "model_utilisation": (model_stats.get("model_busy_s", 0.0) / (wall * args.model_capacity)) if wall else 0.0,
+    }
+
+
+def print_run(result: Dict[str, Any]) -> None:
+    print(f"\n== {result['workers']} worker(s): {result['completed']}/{result['jobs']} completed, "
+          f"{result['errors']} errors, {result['unfinished']} unfinished in {result['wall_s']:.1f}s")
+    print(f"   throughput {result['consultation_hours_per_hour']:.2f} consultation-hours/hour "
+          f"({result['audio_hours']:.2f} h of audio), model busy {result['model_utilisation'] * 100:.0f}%")
+    rows = []
+    busiest = max(STAGES, key=lambda s: result["stages"][s]["mean"] * result["stages"][s]["count"])
+    for stage in STAGES:
+        st = result["stages"][stage]
+        rows.append([
+            stage + (" *" if stage == busiest else ""),
+            st["count"], st["mean"], st["p50"], st["p95"], st["max"],
+        ])
+    print(format_table(["stage (s)", "n", "mean", "p50", "p95", "max"], rows))
+    print("   * largest share of job time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=12)
+    parser.add_argument("--min-minutes", type=float, default=1.0)
+    parser.add_argument("--max-minutes", type=float, default=5.0)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated QUEUE_WORKERS values to compare")
+    parser.add_argument("--model-latency", type=float, default=0.5, help="fixed model seconds per job")
+    parser.add_argument("--model-rtf", type=float, default=0.05, help="model seconds per second of audio")
+    parser.add_argument("--model-capacity", type=int, default=1, help="jobs the model serves at once")
+    parser.add_argument("--poll", type=float, default=1.0, help="QUEUE_POLL_SECONDS for the queue processor")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="give up waiting after this many seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write all results as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep temp storage and logs")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("ffmpeg is required for the conversion stage")
+
+    audio_dir = tempfile.mkdtemp(prefix="cliniscribe-audio-")
+    try:
+        audio = generate_audio(audio_dir, args.jobs, args.min_minutes, args.max_minutes, args.seed)
+        total_minutes = sum(a["seconds"] for a in audio) / 60
+        print(f"Generated {len(audio)} consultations, {total_minutes:.1f} minutes of audio "
+              f"(model: {args.model_latency}s + {args.model_rtf} x duration, capacity {args.model_capacity})")
+
+        results = []
+        for workers in [int(w) for w in args.workers.split(",")]:
+            print(f"\nRunning with QUEUE_WORKERS={workers} ...  ({datetime.now():%H:%M:%S})")
+            result = run_once(args, workers, audio)
+            print_run(result)
+            results.append(result)
+
+        if len(results) > 1:
+            print("\nScaling:")
+            base = results[0]["consultation_hours_per_hour"] or 1.0
+            print(format_table(
+                ["workers", "cons-h/h", "speed-up", "queue wait p95 s", "model busy %"],
+                [[r["workers"], r["consultation_hours_per_hour"], f"{r['consultation_hours_per_hour'] / base:.2f}x",
+                  r["stages"]["queue_wait"]["p95"], r["model_utilisation"] * 100] for r in results],
+            ))
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"config": vars(args), "results": results}, f, indent=2)
+            print(f"\nResults written to {args.output}")
+    finally:
+        shutil.rmtree(audio_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/serve_backend.py
+"""
+Run backend/main.py under uvicorn with an event-loop lag sampler attached.
+
+The sampler sleeps LAG_INTERVAL seconds in a loop and records how late it
+wakes up; anything that blocks the loop (sync I/O in a handler, a big JSON
+encode) shows up as lag. GET /__bench/loop-lag returns the percentiles and,
+with ?reset=1, starts a fresh window. Run from the backend directory:
+
+    python -m benchmarks.serve_backend --port 8000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.common import summarize  # noqa: E402
+from main import app  # noqa: E402
+
+LAG_INTERVAL = 0.01
+
+_lag_samples = []
+
+
+async def _sample_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        _lag_samples.append(max(loop.time() - started - LAG_INTERVAL, 0.0))
+
+
+@app.on_event("startup")
+async def _start_lag_sampler():
+    asyncio.create_task(_sample_loop_lag())
+
+
+@app.get("/__bench/loop-lag")
+async def loop_lag(reset: bool = False):
+    samples = list(_lag_samples)
+    if reset:
+        _lag_samples.clear()
+    stats = {k: (v * 1000 if k != "count" else v) for k, v in summarize(samples).items()}
+    return {"interval_ms": LAG_INTERVAL * 1000, "lag_ms": stats, "at": time.time()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
@@ -0,0 +1,58 @@
+# benchmarks/stream_check.py
+"""
+Check that model_runner.stream_audio delivers large files intact when the
+connection has a timeout, as every queue-processor job's does (the deadline,
+see job_deadlines.py). A timeout makes the socket non-blocking underneath, so
+the sendfile path has to wait for buffer space instead of failing once the
+kernel send buffer is full.
+
+Streams a WAV and a feature-bundle-sized file of tens of MB to the fake model,
+which stalls before reading and verifies each body's X-Audio-SHA256.
+
+    python -m benchmarks.stream_check --megabytes 64
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import write_wav
+from benchmarks.fake_model import FakeModel, serve
+from model_runner import stream_audio
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=64, help="size of each file streamed")
+    parser.add_argument("--timeout", type=float, default=30, help="socket timeout for the upload")
+    parser.add_argument("--stall", type=float, default=1.0, help="seconds the fake model waits before reading")
+    args = parser.parse_args()
+
+    server = serve(FakeModel(latency=0.0, stall_seconds=args.stall))
+    model_url = f"http://127.0.0.1:{server.server_port}"
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = os.path.join(tmp, "check.wav")
+        with open(wav_path, "wb") as f:
+            write_wav(f, args.megabytes * 1024 * 1024 / 32000.0)
+        features_path = os.path.join(tmp, "check.feat")
+        with open(features_path, "wb") as f:
+            f.write(os.urandom(int(args.megabytes * 1024 * 1024)))
+
+        for path, route in ((wav_path, "/transcribe-stream"), (features_path, "/transcribe-features")):
+            started = time.monotonic()
+            try:
+                status, body = stream_audio(model_url, path, {}, route=route, timeout=args.timeout)
+            except Exception as e:
+                status, body = None, f"{type(e).__name__}: {e}"
+            ok = status == 200
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {route:22} {os.path.getsize(path) / 1e6:7.1f} MB "
+                  f"in {time.monotonic() - started:5.2f}s -> {status} {'' if ok else body[:200]}")
+    server.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# cache.py
+"""
+In-process TTL + LRU cache for lookups that rarely change during a clinic
+session (appointments, users).
+
+Concurrent misses for the same key are coalesced: one caller runs the loader
+and everyone else waits for its result. Use get_or_load from worker threads
+and get_or_load_async from the event loop.
+
+Empty results (None, []) are never stored, so a lookup that failed or found
+nothing is retried next time instead of being pinned for the whole TTL.
+
+Users and appointment rows are never updated or deleted through this
+service, only inserted (bulk import), so user_cache and appointment_cache
+rely on the TTL alone; edits made directly in Supabase show up within
+CACHE_TTL_SECONDS. Imports drop the importing user's cached schedules.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float = CACHE_TTL_SECONDS, maxsize: int = CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._inflight_async: Dict[Hashable, asyncio.Future] = {}
+        # Bumped on every invalidation; a load that started before an
+        # invalidation must not store its (possibly stale) result
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key: Hashable, value: Any, generation: int) -> None:
+        if not value or generation != self._generation:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value or run loader() once for all concurrent callers."""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                generation = self._generation
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, value, generation)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of get_or_load; must be called from the event loop."""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+        future = self._inflight_async.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_async[key] = future
+        generation = self._generation
+        try:
+            value = await loader()
+        except BaseException as e:
+            self._inflight_async.pop(key, None)
+            future.set_exception(e)
+            # Nobody else may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+
+        with self._lock:
+            self._store(key, value, generation)
+        self._inflight_async.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value, self._generation)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# Shared caches
+user_cache = TTLCache("users")
+appointment_cache = TTLCache("appointments")
+schedule_cache = TTLCache("schedules")
+
+
+def invalidate_user_appointments(user_id: int) -> None:
+    """Drop every cached schedule for a user (after imports or other appointment writes)."""
+    user_id = int(user_id)
+    schedule_cache.invalidate_where(lambda key: key[0] == user_id)
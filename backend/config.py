@@ -9,5 +9,6 @@ TRANSCRIPTION_FILES_DIR = os.getenv("TRANSCRIPTION_FILES_DIR", "/home/arifqawi/s
 # Note: Directories should be created manually on the server or by Docker volume mounts
 # No automatic directory creation as these are external to the container
 
-# Database connection (you can add this if needed later)
-# DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://...")
\ No newline at end of file
+# Data access for hot read endpoints: "supabase" (PostgREST over HTTP) or
+# "postgres" (direct asyncpg pool, see database.py for connection settings)
+DATA_BACKEND = os.getenv("DATA_BACKEND", "supabase").lower()
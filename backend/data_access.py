@@ -0,0 +1,173 @@
+# data_access.py
+"""
+Async read helpers used by the hot read endpoints.
+
+DATA_BACKEND=postgres routes these through the asyncpg pool in database.py.
+Otherwise they use the PostgREST helpers in supabase_client.py, run in the
+threadpool so the blocking HTTP call doesn't hold up the event loop.
+
+Appointment details and schedules are served from the in-process TTL cache
+(cache.py); write paths must call the matching invalidate_* helper.
+"""
+import asyncio
+import base64
+import os
+from datetime import date, time
+from typing import Dict, Any, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from config import DATA_BACKEND
+from cache import appointment_cache, schedule_cache
+import supabase_client
+
+USE_POSTGRES = DATA_BACKEND == "postgres"
+
+# Load today's schedule for every clinician with appointments into the cache at startup
+CACHE_PREWARM = os.getenv("CACHE_PREWARM", "1") == "1"
+# Page size the dashboard requests for a day's imported appointments
+# (src/hooks/useImportedAppointments.ts); limit is part of the cache key, so
+# the prewarm has to use the same value for its entries to be hit
+DASHBOARD_PAGE_SIZE = 500
+
+if USE_POSTGRES:
+    import database
+
+
+async def startup() -> None:
+    if USE_POSTGRES:
+        await database.init_pool()
+        print("Data access: direct Postgres (asyncpg pool)")
+    else:
+        print("Data access: Supabase PostgREST")
+    if CACHE_PREWARM:
+        asyncio.create_task(prewarm_schedules())
+
+async def shutdown() -> None:
+    if USE_POSTGRES:
+        await database.close_pool()
+
+async def fetch_appointment_by_id(appointment_id: int) -> Optional[Dict[str, Any]]:
+    async def load():
+        if USE_POSTGRES:
+            return await database.get_appointment_by_id(appointment_id)
+        return await run_in_threadpool(supabase_client.get_appointment_by_id, appointment_id)
+    return await appointment_cache.get_or_load_async(('details', int(appointment_id)), load)
+
+def encode_cursor(appointment: Dict[str, Any]) -> str:
+    """Opaque keyset cursor pointing just past `appointment`."""
+    key = f"{appointment['date']}|{appointment['time']}|{appointment['id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        day, at, appointment_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        date.fromisoformat(day)
+        time.fromisoformat(at)
+        return day, at, int(appointment_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+async def fetch_appointments_page(
+    user_id: int,
+    is_dummy: bool = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    One page of a user's appointments in (date, time, id) order, restricted to
+    an inclusive date window. Returns {"appointments", "next_cursor"}; without
+    a limit the whole window comes back and next_cursor is None.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells us whether another page exists
+    fetch_limit = limit + 1 if limit is not None else None
+
+    async def load():
+        if USE_POSTGRES:
+            return await database.get_appointments_by_user(
+                user_id,
+                is_dummy,
+                date.fromisoformat(date_from) if date_from else None,
+                date.fromisoformat(date_to) if date_to else None,
+                (date.fromisoformat(after[0]), time.fromisoformat(after[1]), after[2]) if after else None,
+                fetch_limit,
+            )
+        return await run_in_threadpool(
+            supabase_client.get_appointments_by_user, user_id, is_dummy, date_from, date_to, after, fetch_limit
+        )
+
+    rows = await schedule_cache.get_or_load_async(
+        (int(user_id), is_dummy, date_from, date_to, cursor, limit), load
+    )
+    if limit is not None and len(rows) > limit:
+        return {"appointments": rows[:limit], "next_cursor": encode_cursor(rows[limit - 1])}
+    return {"appointments": rows, "next_cursor": None}
+
+async def fetch_audio_recording_by_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
+    if USE_POSTGRES:
+        return await database.get_audio_recording_by_appointment(appointment_id)
+    return await run_in_threadpool(supabase_client.get_audio_recording_by_appointment, appointment_id)
+
+async def fetch_transcription_by_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
+    if USE_POSTGRES:
+        return await database.get_transcription_by_appointment(appointment_id)
+    return await run_in_threadpool(supabase_client.get_transcription_by_appointment, appointment_id)
+
+
+def appointment_status(audio_status: Optional[str], transcribed: bool) -> str:
+    """
+    High-level status for an appointment:
+      - "Transcribed" if a transcription row exists
+      - "Transcribing" if latest audio is queued/processing
+      - "Not started" otherwise
+    """
+    if transcribed:
+        return "Transcribed"
+    if audio_status in ("processing", "queued"):
+        return "Transcribing"
+    return "Not started"
+
+async def fetch_appointment_statuses(
+    appointment_ids: Optional[List[int]] = None,
+    user_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Dict[int, str]:
+    """Resolve the status of many appointments with one set-based query."""
+    if USE_POSTGRES:
+        rows = await database.get_appointment_status_rows(
+            appointment_ids,
+            user_id,
+            date.fromisoformat(date_from) if date_from else None,
+            date.fromisoformat(date_to) if date_to else None,
+        )
+    else:
+        rows = await run_in_threadpool(
+            supabase_client.get_appointment_status_rows, appointment_ids, user_id, date_from, date_to
+        )
+    return {row['appointment_id']: appointment_status(row['audio_status'], row['transcribed']) for row in rows}
+
+async def prewarm_schedules(day: Optional[str] = None) -> None:
+    """Fill the schedule cache for every clinician with appointments on `day` (default today)."""
+    day = day or date.today().isoformat()
+    try:
+        if USE_POSTGRES:
+            user_ids = await database.get_user_ids_with_appointments_on(date.fromisoformat(day))
+        else:
+            user_ids = await run_in_threadpool(supabase_client.get_user_ids_with_appointments_on, day)
+        for user_id in user_ids:
+            # What the dashboard asks for: the day's imported appointments and the dummy list
+            await fetch_appointments_page(user_id, False, day, day, limit=DASHBOARD_PAGE_SIZE)
+            await fetch_appointments_page(user_id, True)
+        print(f"Pre-warmed appointment cache for {len(user_ids)} clinicians on {day}")
+    except Exception as e:
+        print(f"Failed to pre-warm appointment cache: {e}")
+
+async def insert_appointments(rows: List[Dict[str, Any]]) -> int:
+    """Insert a chunk of appointments with ON CONFLICT DO NOTHING; returns the inserted count."""
+    if USE_POSTGRES:
+        return await database.insert_appointments(rows)
+    return await run_in_threadpool(supabase_client.insert_appointments, rows)
@@ -1,6 +1,7 @@
-import psycopg2
+import asyncpg
 import os
-from typing import Dict, Any, List, Optional
+from datetime import date, time
+from typing import Dict, Any, List, Optional, Tuple
 
 # Database connection parameters
 DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
@@ -9,120 +10,237 @@ DB_NAME = os.getenv("POSTGRES_DB", "postgres")
 DB_USER = os.getenv("POSTGRES_USER", "postgres")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 
-def get_db_connection():
-    """Get a database connection"""
-    return psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
+# Pool sizing: concurrent queries scale with max size, not with the event loop
+DB_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10"))
+
+_pool: Optional[asyncpg.Pool] = None
+
+# Hot read queries. asyncpg prepares each statement once per pooled connection
+# and keeps it in the connection's statement cache, so repeated calls skip
+# parse/plan and only send bind + execute.
+APPOINTMENT_BY_ID_SQL = """
+    SELECT a.appointment_id, a.patient_name, a.room,
+           a.appointment_date, a.appointment_time, a.user_id,
+           u.first_name, u.last_name
+    FROM appointments a
+    JOIN users u ON a.user_id = u.user_id
+    WHERE a.appointment_id = $1
+"""
+
+APPOINTMENTS_BY_USER_SQL = """
+    SELECT a.appointment_id, a.patient_name, a.room,
+           a.appointment_date, a.appointment_time,
+           u.first_name, u.last_name
+    FROM appointments a
+    JOIN users u ON a.user_id = u.user_id
+    WHERE a.user_id = $1
+      AND ($2::boolean IS NULL OR a.is_dummy = $2)
+      AND ($3::date IS NULL OR a.appointment_date >= $3)
+      AND ($4::date IS NULL OR a.appointment_date <= $4)
+      AND ($5::date IS NULL
+           OR (a.appointment_date, a.appointment_time, a.appointment_id) > ($5, $6::time, $7::int))
+    ORDER BY a.appointment_date, a.appointment_time, a.appointment_id
+    LIMIT $8
+"""
+
+AUDIO_BY_APPOINTMENT_SQL = """
+    SELECT audio_id, status, filename
+    FROM audio_recordings
+    WHERE appointment_id = $1
+    ORDER BY upload_time DESC
+    LIMIT 1
+"""
+
+TRANSCRIPTION_BY_APPOINTMENT_SQL = """
+    SELECT t.transcription_id, t.transcript_filename, t.metadata_filename
+    FROM transcriptions t
+    JOIN audio_recordings ar ON t.audio_id = ar.audio_id
+    WHERE ar.appointment_id = $1
+    ORDER BY t.transcribed_at DESC
+    LIMIT 1
+"""
+
+APPOINTMENT_STATUS_ROWS_SQL = """
+    SELECT a.appointment_id,
+           latest.status AS audio_status,
+           EXISTS (
+               SELECT 1
+               FROM transcriptions t
+               JOIN audio_recordings ar ON t.audio_id = ar.audio_id
+               WHERE ar.appointment_id = a.appointment_id
+           ) AS transcribed
+    FROM appointments a
+    LEFT JOIN LATERAL (
+        SELECT status
+        FROM audio_recordings
+        WHERE appointment_id = a.appointment_id
+        ORDER BY upload_time DESC
+        LIMIT 1
+    ) latest ON true
+    WHERE ($1::int[] IS NULL OR a.appointment_id = ANY($1::int[]))
+      AND ($2::int IS NULL OR a.user_id = $2)
+      AND ($3::date IS NULL OR a.appointment_date >= $3)
+      AND ($4::date IS NULL OR a.appointment_date <= $4)
+"""
+
+USERS_WITH_APPOINTMENTS_ON_SQL = """
+    SELECT DISTINCT user_id
+    FROM appointments
+    WHERE appointment_date = $1
+"""
+
+# One statement per chunk: the rows travel as parallel arrays and duplicates
+# are skipped by the unique constraint instead of failing the batch
+INSERT_APPOINTMENTS_SQL = """
+    INSERT INTO appointments
+        (user_id, patient_name, room, appointment_date, appointment_time, is_dummy, meeting_type)
+    SELECT * FROM unnest($1::int[], $2::text[], $3::text[], $4::date[], $5::time[], $6::boolean[], $7::text[])
+    ON CONFLICT DO NOTHING
+    RETURNING appointment_id
+"""
+
 
-def get_appointment_by_id(appointment_id: int) -> Optional[Dict[str, Any]]:
+async def init_pool() -> asyncpg.Pool:
+    """Create the connection pool (call once at startup)"""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            host=DB_HOST,
+            port=int(DB_PORT),
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+        )
+    return _pool
+
+async def close_pool() -> None:
+    """Close the connection pool (call once at shutdown)"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+def get_pool() -> asyncpg.Pool:
+    """Get the running pool"""
+    if _pool is None:
+        raise RuntimeError("Postgres pool not initialised; call init_pool() first")
+    return _pool
+
+async def get_appointment_by_id(appointment_id: int) -> Optional[Dict[str, Any]]:
     """Get appointment details by ID"""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT a.appointment_id, a.patient_name, a.room, 
-                           a.appointment_date, a.appointment_time, a.user_id,
-                           u.first_name, u.last_name
-                    FROM appointments a
-                    JOIN users u ON a.user_id = u.user_id
-                    WHERE a.appointment_id = %s
-                """, (appointment_id,))
-                
-                row = cur.fetchone()
-                if row:
-                    return {
-                        'appointment_id': row[0],
-                        'patient_name': row[1],
-                        'room': row[2],
-                        'appointment_date': row[3].strftime('%Y-%m-%d'),
-                        'appointment_time': str(row[4]),
-                        'user_id': row[5],
-                        'doctor_name': f"Dr. {row[6]} {row[7]}",  # Derived from users table
-                        'doctor_first_name': row[6],
-                        'doctor_last_name': row[7]
-                    }
+        row = await get_pool().fetchrow(APPOINTMENT_BY_ID_SQL, appointment_id)
+        if row:
+            return {
+                'appointment_id': row['appointment_id'],
+                'patient_name': row['patient_name'],
+                'room': row['room'],
+                'appointment_date': row['appointment_date'].strftime('%Y-%m-%d'),
+                'appointment_time': str(row['appointment_time']),
+                'user_id': row['user_id'],
+                'doctor_name': f"Dr. {row['first_name']} {row['last_name']}",  # Derived from users table
+                'doctor_first_name': row['first_name'],
+                'doctor_last_name': row['last_name']
+            }
     except Exception as e:
         print(f"Database error: {e}")
     return None
 
-def get_appointments_by_user(user_id: int) -> List[Dict[str, Any]]:
-    """Get all appointments for a specific user"""
+async def get_appointments_by_user(
+    user_id: int,
+    is_dummy: bool = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    after: Optional[Tuple[date, time, int]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Get appointments for a specific user in (date, time, id) order, optionally
+    filtered by is_dummy and an inclusive date window. `after` is the
+    (date, time, appointment_id) of the last row already seen (keyset cursor).
+    """
+    after_date, after_time, after_id = after or (None, None, None)
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT a.appointment_id, a.patient_name, a.room, 
-                           a.appointment_date, a.appointment_time,
-                           u.first_name, u.last_name
-                    FROM appointments a
-                    JOIN users u ON a.user_id = u.user_id
-                    WHERE a.user_id = %s
-                    ORDER BY a.appointment_date, a.appointment_time
-                """, (user_id,))
-                
-                rows = cur.fetchall()
-                return [{
-                    'id': str(row[0]),
-                    'patientName': row[1],
-                    'room': row[2],
-                    'date': row[3].strftime('%Y-%m-%d'),
-                    'time': str(row[4]),
-                    'doctorName': f"Dr. {row[5]} {row[6]}"  # Derived from users table
-                } for row in rows]
+        rows = await get_pool().fetch(
+            APPOINTMENTS_BY_USER_SQL,
+            user_id, is_dummy, date_from, date_to, after_date, after_time, after_id, limit,
+        )
+        return [{
+            'id': str(row['appointment_id']),
+            'patientName': row['patient_name'],
+            'doctorName': f"Dr. {row['first_name']} {row['last_name']}",  # Derived from users table
+            'room': row['room'],
+            'date': row['appointment_date'].strftime('%Y-%m-%d'),
+            'time': str(row['appointment_time'])
+        } for row in rows]
     except Exception as e:
         print(f"Database error: {e}")
     return []
 
-def get_audio_recording_by_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
+async def get_audio_recording_by_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
     """Get audio recording for an appointment"""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT audio_id, status, filename
-                    FROM audio_recordings
-                    WHERE appointment_id = %s
-                    ORDER BY upload_time DESC
-                    LIMIT 1
-                """, (appointment_id,))
-                
-                row = cur.fetchone()
-                if row:
-                    return {
-                        'audio_id': row[0],
-                        'status': row[1],
-                        'filename': row[2]
-                    }
+        row = await get_pool().fetchrow(AUDIO_BY_APPOINTMENT_SQL, appointment_id)
+        if row:
+            return {
+                'audio_id': row['audio_id'],
+                'status': row['status'],
+                'filename': row['filename']
+            }
     except Exception as e:
         print(f"Database error: {e}")
     return None
 
-def get_transcription_by_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
+async def get_transcription_by_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
     """Get transcription for an appointment"""
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT t.transcription_id, t.transcript_filename, t.metadata_filename
-                    FROM transcriptions t
-                    JOIN audio_recordings ar ON t.audio_id = ar.audio_id
-                    WHERE ar.appointment_id = %s
-                    ORDER BY t.transcribed_at DESC
-                    LIMIT 1
-                """, (appointment_id,))
-                
-                row = cur.fetchone()
-                if row:
-                    return {
-                        'transcription_id': row[0],
-                        'transcript_filename': row[1],
-                        'metadata_filename': row[2]
-                    }
+        row = await get_pool().fetchrow(TRANSCRIPTION_BY_APPOINTMENT_SQL, appointment_id)
+        if row:
+            return {
+                'transcription_id': row['transcription_id'],
+                'transcript_filename': row['transcript_filename'],
+                'metadata_filename': row['metadata_filename']
+            }
     except Exception as e:
         print(f"Database error: {e}")
-    return None
\ No newline at end of file
+    return None
+
+async def get_appointment_status_rows(
+    appointment_ids: Optional[List[int]] = None,
+    user_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """Get latest audio status and transcription presence for many appointments in one query"""
+    rows = await get_pool().fetch(
+        APPOINTMENT_STATUS_ROWS_SQL, appointment_ids or None, user_id, date_from, date_to
+    )
+    return [{
+        'appointment_id': row['appointment_id'],
+        'audio_status': row['audio_status'],
+        'transcribed': row['transcribed'],
+    } for row in rows]
+
+async def get_user_ids_with_appointments_on(day: date) -> List[int]:
+    """Get the ids of users with at least one appointment on the given date"""
+    rows = await get_pool().fetch(USERS_WITH_APPOINTMENTS_ON_SQL, day)
+    return sorted(row['user_id'] for row in rows)
+
+async def insert_appointments(rows: List[Dict[str, Any]]) -> int:
+    """Insert many appointments in one statement, skipping duplicates. Returns the inserted count."""
+    if not rows:
+        return 0
+    inserted = await get_pool().fetch(
+        INSERT_APPOINTMENTS_SQL,
+        [int(r['user_id']) for r in rows],
+        [r['patient_name'] for r in rows],
+        [r['room'] for r in rows],
+        [date.fromisoformat(str(r['appointment_date'])) for r in rows],
+        [time.fromisoformat(str(r['appointment_time'])) for r in rows],
+        [bool(r['is_dummy']) for r in rows],
+        [r['meeting_type'] for r in rows],
+    )
+    return len(inserted)
@@ -0,0 +1,61 @@
+# http_caching.py
+"""HTTP helpers: conditional GET handling and response compression."""
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional; fall back to gzip only
+    BrotliMiddleware = None
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+def _strip_weak(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+def is_not_modified(headers, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    True if the client's cached copy is current (RFC 7232).
+    If-None-Match takes precedence over If-Modified-Since; ETags use weak comparison.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        target = _strip_weak(etag)
+        return any(_strip_weak(tag) == target for tag in if_none_match.split(","))
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class CompressionMiddleware:
+    """
+    Brotli (if installed) or gzip response compression, negotiated from
+    Accept-Encoding. Streaming endpoints such as SSE are passed through
+    uncompressed so events are flushed as they happen.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, excluded_paths: Iterable[str] = ()):
+        self.app = app
+        self.excluded_paths = set(excluded_paths)
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in self.excluded_paths:
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,58 @@
+# job_cancellation.py
+"""
+Cancelling transcription jobs, on request or because a newer recording of the
+same appointment supersedes them.
+
+A queued job is cancelled outright: its status becomes "cancelled", which the
+queue processor skips, and its audio is removed. A job that is already
+processing is marked the same way, and the model services are told to stop it
+by the token the queue processor sent with it (model_runner.cancel_model_job).
+The model checks for cancellation at every chunk boundary, so the endpoint's
+slot frees up within seconds rather than at the end of the recording.
+
+Status changes go through utils.transition_metadata_json, so a job finishing
+at the same moment ends up either completed or cancelled, never both.
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from model_runner import cancel_model_job
+from supabase_client import get_supabase_client
+from utils import discard_audio, transition_metadata_json
+
+CANCELLABLE_STATUSES = ("queued", "processing")
+
+
+def cancel_job(audio_id: str, reason: str, superseded_by: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Cancel a queued or processing job. Returns its metadata from before the
+    cancellation, or None if it doesn't exist or has already finished.
+    """
+    updates = {
+        "status": "cancelled",
+        "cancelled_at": datetime.now().isoformat(),
+        "cancel_reason": reason,
+    }
+    if superseded_by:
+        updates["superseded_by"] = superseded_by
+    previous = transition_metadata_json(audio_id, CANCELLABLE_STATUSES, updates)
+    if previous is None:
+        return None
+    print(f"[{datetime.now()}] Cancelled {previous['status']} job {audio_id} ({reason})")
+
+    if previous["status"] == "queued":
+        discard_audio(audio_id)
+    elif previous.get("model_job_token"):
+        # The queue processor removes the audio once the model call returns
+        cancel_model_job(previous["model_job_token"])
+
+    try:
+        supabase = get_supabase_client()
+        supabase.table("audio_recordings") \
+            .update({"status": "cancelled"}) \
+            .eq("audio_id", audio_id) \
+            .execute()
+    except Exception as db_error:
+        print(f"[{datetime.now()}] Failed to update database status to cancelled: {db_error}")
+
+    return previous
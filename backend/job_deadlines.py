@@ -0,0 +1,147 @@
+# job_deadlines.py
+"""
+Deadlines for model jobs, retries when they are missed, and recovery of jobs
+left in "processing".
+
+Each job gets a deadline when the queue processor starts it: its audio
+duration times the rolling real-time factor (admission.py) times
+JOB_DEADLINE_RTF_MULTIPLIER, clamped to [JOB_DEADLINE_MIN_SECONDS,
+JOB_DEADLINE_MAX_SECONDS]. run_model sends it to the model service, which
+stops the job at its next chunk boundary once it has passed (504), and also
+uses it as the HTTP timeout, so a hung model call can't hold a worker forever.
+
+A job that misses its deadline goes back to "queued" with a retry_at
+JOB_RETRY_BACKOFF_SECONDS later (doubling per attempt, up to
+JOB_RETRY_BACKOFF_MAX_SECONDS); after JOB_MAX_ATTEMPTS attempts it fails.
+
+The watchdog (recover_stuck_jobs, run by the queue processor) requeues the
+same way jobs that are "processing" without a worker on them: claimed by an
+earlier run of the queue processor that crashed or was restarted, or past
+their deadline by more than WATCHDOG_GRACE_SECONDS.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from admission import estimator
+from job_events import publish_job_event
+from model_runner import cancel_model_job
+from supabase_client import get_supabase_client
+from utils import load_metadata_json, transition_metadata_json
+
+JOB_DEADLINE_RTF_MULTIPLIER = float(os.getenv("JOB_DEADLINE_RTF_MULTIPLIER", "3"))
+JOB_DEADLINE_MIN_SECONDS = float(os.getenv("JOB_DEADLINE_MIN_SECONDS", "300"))
+JOB_DEADLINE_MAX_SECONDS = float(os.getenv("JOB_DEADLINE_MAX_SECONDS", "14400"))
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "60"))
+JOB_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_MAX_SECONDS", "1800"))
+
+WATCHDOG_INTERVAL_SECONDS = float(os.getenv("WATCHDOG_INTERVAL_SECONDS", "60"))
+WATCHDOG_GRACE_SECONDS = float(os.getenv("WATCHDOG_GRACE_SECONDS", "120"))
+
+
+def deadline_seconds(duration_s: Optional[float]) -> float:
+    """Time a job of this many seconds of audio gets on the model."""
+    expected = (duration_s or 0.0) * estimator.rtf()
+    return min(max(expected * JOB_DEADLINE_RTF_MULTIPLIER, JOB_DEADLINE_MIN_SECONDS), JOB_DEADLINE_MAX_SECONDS)
+
+
+def retry_delay(attempt: int) -> float:
+    """Backoff before the retry that follows attempt number `attempt` (1-based)."""
+    return min(JOB_RETRY_BACKOFF_SECONDS * 2 ** max(attempt - 1, 0), JOB_RETRY_BACKOFF_MAX_SECONDS)
+
+
+def is_due(metadata: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """Whether a queued job's retry backoff (if any) is over."""
+    retry_at = metadata.get("retry_at")
+    if not retry_at:
+        return True
+    try:
+        return datetime.fromisoformat(retry_at) <= (now or datetime.now())
+    except (TypeError, ValueError):
+        return True
+
+
+def requeue_or_fail(audio_id: str, reason: str) -> Optional[str]:
+    """
+    Put a processing job back in the queue after a backoff, or mark it failed
+    once it has had JOB_MAX_ATTEMPTS attempts. Returns the new status, or None
+    if the job was no longer processing (e.g. cancelled meanwhile).
+    """
+    now = datetime.now()
+    # Counted by the queue processor each time it claims the job
+    attempts = int(load_metadata_json(audio_id).get("attempts") or 1)
+
+    if attempts >= JOB_MAX_ATTEMPTS:
+        status = "error"
+        updates = {"status": status, "error": f"{reason} (after {attempts} attempts)", "error_at": now.isoformat()}
+    else:
+        status = "queued"
+        updates = {
+            "status": status,
+            "last_error": reason,
+            "retry_at": (now + timedelta(seconds=retry_delay(attempts))).isoformat(),
+            "processing_started_at": None,
+            "model_job_token": None,
+            "deadline_at": None,
+        }
+    previous = transition_metadata_json(audio_id, ("processing",), updates)
+    if previous is None:
+        return None
+
+    if status == "queued":
+        print(f"[{datetime.now()}] Requeued {audio_id} (attempt {attempts} of {JOB_MAX_ATTEMPTS}: {reason}), "
+              f"retrying in {retry_delay(attempts):.0f}s")
+    else:
+        print(f"[{datetime.now()}] ✗ Giving up on {audio_id} after {attempts} attempts: {reason}")
+    publish_job_event(audio_id, status, previous.get("user_id"), error=updates.get("error"))
+
+    try:
+        supabase = get_supabase_client()
+        supabase.table("audio_recordings") \
+            .update({"status": status}) \
+            .eq("audio_id", audio_id) \
+            .execute()
+    except Exception as db_error:
+        print(f"[{datetime.now()}] Failed to update database status to {status}: {db_error}")
+    return status
+
+
+def _stuck_reason(metadata: Dict[str, Any], process_started_at: datetime, now: datetime) -> Optional[str]:
+    try:
+        started = datetime.fromisoformat(metadata["processing_started_at"])
+    except (KeyError, TypeError, ValueError):
+        return "processing with no start time"
+    if started < process_started_at:
+        return "queue processor restarted while processing"
+    try:
+        deadline_at = datetime.fromisoformat(metadata["deadline_at"])
+    except (KeyError, TypeError, ValueError):
+        deadline_at = started + timedelta(seconds=JOB_DEADLINE_MAX_SECONDS)
+    if now > deadline_at + timedelta(seconds=WATCHDOG_GRACE_SECONDS):
+        return "processing past its deadline"
+    return None
+
+
+def recover_stuck_jobs(processing: Iterable[Tuple[str, Dict[str, Any]]], in_flight: Set[str],
+                       process_started_at: datetime) -> List[str]:
+    """
+    Requeue (or fail) processing jobs that no worker of this queue processor
+    is running and that are orphaned or overdue. Returns their audio_ids.
+    """
+    now = datetime.now()
+    recovered = []
+    for audio_id, metadata in processing:
+        if audio_id in in_flight:
+            continue
+        reason = _stuck_reason(metadata, process_started_at, now)
+        if reason is None:
+            continue
+        print(f"[{datetime.now()}] Watchdog: {audio_id} is stuck ({reason})")
+        if metadata.get("model_job_token"):
+            # The model may still be working on it for nobody
+            cancel_model_job(metadata["model_job_token"])
+        if requeue_or_fail(audio_id, reason) is not None:
+            recovered.append(audio_id)
+    return recovered
@@ -0,0 +1,166 @@
+# job_events.py
+"""
+Push channel for transcription job status.
+
+The queue processor runs as its own service, so it reports each status
+transition to the backend over HTTP (publish_job_event). The backend fans
+those events out to Server-Sent Events subscribers through JobEventBroker,
+with one stream per user covering all of that user's in-flight recordings.
+
+Every event gets an id, "<epoch>-<sequence>", where the epoch changes when
+the backend restarts. The broker keeps the last SSE_REPLAY_EVENTS events (at
+most SSE_REPLAY_SECONDS old), so a client reconnecting with Last-Event-ID gets
+exactly what it missed. A client that is further behind, or new, gets a
+snapshot: its in-flight jobs plus those that finished within that window.
+"""
+import asyncio
+import hmac
+import os
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, Any, List, Optional, Set, Tuple
+
+import requests
+
+BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://localhost:8000")
+# Shared secret between queue processor and backend; both refuse to start without it
+JOB_EVENTS_TOKEN = os.getenv("JOB_EVENTS_TOKEN")
+
+IN_FLIGHT_STATUSES = ("queued", "processing")
+
+SSE_REPLAY_EVENTS = int(os.getenv("SSE_REPLAY_EVENTS", "500"))
+SSE_REPLAY_SECONDS = float(os.getenv("SSE_REPLAY_SECONDS", "600"))
+
+_session = requests.Session()
+
+
+class JobEventBroker:
+    """In-process fan-out of job events to per-user subscriber queues."""
+
+    def __init__(self, queue_size: int = 100, replay_events: int = SSE_REPLAY_EVENTS,
+                 replay_seconds: float = SSE_REPLAY_SECONDS):
+        self._queue_size = queue_size
+        self._replay_seconds = replay_seconds
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        # (sequence, event) of every in-flight job's last event, for snapshots
+        self._in_flight: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        # (sequence, published at, event) of recent events of all users, for Last-Event-ID
+        self._history: Deque[Tuple[int, float, Dict[str, Any]]] = deque(maxlen=replay_events)
+        self._epoch = f"{int(time.time() * 1000):x}"
+        self._seq = 0
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self._epoch}-{seq}"
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self._replay_seconds
+        while self._history and self._history[0][1] < cutoff:
+            self._history.popleft()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[user_id]
+
+    def snapshot(self, user_id: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        (event id, event) for the latest event of each of the user's jobs that
+        is in flight or finished within the replay window, oldest first.
+        """
+        self._prune()
+        latest: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        for seq, _, event in self._history:
+            if event.get("user_id") == user_id:
+                latest[event["audio_id"]] = (seq, event)
+        for audio_id, (seq, event) in self._in_flight.items():
+            if event.get("user_id") == user_id:
+                latest[audio_id] = (seq, event)
+        return [(self._event_id(seq), event) for seq, event in sorted(latest.values(), key=lambda e: e[0])]
+
+    def replay(self, user_id: int, last_event_id: str) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """
+        (event id, event) for the user's events published after last_event_id,
+        or None if they can't all be replayed: the id is from an earlier
+        backend process, or events after it have left the history.
+        """
+        epoch, _, seq = (last_event_id or "").partition("-")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        self._prune()
+        oldest = self._history[0][0] if self._history else self._seq + 1
+        if int(seq) < oldest - 1:
+            return None
+        return [
+            (self._event_id(s), event) for s, _, event in self._history
+            if s > int(seq) and event.get("user_id") == user_id
+        ]
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Deliver an event to the job owner's subscribers. Call from the event loop."""
+        self._seq += 1
+        seq = self._seq
+        audio_id = event["audio_id"]
+        if event.get("status") in IN_FLIGHT_STATUSES:
+            self._in_flight[audio_id] = (seq, event)
+        else:
+            self._in_flight.pop(audio_id, None)
+        self._history.append((seq, time.monotonic(), event))
+
+        for queue in list(self._subscribers.get(event.get("user_id"), ())):
+            if queue.full():
+                # Slow consumer: drop its oldest event rather than block everyone
+                queue.get_nowait()
+            queue.put_nowait((self._event_id(seq), event))
+
+
+broker = JobEventBroker()
+
+
+def require_job_events_token() -> None:
+    """
+    Fail fast when JOB_EVENTS_TOKEN is unset. Job events set job status and
+    reach clinicians' streams, so the backend must never accept them anonymously.
+    """
+    if not JOB_EVENTS_TOKEN:
+        raise RuntimeError("JOB_EVENTS_TOKEN must be set (the same secret for the backend and queue processor)")
+
+
+def job_events_token_valid(token: Optional[str]) -> bool:
+    return bool(JOB_EVENTS_TOKEN) and token is not None and hmac.compare_digest(token, JOB_EVENTS_TOKEN)
+
+
+def build_job_event(audio_id: str, status: str, user_id: Optional[int], **extra) -> Dict[str, Any]:
+    event = {
+        "audio_id": audio_id,
+        "status": status,
+        "user_id": int(user_id) if user_id is not None else None,
+        "at": datetime.now().isoformat(),
+    }
+    event.update(extra)
+    return event
+
+def publish_job_event(audio_id: str, status: str, user_id: Optional[int], **extra) -> None:
+    """
+    Report a status transition from the queue processor to the backend.
+
+    Best effort: a missed event only delays the UI until the next reconnect,
+    so failures are logged and swallowed.
+    """
+    try:
+        _session.post(
+            f"{BACKEND_API_URL}/internal/job-events",
+            json=build_job_event(audio_id, status, user_id, **extra),
+            headers={"X-Job-Events-Token": JOB_EVENTS_TOKEN or ""},
+            timeout=5,
+        )
+    except Exception as e:
+        print(f"[{datetime.now()}] Failed to publish job event for {audio_id}: {e}")
@@ -0,0 +1,168 @@
+# job_index.py
+"""
+In-memory index of transcription jobs, so /health and /queue/status never
+have to glob and parse every metadata file.
+
+The index is built with one directory scan at startup and then kept current
+incrementally: metadata writes in this process notify it through
+utils.add_metadata_listener, and the queue processor's status transitions
+arrive as job events. A slow periodic rescan repairs anything missed (for
+example, events lost while the backend was restarting).
+"""
+import glob
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import JSON_FILES_DIR
+
+JOB_INDEX_RECONCILE_SECONDS = float(os.getenv("JOB_INDEX_RECONCILE_SECONDS", "300"))
+
+SUMMARY_FIELDS = (
+    "status", "created_at", "appointment_id", "user_id", "appointment_time", "error", "upload_key",
+    # Used for completion-time estimates (admission.py)
+    "duration_s", "lane", "processing_started_at",
+)
+
+
+class JobIndex:
+    def __init__(self, json_dir: str = JSON_FILES_DIR):
+        self.json_dir = json_dir
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        # apply()/remove() calls made while a rebuild is scanning; replayed over
+        # its result so the swap doesn't roll them back. None when not scanning.
+        self._pending: Optional[List[Tuple[str, Optional[Dict[str, Any]]]]] = None
+        self.last_rebuild_at: Optional[str] = None
+
+    @staticmethod
+    def _summary(audio_id: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        job = {"audio_id": audio_id}
+        for field in SUMMARY_FIELDS:
+            if metadata.get(field) is not None:
+                job[field] = metadata[field]
+        job.setdefault("status", "unknown")
+        return job
+
+    @classmethod
+    def _merge(cls, jobs: Dict[str, Dict[str, Any]], audio_id: str, updates: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        """Merge updates into jobs[audio_id]; returns (old status or None if new, new status)."""
+        job = jobs.get(audio_id)
+        if job is None:
+            job = cls._summary(audio_id, updates)
+            jobs[audio_id] = job
+            return None, job["status"]
+        old_status = job["status"]
+        for field in SUMMARY_FIELDS:
+            if field not in updates:
+                continue
+            if updates[field] is None:
+                job.pop(field, None)
+            else:
+                job[field] = updates[field]
+        job.setdefault("status", old_status)
+        return old_status, job["status"]
+
+    def _uncount(self, status: str) -> None:
+        self._counts[status] -= 1
+        if self._counts[status] <= 0:
+            del self._counts[status]
+
+    def rebuild(self) -> None:
+        """Rescan every metadata file. Only used at startup and for reconciliation."""
+        with self._rebuild_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                jobs: Dict[str, Dict[str, Any]] = {}
+                for json_file in glob.glob(os.path.join(self.json_dir, "*.json")):
+                    audio_id = os.path.basename(json_file)[:-len(".json")]
+                    try:
+                        with open(json_file, "r") as f:
+                            jobs[audio_id] = self._summary(audio_id, json.load(f))
+                    except Exception as e:
+                        jobs[audio_id] = {
+                            "audio_id": audio_id,
+                            "status": "error",
+                            "error": f"Failed to read metadata: {str(e)}",
+                        }
+                with self._lock:
+                    # A file may have been read before a change that was applied
+                    # during the scan; replaying in order ends on the latest state
+                    for audio_id, updates in self._pending:
+                        if updates is None:
+                            jobs.pop(audio_id, None)
+                        else:
+                            self._merge(jobs, audio_id, updates)
+                    self._jobs = jobs
+                    self._counts = Counter(job["status"] for job in jobs.values())
+                    self.last_rebuild_at = datetime.now().isoformat()
+            finally:
+                with self._lock:
+                    self._pending = None
+
+    def apply(self, audio_id: str, updates: Dict[str, Any]) -> None:
+        """
+        Merge a metadata write or status event into the index. Fields missing
+        from updates are left alone; fields set to None are cleared.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((audio_id, dict(updates)))
+            old_status, new_status = self._merge(self._jobs, audio_id, updates)
+            if old_status != new_status:
+                if old_status is not None:
+                    self._uncount(old_status)
+                self._counts[new_status] += 1
+
+    def remove(self, audio_id: str) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((audio_id, None))
+            job = self._jobs.pop(audio_id, None)
+            if job is not None:
+                self._uncount(job["status"])
+
+    def get(self, audio_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(audio_id)
+            return dict(job) if job else None
+
+    def count(self, status: str) -> int:
+        with self._lock:
+            return self._counts.get(status, 0)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def query(
+        self,
+        status: Optional[str] = None,
+        user_id: Optional[int] = None,
+        date: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+        appointment_id: Optional[int] = None,
+        upload_key: Optional[str] = None,
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Filter jobs (date matches the created_at day, YYYY-MM-DD), newest first."""
+        with self._lock:
+            jobs = [
+                dict(job) for job in self._jobs.values()
+                if (status is None or job["status"] == status)
+                and (user_id is None or job.get("user_id") == user_id)
+                and (date is None or str(job.get("created_at", "")).startswith(date))
+                and (appointment_id is None or job.get("appointment_id") == appointment_id)
+                and (upload_key is None or job.get("upload_key") == upload_key)
+            ]
+        jobs.sort(key=lambda job: str(job.get("created_at") or ""), reverse=True)
+        return len(jobs), jobs[offset:offset + limit]
+
+
+job_index = JobIndex()
@@ -1,27 +1,72 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from utils import (
-    convert_to_wav_16k,
+    UPLOAD_CHUNK_SIZE,
+    spool_upload,
     save_metadata_json,
     load_metadata_json,
     update_metadata_json,
-    load_transcript,
     save_transcript,
+    probe_duration_seconds,
+    _wav_path,
+    add_metadata_listener,
+    add_transcript_listener,
 )
 from config import AUDIO_FILES_DIR, JSON_FILES_DIR, TRANSCRIPTION_FILES_DIR
 from supabase_client import (
-    get_appointment_by_id,
-    get_appointments_by_user,
-    get_audio_recording_by_appointment,
-    get_transcription_by_appointment,
     get_supabase_client,
+    get_appointment_row,
+    get_user_row,
+    begin_request_scope,
+    end_request_scope,
 )
+from data_access import (
+    fetch_appointment_by_id,
+    fetch_appointments_page,
+    fetch_audio_recording_by_appointment,
+    fetch_appointment_statuses,
+    insert_appointments,
+)
+import data_access
+from cache import invalidate_user_appointments
+from job_events import broker, build_job_event, job_events_token_valid, require_job_events_token
+from job_index import job_index, JOB_INDEX_RECONCILE_SECONDS
+from transcript_cache import transcript_cache
+from search_index import search_index
+from transcript_store import apply_patch, replace_text, EditConflict, InvalidEdit
+from upload_sessions import (
+    Appender,
+    OffsetMismatch,
+    UploadBusy,
+    UploadFinished,
+    UploadNotFound,
+    UploadTooLarge,
+    create_upload,
+    find_upload,
+    finish_upload,
+    get_upload,
+)
+from job_cancellation import CANCELLABLE_STATUSES, cancel_job
+from admission import ETA_REFRESH_SECONDS, NORMAL_LANE, AdmissionRejected, estimate_job, estimator, fallback_duration
+from http_caching import CompressionMiddleware, is_not_modified, http_date
+from tracing import current_traceparent, span
 import os
-from datetime import datetime
-import glob
+from datetime import date, datetime
+import asyncio
+import csv
 import json
+import uuid
 
-app = FastAPI()
+# orjson is much faster on large payloads such as /appointments/user/{user_id}
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultJSONResponse
+
+app = FastAPI(default_response_class=DefaultJSONResponse)
 
 # Allow requests from frontend (Vite dev server)
 app.add_middleware(
@@ -29,8 +74,231 @@ app.add_middleware(
     allow_origins=["*"],  # TODO: lock this down in production
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Location", "Upload-Offset", "Upload-Length"],
 )
 
+app.add_middleware(CompressionMiddleware, minimum_size=1024, excluded_paths=["/transcribe/events"])
+
+async def reconcile_job_index():
+    """Periodically rescan metadata to repair anything the incremental updates missed."""
+    while True:
+        await asyncio.sleep(JOB_INDEX_RECONCILE_SECONDS)
+        try:
+            await run_in_threadpool(job_index.rebuild)
+        except Exception as e:
+            print(f"Job index reconcile failed: {e}")
+
+async def refresh_estimates():
+    """Recompute the real-time factor behind completion estimates; estimates only read it."""
+    while True:
+        try:
+            await run_in_threadpool(estimator.refresh)
+        except Exception as e:
+            print(f"Real-time factor refresh failed: {e}")
+        await asyncio.sleep(ETA_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def on_startup():
+    require_job_events_token()
+    await data_access.startup()
+    await run_in_threadpool(job_index.rebuild)
+    add_metadata_listener(job_index.apply)
+    add_transcript_listener(search_index.index_transcript)
+    asyncio.create_task(reconcile_job_index())
+    asyncio.create_task(refresh_estimates())
+    asyncio.create_task(backfill_search_index())
+
+async def backfill_search_index():
+    try:
+        added = await run_in_threadpool(search_index.backfill)
+        if added:
+            print(f"[{datetime.now()}] Indexed {added} transcripts for search")
+    except Exception as e:
+        print(f"[{datetime.now()}] Search index backfill failed: {e}")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await data_access.shutdown()
+
+@app.middleware("http")
+async def request_query_scope(request: Request, call_next):
+    """Give each request its own memo so repeated DB lookups run once."""
+    token = begin_request_scope()
+    try:
+        return await call_next(request)
+    finally:
+        end_request_scope(token)
+
+def _new_recording(appointment_id: str, user_id: str, room: str, original_filename: str,
+                   profile: str = None) -> dict:
+    """
+    Look up the appointment and user and build the queued job's metadata, audio_id included.
+    Blocking on a cache miss; call from a worker thread.
+    `profile` overrides the model pipeline profile, which otherwise follows the meeting type.
+    """
+    appt_row = get_appointment_row(int(appointment_id))
+
+    if not appt_row:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+
+    appt_date = appt_row["appointment_date"]
+    appt_time = appt_row["appointment_time"]
+    location = appt_row.get("room") or room
+    meeting_type = (appt_row.get("meeting_type") or "gp").lower()
+
+    role = (get_user_row(int(user_id)) or {}).get("role")
+
+    # Generate audio_ID from the appointment slot, plus a random suffix so a
+    # re-recording of the same appointment gets its own files instead of
+    # overwriting a job that may still be queued or running
+    dt = datetime.strptime(f"{appt_date} {appt_time}", "%Y-%m-%d %H:%M:%S")
+    timestamp = dt.strftime('%Y-%m-%dT%H-%M-%S-') + "000Z"
+    audio_id = f"{user_id}_{meeting_type.upper()}_{timestamp}_{uuid.uuid4().hex[:8]}"
+
+    metadata = {
+        "audio_id": audio_id,
+        "status": "queued",
+        "appointment_id": int(appointment_id),
+        "user_id": int(user_id),
+        "location": location,
+        "role": role,
+        "appointment_time": f"{appt_date}T{appt_time}Z",
+        "no_of_speakers": 2,
+        "meeting_type": meeting_type,
+        "original_filename": original_filename,
+    }
+    if profile:
+        metadata["profile"] = profile.lower()
+    return metadata
+
+def _existing_upload(user_id: str, upload_key: str) -> dict:
+    """The job a retried upload with this Idempotency-Key already created, if any."""
+    if not upload_key:
+        return None
+    _, jobs = job_index.query(user_id=int(user_id), upload_key=upload_key, limit=1)
+    if not jobs:
+        return None
+    return {
+        "audio_id": jobs[0]["audio_id"],
+        "status": jobs[0]["status"],
+        "message": "Audio already uploaded with this Idempotency-Key",
+        "estimate": estimate_job(jobs[0]),
+    }
+
+def _finished_upload(audio_id: str) -> dict:
+    """The job a resumable upload already became, for a repeated create or finalise."""
+    job = job_index.get(audio_id) or {"audio_id": audio_id, "status": "queued"}
+    return {
+        "audio_id": audio_id,
+        "status": job["status"],
+        "message": "Upload already completed",
+        "estimate": estimate_job(job),
+    }
+
+def _admit() -> str:
+    """Lane for a new upload (admission.py), or 429 with Retry-After when the queue is too long."""
+    try:
+        return estimator.admit()
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Transcription queue is full: {e}",
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+
+def _audio_duration(raw_path: str) -> float:
+    """Length of the raw upload in seconds, or a guess from its size. Blocking."""
+    return probe_duration_seconds(raw_path) or fallback_duration(os.path.getsize(raw_path))
+
+def _cancel_older_jobs(metadata: dict) -> list:
+    """
+    Cancel the appointment's earlier recordings that are still queued or
+    processing. Blocking (model services, metadata locks, DB); returns
+    (audio_id, previous metadata) of each job cancelled.
+    """
+    cancelled = []
+    _, jobs = job_index.query(appointment_id=metadata["appointment_id"], limit=1000)
+    for job in jobs:
+        if job["audio_id"] == metadata["audio_id"] or job["status"] not in CANCELLABLE_STATUSES:
+            continue
+        previous = cancel_job(job["audio_id"], "superseded", superseded_by=metadata["audio_id"])
+        if previous is not None:
+            cancelled.append((job["audio_id"], previous))
+    return cancelled
+
+async def _supersede_older_jobs(metadata: dict) -> None:
+    for audio_id, previous in await run_in_threadpool(_cancel_older_jobs, metadata):
+        broker.publish(build_job_event(
+            audio_id, "cancelled", previous.get("user_id"), superseded_by=metadata["audio_id"],
+        ))
+
+def _record_job(metadata: dict) -> None:
+    """
+    Write the job's metadata JSON and its audio_recordings row. Blocking.
+    The row points at the 16 kHz WAV the queue processor converts the raw
+    upload to, which is the file that stays (the upload is removed).
+    """
+    audio_id = metadata["audio_id"]
+    save_metadata_json(audio_id, metadata)
+
+    # Insert into DB
+    try:
+        with span("db.insert audio_recordings", audio_id=audio_id):
+            supabase = get_supabase_client()
+            supabase.table("audio_recordings").insert({
+                "audio_id": audio_id,
+                "user_id": metadata["user_id"],
+                "appointment_id": metadata["appointment_id"],
+                "filename": metadata["original_filename"],
+                "file_path": _wav_path(audio_id),
+                "status": "queued",
+                "meeting_type": metadata["meeting_type"],
+                "upload_time": datetime.now().isoformat()
+            }).execute()
+    except Exception as db_error:
+        print(f"Failed to insert into database: {db_error}")
+
+async def _enqueue_recording(metadata: dict, manual_tags: str = None, upload_key: str = None,
+                             lane: str = NORMAL_LANE, duration_s: float = None) -> dict:
+    """
+    Queue a recording whose raw upload is already spooled: metadata JSON,
+    DB row, job event. Earlier recordings of the same appointment still waiting
+    or running are cancelled, as this one replaces them. The response carries
+    the completion-time estimate. The blocking parts run in the threadpool, so
+    a re-upload never holds up the event loop (SSE, health checks).
+    """
+    audio_id = metadata["audio_id"]
+    metadata["created_at"] = datetime.now().isoformat()
+    metadata["lane"] = lane
+    # The queue processor and model service continue this trace (tracing.py)
+    metadata["traceparent"] = current_traceparent()
+    if duration_s:
+        metadata["duration_s"] = round(duration_s, 1)
+    if upload_key:
+        metadata["upload_key"] = upload_key
+    if manual_tags:
+        try:
+            metadata["manual_tags"] = json.loads(manual_tags)
+        except Exception as e:
+            print(f"Failed to parse manual_tags: {e}")
+
+    await run_in_threadpool(_record_job, metadata)
+
+    try:
+        await _supersede_older_jobs(metadata)
+    except Exception as e:
+        print(f"Failed to supersede earlier recordings of appointment {metadata['appointment_id']}: {e}")
+
+    estimate = estimate_job(metadata)
+    broker.publish(build_job_event(audio_id, "queued", metadata["user_id"], estimate=estimate))
+
+    return {
+        "audio_id": audio_id,
+        "status": "queued",
+        "message": "Audio uploaded successfully, transcription queued",
+        "estimate": estimate,
+    }
+
 @app.post("/transcribe")
 async def transcribe(
     file: UploadFile = File(...),
@@ -38,80 +306,37 @@ async def transcribe(
     user_id: str = Form(...),
     room: str = Form(...),
     appointment_time: str = Form(None), 
-    manual_tags: str = Form(None)
+    manual_tags: str = Form(None),
+    profile: str = Form(None),
+    idempotency_key: str = Header(None),
+    traceparent: str = Header(None),
 ):
+    """
+    Queue a recording for transcription. A client retrying an upload it may
+    already have delivered sends the same Idempotency-Key and gets the original
+    job back instead of a duplicate. The job's trace continues the caller's
+    traceparent, if it sends one.
+    """
     try:
-        # Get appointment info from Supabase
-        supabase = get_supabase_client()
-        appt_res = supabase.table("appointments") \
-            .select("appointment_date, appointment_time, room, meeting_type") \
-            .eq("appointment_id", int(appointment_id)) \
-            .single() \
-            .execute()
-
-        if not appt_res.data:
-            raise HTTPException(status_code=404, detail="Appointment not found")
+        existing = _existing_upload(user_id, idempotency_key)
+        if existing:
+            return existing
 
-        appt_date = appt_res.data["appointment_date"]
-        appt_time = appt_res.data["appointment_time"]
-        location = appt_res.data.get("room") or room
-        meeting_type = (appt_res.data.get("meeting_type") or "gp").lower()
-
-        role_res = supabase.table("users") \
-            .select("role") \
-            .eq("user_id", int(user_id)) \
-            .single() \
-            .execute()
-        role = (role_res.data or {}).get("role")
-
-        # Generate audio_ID and convert to 16kHz WAV
-        dt = datetime.strptime(f"{appt_date} {appt_time}", "%Y-%m-%d %H:%M:%S")
-        timestamp = dt.strftime('%Y-%m-%dT%H-%M-%S-') + "000Z"
-        audio_id = f"{user_id}_{meeting_type.upper()}_{timestamp}"
-        original_filename = file.filename or "audio.wav"
-        converted_path = convert_to_wav_16k(file, audio_id)
-       
-        # Build metadata and save JSON
-        metadata = {
-            "audio_id": audio_id,
-            "status": "queued",
-            "appointment_id": int(appointment_id),
-            "user_id": int(user_id),
-            "location": location,
-            "role": role,
-            "appointment_time": f"{appt_date}T{appt_time}Z",
-            "no_of_speakers": 2,
-            "meeting_type": meeting_type,
-            "created_at": datetime.now().isoformat(),
-        }
-        if manual_tags:
-            try:
-                metadata["manual_tags"] = json.loads(manual_tags)
-            except Exception as e:
-                print(f"Failed to parse manual_tags: {e}")
+        lane = _admit()
+        metadata = await run_in_threadpool(
+            _new_recording, appointment_id, user_id, room, file.filename or "audio.wav", profile,
+        )
 
-        save_metadata_json(audio_id, metadata)
+        with span("POST /transcribe", parent=traceparent, audio_id=metadata["audio_id"], lane=lane):
+            # Spool the raw upload to disk; conversion to 16kHz WAV happens in the
+            # queue processor
+            with span("upload.spool"):
+                raw_path = await run_in_threadpool(spool_upload, file.file, metadata["audio_id"])
+            with span("upload.probe_duration") as probe:
+                duration_s = await run_in_threadpool(_audio_duration, raw_path)
+                probe.set_attribute("duration_s", duration_s)
 
-        # Insert into DB
-        try:
-            supabase.table("audio_recordings").insert({
-                "audio_id": audio_id,
-                "user_id": int(user_id),
-                "appointment_id": int(appointment_id),
-                "filename": original_filename,
-                "file_path": converted_path,
-                "status": "queued",
-                "meeting_type": meeting_type,
-                "upload_time": datetime.now().isoformat()
-            }).execute()
-        except Exception as db_error:
-            print(f"Failed to insert into database: {db_error}")
-
-        return {
-            "audio_id": audio_id,
-            "status": "queued",
-            "message": "Audio uploaded successfully, transcription queued"
-        }
+            return await _enqueue_recording(metadata, manual_tags, idempotency_key, lane, duration_s)
 
     except HTTPException as e:
         raise e
@@ -119,58 +344,443 @@ async def transcribe(
         # return serializable error, not the `str` function
         raise HTTPException(status_code=500, detail=str(e))
 
+# ---------------------------------------------------------------------------
+# Resumable uploads (see upload_sessions.py):
+#   POST  /transcribe/uploads                 create -> upload_id, Location
+#   PATCH /transcribe/uploads/{id}            append body at Upload-Offset
+#   HEAD  /transcribe/uploads/{id}            current Upload-Offset
+#   POST  /transcribe/uploads/{id}/complete   finalise and queue, like /transcribe
+# ---------------------------------------------------------------------------
+
+def _upload_headers(session: dict) -> dict:
+    headers = {"Upload-Offset": str(session["offset"]), "Cache-Control": "no-store"}
+    if session.get("length") is not None:
+        headers["Upload-Length"] = str(session["length"])
+    return headers
+
+@app.post("/transcribe/uploads", status_code=201)
+async def create_resumable_upload(
+    appointment_id: str = Form(...),
+    user_id: str = Form(...),
+    room: str = Form(...),
+    filename: str = Form("audio.wav"),
+    length: int = Form(None),
+    manual_tags: str = Form(None),
+    profile: str = Form(None),
+    idempotency_key: str = Header(None),
+):
+    """
+    Start a resumable upload. Creating again with the same Idempotency-Key
+    returns the unfinished upload (200) to resume, or the job it became.
+    Admission control applies here, before any audio is sent.
+    """
+    if idempotency_key:
+        existing = _existing_upload(user_id, idempotency_key)
+        if existing:
+            return DefaultJSONResponse(existing, status_code=200)
+        session = await run_in_threadpool(find_upload, user_id, idempotency_key)
+        if session and session.get("audio_id"):
+            return DefaultJSONResponse(_finished_upload(session["audio_id"]), status_code=200)
+        if session:
+            headers = {**_upload_headers(session), "Location": f"/transcribe/uploads/{session['upload_id']}"}
+            return DefaultJSONResponse(
+                {"upload_id": session["upload_id"], "offset": session["offset"], "length": session.get("length")},
+                status_code=200,
+                headers=headers,
+            )
+
+    fields = {
+        "appointment_id": appointment_id,
+        "user_id": user_id,
+        "room": room,
+        "filename": filename,
+        "manual_tags": manual_tags,
+        "profile": profile,
+        "upload_key": idempotency_key,
+        "lane": _admit(),
+    }
+    try:
+        session = await run_in_threadpool(create_upload, fields, length)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Upload too large")
+    headers = {**_upload_headers(session), "Location": f"/transcribe/uploads/{session['upload_id']}"}
+    return DefaultJSONResponse(
+        {"upload_id": session["upload_id"], "offset": 0, "length": length},
+        status_code=201,
+        headers=headers,
+    )
+
+@app.head("/transcribe/uploads/{upload_id}")
+async def resumable_upload_offset(upload_id: str):
+    try:
+        session = await run_in_threadpool(get_upload, upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return Response(status_code=200, headers=_upload_headers(session))
+
+@app.patch("/transcribe/uploads/{upload_id}")
+async def append_resumable_upload(upload_id: str, request: Request):
+    """
+    Append the request body at Upload-Offset. Whatever arrives is kept even if
+    the connection drops, so the client resumes from HEAD's Upload-Offset.
+    """
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Upload-Offset header is required")
+
+    try:
+        appender = await run_in_threadpool(Appender, upload_id, offset)
+        await run_in_threadpool(appender.open)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadBusy:
+        raise HTTPException(status_code=409, detail="Another request is appending to this upload")
+    except UploadFinished:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+    except OffsetMismatch as e:
+        return DefaultJSONResponse(
+            {"detail": "Upload-Offset does not match", "offset": e.current_offset},
+            status_code=409,
+            headers={"Upload-Offset": str(e.current_offset)},
+        )
+
+    try:
+        buffer = bytearray()
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(appender.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(appender.write, bytes(buffer))
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Upload exceeds its declared length")
+    finally:
+        await run_in_threadpool(appender.close)
+
+    return Response(status_code=204, headers={"Upload-Offset": str(appender.offset), "Cache-Control": "no-store"})
+
+@app.post("/transcribe/uploads/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, traceparent: str = Header(None)):
+    """
+    Finalise an upload and queue it. Repeating this (say, after a lost
+    response) returns the job the upload already became.
+    """
+    try:
+        session = await run_in_threadpool(get_upload, upload_id)
+        if session.get("audio_id"):
+            return _finished_upload(session["audio_id"])
+        fields = session["fields"]
+        metadata = await run_in_threadpool(
+            _new_recording, fields["appointment_id"], fields["user_id"], fields["room"], fields["filename"], fields.get("profile"),
+        )
+        with span("POST /transcribe/uploads/complete", parent=traceparent, audio_id=metadata["audio_id"]):
+            with span("upload.finish"):
+                raw_path = await run_in_threadpool(finish_upload, upload_id, metadata["audio_id"])
+            with span("upload.probe_duration") as probe:
+                duration_s = await run_in_threadpool(_audio_duration, raw_path)
+                probe.set_attribute("duration_s", duration_s)
+            return await _enqueue_recording(
+                metadata, fields.get("manual_tags"), fields.get("upload_key"),
+                fields.get("lane") or NORMAL_LANE, duration_s,
+            )
+
+    except UploadFinished as e:
+        return _finished_upload(e.audio_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadBusy:
+        raise HTTPException(status_code=409, detail="Upload is still receiving data")
+    except OffsetMismatch as e:
+        return DefaultJSONResponse(
+            {"detail": "Upload is incomplete", "offset": e.current_offset, "length": session.get("length")},
+            status_code=409,
+            headers={"Upload-Offset": str(e.current_offset)},
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/transcribe/{audio_id}/cancel")
+async def cancel_transcription(audio_id: str):
+    """
+    Cancel a queued or processing job. A running job is stopped on the model
+    service at its next chunk boundary. 409 if the job has already finished.
+    """
+    previous = await run_in_threadpool(cancel_job, audio_id, "cancelled by user")
+    if previous is None:
+        job = job_index.get(audio_id) or load_metadata_json(audio_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Audio recording not found")
+        raise HTTPException(status_code=409, detail=f"Job is already {job.get('status', 'unknown')}")
+    broker.publish(build_job_event(audio_id, "cancelled", previous.get("user_id")))
+    return {"audio_id": audio_id, "status": "cancelled", "previous_status": previous["status"]}
+
+
+def _conditional_json(request: Request, content: dict, etag: str, last_modified: float = None):
+    """JSON response with validators, or a bodiless 304 if the client's copy is current."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return DefaultJSONResponse(content, headers=headers)
+
+def _etag_value(etag: str) -> str:
+    return etag[2:].strip('"') if etag.startswith("W/") else etag.strip('"')
 
 @app.get("/transcribe/status/{audio_id}")
-async def get_transcription_status(audio_id: str):
-    """Return status & transcript (if ready) for a given audio_id."""
-    metadata = load_metadata_json(audio_id)
-    if not metadata:
+async def get_transcription_status(audio_id: str, request: Request):
+    """Return status & transcript (if ready) for a given audio_id, with a completion estimate while in flight."""
+    job = job_index.get(audio_id) or load_metadata_json(audio_id)
+    if not job:
         raise HTTPException(status_code=404, detail="Audio recording not found")
 
-    transcript = load_transcript(audio_id)
+    status = job.get("status", "unknown")
+    # Nothing new to read while the job is still waiting or running
+    cached = None if status in ("queued", "processing") else transcript_cache.get(audio_id)
+    estimate = estimate_job(job)
 
-    return {
+    content = {
         "audio_id": audio_id,
-        "status": metadata.get("status", "unknown"),
-        "transcript": transcript  # always load from file
+        "status": status,
+        "transcript": cached.text if cached else "",
     }
+    if estimate:
+        content["estimate"] = estimate
+    # The estimate moves while in flight; revalidate it at minute resolution
+    version = estimate["estimated_completion_at"][:16] if estimate else (_etag_value(cached.etag) if cached else "0")
+    return _conditional_json(request, content, etag=f'W/"{status}-{version}"')
+
+SSE_KEEPALIVE_SECONDS = 15
+
+def _sse_message(event_id: str, event: dict) -> str:
+    return f"id: {event_id}\nevent: status\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.get("/transcribe/events")
+async def transcription_events(
+    request: Request,
+    user_id: int,
+    last_event_id: str = None,
+    last_event_id_header: str = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events stream of status changes for all of a user's recordings.
+
+    A reconnecting client (Last-Event-ID header, as EventSource sends it, or
+    last_event_id when reopening by hand) first gets the events it missed.
+    Otherwise the stream starts with the latest state of each in-flight or
+    recently finished job. Then every transition follows as the queue
+    processor reports it. The "completed" event carries the final transcript,
+    so clients never need to poll.
+    """
+    queue = broker.subscribe(user_id)
+    resume_from = last_event_id_header or last_event_id
+    missed = broker.replay(user_id, resume_from) if resume_from else None
+
+    async def stream():
+        try:
+            for event_id, event in (missed if missed is not None else broker.snapshot(user_id)):
+                yield _sse_message(event_id, event)
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event_id, event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse_message(event_id, event)
+        finally:
+            broker.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/internal/job-events")
+async def receive_job_event(request: Request):
+    """Status transitions reported by the queue processor."""
+    if not job_events_token_valid(request.headers.get("X-Job-Events-Token")):
+        raise HTTPException(status_code=403, detail="Invalid job events token")
+    event = await request.json()
+    if not event.get("audio_id") or not event.get("status"):
+        raise HTTPException(status_code=400, detail="Missing audio_id or status")
+    job_index.apply(event["audio_id"], {
+        "status": event["status"],
+        "error": event.get("error"),
+        "processing_started_at": event.get("at") if event["status"] == "processing" else None,
+    })
+    if event["status"] == "completed":
+        # The queue processor just wrote a new transcript file
+        transcript_cache.invalidate(event["audio_id"])
+    broker.publish(event)
+    return {"success": True}
 
 @app.get("/transcribe/text/{audio_id}")
-async def get_transcript_text(audio_id: str):
+async def get_transcript_text(audio_id: str, request: Request):
     """Get the transcript text for a given audio_id, if it exists"""
-    transcript = load_transcript(audio_id)
+    cached = transcript_cache.get(audio_id)
 
-    if not transcript:
+    if not cached or not cached.text:
         raise HTTPException(status_code=404, detail="Transcript not found")
 
-    return {
-        "audio_id": audio_id,
-        "transcript": transcript
-    }
+    return _conditional_json(
+        request,
+        {
+            "audio_id": audio_id,
+            "transcript": cached.text,
+            "version": cached.version,
+        },
+        etag=cached.etag,
+        last_modified=cached.last_modified,
+    )
 
 
+MAX_SEARCH_RESULTS = 100
+
+@app.get("/transcribe/search")
+async def search_transcripts(
+    q: str,
+    user_id: int = None,
+    meeting_type: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    speaker: str = None,
+    limit: int = 20,
+    offset: int = 0,
+):
+    """
+    Full-text search over transcripts, best match first.
+
+    Every word in q must appear somewhere in the transcript, not necessarily
+    on one line (end a word with * for prefix matching).
+    Dates are YYYY-MM-DD and apply to the appointment date; speaker is a
+    transcript label: CLINICIAN, or SPEAKER_01, SPEAKER_02... for the other
+    speakers. Each result carries the best matching line, HTML-escaped, with
+    hits wrapped in <mark>...</mark>.
+    """
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    results = await run_in_threadpool(
+        search_index.search, q, user_id, meeting_type, date_from, date_to, speaker, limit, max(offset, 0)
+    )
+    return {"query": q, "results": results, "limit": limit, "offset": offset}
+
 @app.post("/transcribe/update/{audio_id}")
 async def update_transcript_text(audio_id: str, request: Request):
-    """Update the saved transcript file on disk"""
+    """Replace the whole transcript (recorded as a new version)"""
     try:
         form = await request.form()
         new_text = form.get("new_text")
         if not new_text:
             raise HTTPException(status_code=400, detail="Missing new_text")
 
-        # Save to .txt file
-        save_transcript(audio_id, new_text)
+        try:
+            state = await run_in_threadpool(replace_text, audio_id, new_text, transcript_cache.get(audio_id))
+            transcript_cache.put(audio_id, state)
+        except FileNotFoundError:
+            # No transcript yet: this becomes version 0
+            await run_in_threadpool(save_transcript, audio_id, new_text)
+            transcript_cache.invalidate(audio_id)
+            state = None
 
         # Optional: update updated_at in JSON metadata
         update_metadata_json(audio_id, {"transcript_updated_at": datetime.now().isoformat()})
 
-        return {"success": True, "message": f"Transcript for {audio_id} updated."}
+        return {
+            "success": True,
+            "message": f"Transcript for {audio_id} updated.",
+            "version": state.version if state else 0,
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/transcribe/patch/{audio_id}")
+async def patch_transcript_text(audio_id: str, request: Request):
+    """
+    Apply a small edit to the transcript instead of re-sending the whole text.
+
+    Body: {"base_version": 3, "ops": [{"pos": 120, "delete": 5, "insert": "Hello"}]}
+    Ops apply in order against the text at base_version. Returns 409 with the
+    current version if someone else saved first; reload and retry.
+    """
+    body = await request.json()
+    base_version = body.get("base_version")
+    ops = body.get("ops")
+    if not isinstance(base_version, int) or not isinstance(ops, list) or not ops:
+        raise HTTPException(status_code=400, detail="Expected integer base_version and a non-empty ops list")
 
+    try:
+        state = await run_in_threadpool(apply_patch, audio_id, base_version, ops, transcript_cache.get(audio_id))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    except EditConflict as e:
+        transcript_cache.invalidate(audio_id)
+        return DefaultJSONResponse(
+            {"detail": "Transcript has changed since base_version", "current_version": e.current_version},
+            status_code=409,
+        )
+    except InvalidEdit as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    transcript_cache.put(audio_id, state)
+    update_metadata_json(audio_id, {"transcript_updated_at": datetime.now().isoformat()})
+    return DefaultJSONResponse(
+        {"success": True, "audio_id": audio_id, "version": state.version},
+        headers={"ETag": state.etag},
+    )
+
+
+
+
+MAX_BATCH_STATUS_IDS = 500
+
+@app.post("/appointments/status")
+async def get_appointment_statuses(request: Request):
+    """
+    Batch status for the dashboard. Body is either
+      {"appointment_ids": [...]} or {"user_id": ..., "date_from": ..., "date_to": ...}
+    and all statuses are resolved with one set-based query.
+    """
+    try:
+        data = await request.json()
+        appointment_ids = [int(a) for a in data.get("appointment_ids") or []]
+        user_id = data.get("user_id")
+        date_from = data.get("date_from")
+        date_to = data.get("date_to")
+
+        if not appointment_ids and user_id is None:
+            raise HTTPException(status_code=400, detail="Provide appointment_ids or user_id")
+        if len(appointment_ids) > MAX_BATCH_STATUS_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_STATUS_IDS} appointment_ids per request")
+
+        statuses = await fetch_appointment_statuses(
+            appointment_ids=appointment_ids or None,
+            user_id=int(user_id) if user_id is not None else None,
+            date_from=date_from,
+            date_to=date_to,
+        )
+        # Unknown ids report "Not started", same as the single-appointment endpoint
+        for appointment_id in appointment_ids:
+            statuses.setdefault(appointment_id, "Not started")
+
+        return {"statuses": {str(k): v for k, v in statuses.items()}}
+
+    except HTTPException as e:
+        raise e
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid appointment ID or date")
+    except Exception as e:
+        print(f"Error getting appointment statuses: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching appointment statuses")
 
 @app.get("/appointments/{appointment_id}/status")
 async def get_appointment_status(appointment_id: str):
@@ -182,24 +792,8 @@ async def get_appointment_status(appointment_id: str):
     """
     try:
         appointment_id_int = int(appointment_id)
-
-        appointment = get_appointment_by_id(appointment_id_int)
-        if not appointment:
-            return {"appointment_id": appointment_id, "status": "Not started"}
-
-        audio_recording = get_audio_recording_by_appointment(appointment_id_int)
-        if not audio_recording:
-            return {"appointment_id": appointment_id, "status": "Not started"}
-
-        audio_status = audio_recording.get("status", "queued")
-
-        transcription = get_transcription_by_appointment(appointment_id_int)
-        if transcription:
-            return {"appointment_id": appointment_id, "status": "Transcribed"}
-        elif audio_status in ["processing", "queued"]:
-            return {"appointment_id": appointment_id, "status": "Transcribing"}
-        else:
-            return {"appointment_id": appointment_id, "status": "Not started"}
+        statuses = await fetch_appointment_statuses(appointment_ids=[appointment_id_int])
+        return {"appointment_id": appointment_id, "status": statuses.get(appointment_id_int, "Not started")}
 
     except ValueError:
         return {"appointment_id": appointment_id, "status": "Not started"}
@@ -213,140 +807,211 @@ async def get_latest_audio_for_appointment(appointment_id: int):
     Return the most recent audio recording for an appointment,
     including its audio_id, filename, and status.
     """
-    audio_recording = get_audio_recording_by_appointment(appointment_id)
+    audio_recording = await fetch_audio_recording_by_appointment(appointment_id)
     if not audio_recording:
         raise HTTPException(status_code=404, detail="No audio recording found")
     return audio_recording
 
 
+MAX_APPOINTMENTS_PAGE = 1000
+
 @app.get("/appointments/user/{user_id}")
-async def get_user_appointments(user_id: int, is_dummy: bool = None):
-    """List appointments for a given user (from DB), optionally filtered by is_dummy."""
+async def get_user_appointments(
+    user_id: int,
+    is_dummy: bool = None,
+    date_from: str = None,
+    date_to: str = None,
+    cursor: str = None,
+    limit: int = None,
+):
+    """
+    List appointments for a given user (from DB), optionally filtered by is_dummy.
+
+    date_from / date_to (YYYY-MM-DD, inclusive) restrict the window. With a
+    limit the list is paged: pass the returned next_cursor to get the next page
+    (next_cursor is null on the last one).
+    """
     try:
-        appointments = get_appointments_by_user(user_id, is_dummy)
-        return {"appointments": appointments}
+        for value in (date_from, date_to):
+            if value:
+                date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if limit is not None:
+        limit = max(1, min(limit, MAX_APPOINTMENTS_PAGE))
+
+    try:
+        return await fetch_appointments_page(user_id, is_dummy, date_from, date_to, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error getting user appointments: {e}")
         raise HTTPException(status_code=500, detail="Error fetching appointments")
 
+BULK_INSERT_CHUNK_SIZE = 500
+
+CSV_CONTENT_TYPES = ("text/csv", "application/csv")
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+# CSV header aliases -> keys used by the JSON import format
+CSV_COLUMN_ALIASES = {
+    "patientname": "patientName",
+    "patient_name": "patientName",
+    "date": "date",
+    "appointment_date": "date",
+    "time": "time",
+    "appointment_time": "time",
+    "meetingtype": "meetingType",
+    "meeting_type": "meetingType",
+}
+
+async def _iter_body_lines(request: Request):
+    """Yield decoded lines from the request body as it streams in."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace").rstrip("\r")
+
+async def _iter_csv_appointments(request: Request):
+    """One appointment dict per CSV row; the first row is the header. Quoted newlines aren't supported."""
+    header = None
+    async for line in _iter_body_lines(request):
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [CSV_COLUMN_ALIASES.get(h.strip().lower(), h.strip()) for h in values]
+            continue
+        yield {k: v.strip() for k, v in zip(header, values) if v.strip()}
+
+async def _iter_ndjson_appointments(request: Request):
+    """One appointment dict per line. A malformed line is yielded as its ValueError so it counts as a bad row."""
+    async for line in _iter_body_lines(request):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+async def _iter_list(items):
+    for item in items:
+        yield item
+
+def _format_bulk_appointment(apt: dict, user_id: int, room: str) -> dict:
+    """Validate an imported appointment and map it to an appointments row."""
+    if not apt.get("patientName"):
+        raise ValueError("Missing patient name")
+    if not apt.get("date"):
+        raise ValueError("Missing appointment date")
+    if not apt.get("time"):
+        raise ValueError("Missing appointment time")
+    return {
+        "user_id": user_id,
+        "patient_name": apt["patientName"],
+        "room": room,
+        "appointment_date": apt["date"],
+        "appointment_time": apt["time"],
+        "is_dummy": False,
+        "meeting_type": apt.get("meetingType", "GP")
+    }
+
 @app.post("/appointments/bulk")
-async def create_appointments_bulk(request: Request):
-    """Bulk insert appointments from imported data, skipping duplicates."""
+async def create_appointments_bulk(request: Request, user_id: int = None):
+    """
+    Bulk insert appointments from imported data, skipping duplicates.
+
+    Accepts {"user_id", "appointments": [...]} as JSON, or a streamed CSV
+    (text/csv) or JSON-lines (application/x-ndjson) body with ?user_id=.
+    Rows are inserted in chunks with ON CONFLICT DO NOTHING, so the database
+    itself reports how many were new and how many were duplicates.
+    """
     try:
-        data = await request.json()
-        appointments = data.get("appointments", [])
-        user_id = data.get("user_id")
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        streamed = content_type in CSV_CONTENT_TYPES or content_type in NDJSON_CONTENT_TYPES
+
+        if streamed:
+            if content_type in CSV_CONTENT_TYPES:
+                appointments = _iter_csv_appointments(request)
+            else:
+                appointments = _iter_ndjson_appointments(request)
+        else:
+            data = await request.json()
+            appointment_list = data.get("appointments", [])
+            user_id = data.get("user_id")
 
-        if not appointments:
-            raise HTTPException(status_code=400, detail="No appointments provided")
+            if not appointment_list:
+                raise HTTPException(status_code=400, detail="No appointments provided")
+            appointments = _iter_list(appointment_list)
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID is required")
-        
-        if len(appointments) == 0:
-            raise HTTPException(status_code=400, detail="Appointment list cannot be empty")
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="User ID must be an integer")
 
         # Get user details for location
-        supabase = get_supabase_client()
-        user_result = supabase.table("users").select("first_name, last_name, location").eq("user_id", user_id).single().execute()
+        user_data = await run_in_threadpool(get_user_row, user_id)
 
-        if not user_result.data:
+        if not user_data:
             raise HTTPException(status_code=404, detail="User not found")
 
-        user_data = user_result.data
         room = user_data['location'] or 'Room 1'
 
-        # Get existing appointments for this user
-        existing_result = supabase.table("appointments").select("patient_name, room, appointment_date, appointment_time, meeting_type, is_dummy").eq("user_id", user_id).execute()
-        existing_appointments = existing_result.data or []
-
-        # Create a set of existing appointment tuples for fast lookup (matching database constraint)
-        existing_set = set()
-        for existing in existing_appointments:
-            existing_tuple = (
-                existing["patient_name"],
-                existing["room"],
-                str(existing["appointment_date"]),
-                str(existing["appointment_time"]),
-                existing["meeting_type"]
-            )
-            existing_set.add(existing_tuple)
-
-        # Prepare appointments and filter out duplicates
-        new_appointments = []
+        total_processed = 0
+        inserted_count = 0
         duplicates_count = 0
         validation_errors = []
-        
-        for i, apt in enumerate(appointments):
+        insert_errors = []
+        chunk = []
+
+        async def flush(rows, first_row):
+            nonlocal inserted_count, duplicates_count
             try:
-                # Validate required fields
-                if not apt.get("patientName"):
-                    validation_errors.append(f"Row {i+1}: Missing patient name")
-                    continue
-                if not apt.get("date"):
-                    validation_errors.append(f"Row {i+1}: Missing appointment date")
-                    continue
-                if not apt.get("time"):
-                    validation_errors.append(f"Row {i+1}: Missing appointment time")
+                inserted = await insert_appointments(rows)
+                inserted_count += inserted
+                duplicates_count += len(rows) - inserted
+            except Exception as db_error:
+                insert_errors.append(f"Rows {first_row}-{first_row + len(rows) - 1}: {str(db_error)}")
+                print(f"Database insertion error for appointment chunk starting at row {first_row}: {db_error}")
+
+        chunk_start = 1
+        try:
+            async for apt in appointments:
+                total_processed += 1
+                try:
+                    if isinstance(apt, ValueError):
+                        raise apt
+                    chunk.append(_format_bulk_appointment(apt, user_id, room))
+                except Exception as e:
+                    validation_errors.append(f"Row {total_processed}: {str(e)}")
                     continue
+                if len(chunk) >= BULK_INSERT_CHUNK_SIZE:
+                    await flush(chunk, chunk_start)
+                    chunk = []
+                    chunk_start = total_processed + 1
+            if chunk:
+                await flush(chunk, chunk_start)
+        finally:
+            # Earlier chunks are committed even if the stream breaks off
+            if inserted_count > 0:
+                invalidate_user_appointments(user_id)
 
-                formatted_apt = {
-                    "user_id": user_id,
-                    "patient_name": apt["patientName"],
-                    "room": room,
-                    "appointment_date": apt["date"],
-                    "appointment_time": apt["time"],
-                    "is_dummy": False,
-                    "meeting_type": apt.get("meetingType", "GP")
-                }
-                
-                # Check if this appointment already exists (matching database constraint)
-                apt_tuple = (
-                    formatted_apt["patient_name"],
-                    formatted_apt["room"],
-                    formatted_apt["appointment_date"],
-                    formatted_apt["appointment_time"],
-                    formatted_apt["meeting_type"]
-                )
-                
-                if apt_tuple in existing_set:
-                    duplicates_count += 1
-                else:
-                    new_appointments.append(formatted_apt)
-                    
-            except Exception as e:
-                validation_errors.append(f"Row {i+1}: {str(e)}")
-                continue
+        if total_processed == 0:
+            raise HTTPException(status_code=400, detail="Appointment list cannot be empty")
 
         # If we have validation errors and no valid appointments, return error
-        if validation_errors and not new_appointments:
+        if validation_errors and len(validation_errors) == total_processed:
             error_message = f"Validation failed for all appointments: {'; '.join(validation_errors[:5])}"
             if len(validation_errors) > 5:
                 error_message += f" (and {len(validation_errors) - 5} more errors)"
             raise HTTPException(status_code=400, detail=error_message)
 
-        # Insert appointments one by one to handle constraint violations properly
-        inserted_count = 0
-        constraint_duplicates = 0
-        insert_errors = []
-        
-        for i, apt in enumerate(new_appointments):
-            try:
-                result = supabase.table("appointments").insert(apt).execute()
-                if result.data:
-                    inserted_count += 1
-            except Exception as db_error:
-                error_str = str(db_error)
-                # Check if it's a unique constraint violation (duplicate)
-                if "23505" in error_str or "duplicate key" in error_str.lower():
-                    constraint_duplicates += 1
-                else:
-                    insert_errors.append(f"Row {i+1}: {error_str}")
-                    print(f"Database insertion error for appointment {i+1}: {db_error}")
-        
-        # Add constraint violations to duplicates count
-        duplicates_count += constraint_duplicates
-
         # Build detailed response message
         all_errors = validation_errors + insert_errors
         parts = []
@@ -361,7 +1026,7 @@ async def create_appointments_bulk(request: Request):
 
         return {
             "success": True,
-            "total_processed": len(appointments),
+            "total_processed": total_processed,
             "imported": inserted_count,
             "duplicates_skipped": duplicates_count,
             "validation_errors": len(validation_errors),
@@ -382,7 +1047,7 @@ async def get_appointment_details(appointment_id: str):
     """Return appointment details (from DB)."""
     try:
         appointment_id_int = int(appointment_id)
-        appointment = get_appointment_by_id(appointment_id_int)
+        appointment = await fetch_appointment_by_id(appointment_id_int)
         if not appointment:
             raise HTTPException(status_code=404, detail="Appointment not found")
         return appointment
@@ -415,21 +1080,9 @@ async def health_check():
             print(f"Database connection failed: {e}")
             db_connected = False
 
-        # Count queued/processing from JSON files
-        json_files = glob.glob(os.path.join(JSON_FILES_DIR, "*.json"))
-        queued_count = 0
-        processing_count = 0
-        for json_file in json_files:
-            try:
-                with open(json_file, "r") as f:
-                    metadata = json.load(f)
-                    status = metadata.get("status", "unknown")
-                    if status == "queued":
-                        queued_count += 1
-                    elif status == "processing":
-                        processing_count += 1
-            except:
-                continue
+        # Count queued/processing from the in-memory job index
+        queued_count = job_index.count("queued")
+        processing_count = job_index.count("processing")
 
         return {
             "status": "healthy",
@@ -450,34 +1103,27 @@ async def health_check():
 
 
 @app.get("/queue/status")
-async def queue_status():
-    """Debug view of all JSON jobs and their stored status."""
+async def queue_status(
+    status: str = None,
+    user_id: int = None,
+    date: str = None,
+    limit: int = 100,
+    offset: int = 0,
+):
+    """
+    Debug view of jobs and their stored status, served from the job index.
+    Filter by status, user_id or created date (YYYY-MM-DD); paginate with limit/offset.
+    """
     try:
-        json_files = glob.glob(os.path.join(JSON_FILES_DIR, "*.json"))
-        jobs = []
-        for json_file in json_files:
-            try:
-                audio_id = os.path.basename(json_file).replace(".json", "")
-                with open(json_file, "r") as f:
-                    metadata = json.load(f)
-                    jobs.append(
-                        {
-                            "audio_id": audio_id,
-                            "status": metadata.get("status", "unknown"),
-                            "created_at": metadata.get("created_at"),
-                            "appointment_id": metadata.get("appointment_id"),
-                            "user_id": metadata.get("user_id"),
-                        }
-                    )
-            except Exception as e:
-                jobs.append(
-                    {
-                        "audio_id": audio_id,
-                        "status": "error",
-                        "error": f"Failed to read metadata: {str(e)}",
-                    }
-                )
-
-        return {"total_jobs": len(jobs), "jobs": jobs}
+        limit = max(1, min(limit, 1000))
+        offset = max(0, offset)
+        total, jobs = job_index.query(status=status, user_id=user_id, date=date, limit=limit, offset=offset)
+        return {
+            "total_jobs": total,
+            "limit": limit,
+            "offset": offset,
+            "status_counts": job_index.counts(),
+            "jobs": jobs,
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading queue: {str(e)}")
@@ -0,0 +1,195 @@
+# model_router.py
+"""
+Routes transcription jobs across a pool of model service endpoints.
+
+MODEL_API_URLS lists the endpoints, comma separated (MODEL_API_URL is used
+when it is unset, so a single-host deployment needs no changes). An endpoint
+can be pinned to meeting types with a URL fragment, e.g.
+
+    MODEL_API_URLS=http://model-a:5005,http://model-b:5005#mdt+ward
+
+Jobs of a pinned type go to the endpoints pinned to it, every other job goes
+to the unpinned ones; either falls back to the whole pool when its group has
+no healthy endpoint.
+
+Each job is sent to the healthy candidate with the lowest load: requests this
+process has in flight there, or the in-flight count the endpoint last reported
+on /health if that is higher (other queue processors may be using it), divided
+by the capacity it reports. A background thread polls /health every
+MODEL_HEALTH_INTERVAL_SECONDS. An endpoint is ejected after
+MODEL_EJECT_AFTER_FAILURES consecutive failed requests or health checks
+(including checks slower than MODEL_HEALTH_TIMEOUT_SECONDS), and put back once
+it has been out for MODEL_EJECT_SECONDS and passes a health check. If every
+endpoint is ejected the whole pool is used anyway rather than failing jobs
+outright.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set
+from urllib.parse import urldefrag
+
+import requests
+
+MODEL_HEALTH_INTERVAL_SECONDS = float(os.getenv("MODEL_HEALTH_INTERVAL_SECONDS", "10"))
+MODEL_HEALTH_TIMEOUT_SECONDS = float(os.getenv("MODEL_HEALTH_TIMEOUT_SECONDS", "3"))
+MODEL_EJECT_AFTER_FAILURES = int(os.getenv("MODEL_EJECT_AFTER_FAILURES", "3"))
+MODEL_EJECT_SECONDS = float(os.getenv("MODEL_EJECT_SECONDS", "30"))
+
+
+class ModelEndpointError(RuntimeError):
+    """The endpoint itself failed (5xx), as opposed to rejecting the job."""
+
+
+class ModelEndpoint:
+    def __init__(self, url: str, meeting_types: Optional[Set[str]] = None):
+        self.url = url.rstrip("/")
+        self.meeting_types = meeting_types or set()
+        self.in_flight = 0
+        self.reported_in_flight = 0
+        self.capacity = 1
+        self.consecutive_failures = 0
+        self.ejected_at: Optional[float] = None
+        self.last_health_at: Optional[str] = None
+        self.served = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_at is None
+
+    @property
+    def load(self) -> float:
+        return max(self.in_flight, self.reported_in_flight) / max(self.capacity, 1)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "meeting_types": sorted(self.meeting_types),
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "reported_in_flight": self.reported_in_flight,
+            "capacity": self.capacity,
+            "served": self.served,
+            "consecutive_failures": self.consecutive_failures,
+            "last_health_at": self.last_health_at,
+        }
+
+
+def parse_endpoints(spec: str) -> List[ModelEndpoint]:
+    """"http://a:5005,http://b:5005#mdt+ward" -> endpoints with optional meeting-type affinity."""
+    endpoints = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        url, fragment = urldefrag(part)
+        meeting_types = {t.strip().lower() for t in fragment.split("+") if t.strip()}
+        endpoints.append(ModelEndpoint(url, meeting_types))
+    return endpoints
+
+
+class ModelRouter:
+    def __init__(self, endpoints: List[ModelEndpoint]):
+        if not endpoints:
+            raise ValueError("At least one model endpoint is required")
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._health_thread: Optional[threading.Thread] = None
+
+    # ----------------------------- dispatch -------------------------------
+
+    def _candidates(self, meeting_type: Optional[str]) -> List[ModelEndpoint]:
+        meeting_type = (meeting_type or "").lower()
+        pinned = [e for e in self.endpoints if meeting_type and meeting_type in e.meeting_types]
+        group = pinned or [e for e in self.endpoints if not e.meeting_types] or self.endpoints
+        healthy = [e for e in group if e.healthy] or [e for e in self.endpoints if e.healthy]
+        return healthy or group
+
+    def acquire(self, meeting_type: Optional[str] = None) -> ModelEndpoint:
+        """Pick the least-loaded endpoint for a job and count the job against it."""
+        self.start()
+        with self._lock:
+            endpoint = min(self._candidates(meeting_type), key=lambda e: (e.load, e.served))
+            endpoint.in_flight += 1
+            return endpoint
+
+    def release(self, endpoint: ModelEndpoint, ok: bool) -> None:
+        with self._lock:
+            endpoint.in_flight -= 1
+            if ok:
+                endpoint.served += 1
+                endpoint.consecutive_failures = 0
+            else:
+                self._record_failure(endpoint, "request failed")
+
+    @contextmanager
+    def dispatch(self, meeting_type: Optional[str] = None) -> Iterator[ModelEndpoint]:
+        """
+        Yield an endpoint for one request. Connection errors and 5xx responses
+        (raised as ModelEndpointError) count as endpoint failures; anything else
+        raised in the block is the job's problem, not the endpoint's.
+        """
+        endpoint = self.acquire(meeting_type)
+        ok = True
+        try:
+            yield endpoint
+        except (requests.ConnectionError, requests.Timeout, ConnectionError, ModelEndpointError):
+            ok = False
+            raise
+        finally:
+            self.release(endpoint, ok)
+
+    # ----------------------------- health ---------------------------------
+
+    def _record_failure(self, endpoint: ModelEndpoint, reason: str) -> None:
+        endpoint.consecutive_failures += 1
+        if endpoint.healthy and endpoint.consecutive_failures >= MODEL_EJECT_AFTER_FAILURES:
+            endpoint.ejected_at = time.monotonic()
+            print(f"[{datetime.now()}] Ejected model endpoint {endpoint.url} "
+                  f"after {endpoint.consecutive_failures} failures ({reason})")
+
+    def check(self, endpoint: ModelEndpoint) -> None:
+        try:
+            response = self._session.get(f"{endpoint.url}/health", timeout=MODEL_HEALTH_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            health = response.json()
+        except Exception as e:
+            with self._lock:
+                self._record_failure(endpoint, f"health check: {e}")
+            return
+
+        with self._lock:
+            endpoint.reported_in_flight = int(health.get("in_flight") or 0)
+            endpoint.capacity = int(health.get("capacity") or 1)
+            endpoint.last_health_at = datetime.now().isoformat()
+            endpoint.consecutive_failures = 0
+            if not endpoint.healthy and time.monotonic() - endpoint.ejected_at >= MODEL_EJECT_SECONDS:
+                endpoint.ejected_at = None
+                print(f"[{datetime.now()}] Reintroduced model endpoint {endpoint.url}")
+
+    def _health_loop(self) -> None:
+        while True:
+            for endpoint in self.endpoints:
+                self.check(endpoint)
+            time.sleep(MODEL_HEALTH_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        """Start the health-check thread (once; later calls do nothing)."""
+        if self._health_thread is not None:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name="model-health", daemon=True)
+                self._health_thread.start()
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [e.summary() for e in self.endpoints]
+
+
+model_router = ModelRouter(parse_endpoints(
+    os.getenv("MODEL_API_URLS") or os.getenv("MODEL_API_URL", "http://localhost:5005")
+))
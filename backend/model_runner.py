@@ -1,28 +1,242 @@
 import requests
+import hashlib
+import http.client
 import json
 import os
+import socket
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
 
-def run_model(audio_path: str) -> dict:
-    """Send audio file path to model service for transcription"""
-    try:
-        # Send file path to model service instead of uploading file again
-        payload = {"audio_path": audio_path}
-        # Use Docker service name for container communication
-        model_url = os.getenv("MODEL_API_URL", "http://localhost:5005")
+from model_router import MODEL_HEALTH_TIMEOUT_SECONDS, ModelEndpointError, model_router
+from tracing import current_traceparent, span
+
+# "path": send the file path; the model reads it from the shared AUDIO_FILES_DIR volume.
+# "stream": send the audio bytes, so model hosts need no access to backend storage.
+MODEL_TRANSFER_MODE = os.getenv("MODEL_TRANSFER_MODE", "path").lower()
+STREAM_CHUNK_BYTES = 1024 * 1024
+
+# Optional split of feature extraction from inference (model/app/features.py):
+# the queue processor asks FEATURES_API_URL, a model service on a CPU host, for
+# a recording's Whisper features while it converts the upload, and run_model
+# sends those instead of the audio, so GPU hosts only run the models. Unset,
+# or if extraction fails, the model hosts extract features themselves.
+FEATURES_API_URL = os.getenv("FEATURES_API_URL", "").rstrip("/")
+FEATURES_TIMEOUT_SECONDS = float(os.getenv("FEATURES_TIMEOUT_SECONDS", "600"))
+
+# How long past a job's deadline we keep waiting for the model's answer; the
+# model stops the job itself at the deadline, this covers one that hangs
+MODEL_DEADLINE_GRACE_SECONDS = float(os.getenv("MODEL_DEADLINE_GRACE_SECONDS", "60"))
+MODEL_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MODEL_CONNECT_TIMEOUT_SECONDS", "10"))
+
+
+class JobCancelled(RuntimeError):
+    """The model service stopped the job because it was cancelled (409)."""
+
+
+class ModelDeadlineExceeded(RuntimeError):
+    """The job ran past its deadline: the model stopped it (504) or never answered."""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _iter_file(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_BYTES), b""):
+            yield chunk
+
+
+def features_path_for(audio_path: str) -> str:
+    """Where the feature bundle for an audio file is kept: next to it, as <audio_id>.feat"""
+    return os.path.splitext(audio_path)[0] + ".feat"
+
+
+def stream_audio(model_url: str, audio_path: str, options: Dict[str, Any],
+                 extra_headers: Optional[Dict[str, str]] = None,
+                 route: str = "/transcribe-stream", timeout: Optional[float] = None) -> Tuple[int, str]:
+    """
+    POST the audio file (or feature bundle, to /transcribe-features) to
+    {model_url}{route} with its sha256 in X-Audio-SHA256 and each option as an
+    X-<Option-Name> header. Over plain HTTP the file goes out with sendfile
+    (no copy through Python); otherwise as a chunked upload. `timeout` bounds
+    every socket operation, including the wait for the response. Returns (status, body).
+    """
+    headers = {
+        "Content-Type": "audio/wav" if audio_path.endswith(".wav") else "application/octet-stream",
+        "X-Audio-SHA256": file_sha256(audio_path),
+        "X-Audio-Name": os.path.basename(audio_path),
+        **(extra_headers or {}),
+    }
+    for name, value in options.items():
+        headers["X-" + name.replace("_", "-").title()] = str(value)
+    url = urlsplit(model_url)
+    path = f"{url.path.rstrip('/')}{route}"
+
+    if url.scheme != "http" or not hasattr(os, "sendfile"):
         response = requests.post(
-            f"{model_url}/transcribe", 
-            json=payload,
-            headers={"Content-Type": "application/json"}
+            f"{model_url}{route}", data=_iter_file(audio_path), headers=headers,
+            timeout=(MODEL_CONNECT_TIMEOUT_SECONDS, timeout) if timeout else None,
         )
+        return response.status_code, response.text
+
+    size = os.path.getsize(audio_path)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    try:
+        conn.putrequest("POST", path)
+        for name, value in headers.items():
+            conn.putheader(name, value)
+        conn.putheader("Content-Length", str(size))
+        conn.endheaders()
+        with open(audio_path, "rb") as f:
+            # socket.sendfile rather than os.sendfile: with a timeout the socket is
+            # non-blocking underneath, and it waits for buffer space (up to the
+            # timeout) where a bare os.sendfile fails with EAGAIN
+            sent = conn.sock.sendfile(f)
+        if sent != size:
+            raise ConnectionError("Model service closed the connection during upload")
+        response = conn.getresponse()
+        return response.status, response.read().decode("utf-8", errors="replace")
+    finally:
+        conn.close()
+
+
+def request_features(audio_path: str, profile: Optional[str] = None) -> Optional[str]:
+    """
+    Have FEATURES_API_URL precompute the Whisper features of audio_path for
+    `profile` and store the bundle next to it. Returns the bundle's path, or
+    None when feature extraction isn't split off or failed; the model hosts
+    then work from the audio as usual.
+    """
+    if not FEATURES_API_URL:
+        return None
+    features_path = features_path_for(audio_path)
+    tmp_path = features_path + ".part"
+    headers = {
+        "Content-Type": "audio/wav",
+        "X-Audio-SHA256": file_sha256(audio_path),
+        "traceparent": current_traceparent(),
+    }
+    if profile:
+        headers["X-Profile"] = profile
+    try:
+        with requests.post(
+            f"{FEATURES_API_URL}/features", data=_iter_file(audio_path), headers=headers,
+            stream=True, timeout=FEATURES_TIMEOUT_SECONDS,
+        ) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(STREAM_CHUNK_BYTES):
+                    f.write(chunk)
+        os.replace(tmp_path, features_path)
+        return features_path
+    except Exception as e:
+        print(f"Feature extraction for {audio_path} failed, the model will extract them: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def cancel_model_job(job_token: str) -> bool:
+    """
+    Ask the model services to stop the job sent with job_token. We don't track
+    which endpoint took the job, so every endpoint is told; the others just
+    remember the token for a while. Best effort: returns whether any endpoint
+    had the job running.
+    """
+    stopped = False
+    for endpoint in model_router.endpoints:
+        try:
+            response = requests.post(
+                f"{endpoint.url}/jobs/{job_token}/cancel", timeout=MODEL_HEALTH_TIMEOUT_SECONDS,
+            )
+            stopped = stopped or bool(response.ok and response.json().get("cancelled"))
+        except Exception as e:
+            print(f"Failed to cancel model job {job_token} on {endpoint.url}: {e}")
+    return stopped
+
+
+def run_model(audio_path: str, meeting_type: Optional[str] = None, user_id: Optional[int] = None,
+              num_speakers: Optional[int] = None, profile: Optional[str] = None,
+              job_token: Optional[str] = None, deadline_s: Optional[float] = None) -> dict:
+    """
+    Send audio (path or bytes, see MODEL_TRANSFER_MODE) to the least-loaded model service for transcription.
+    user_id lets the model label the recording clinician by their enrolled voice; profile picks the
+    model pipeline settings (defaults to the meeting type). job_token lets cancel_model_job stop the
+    job part way, in which case JobCancelled is raised. The current trace context goes along as a
+    traceparent header. Precomputed features (request_features) are sent in place of the audio
+    when they exist. With deadline_s the model stops the job after that many seconds and we stop
+    waiting shortly after, raising ModelDeadlineExceeded either way (see job_deadlines.py).
+    Returns the transcript and the profile used.
+    """
+    options = {
+        k: v for k, v in {
+            "user_id": user_id,
+            "num_speakers": num_speakers,
+            "profile": profile or meeting_type,
+            "job_token": job_token,
+            "deadline_s": round(deadline_s) if deadline_s else None,
+        }.items() if v is not None
+    }
+    timeout = deadline_s + MODEL_DEADLINE_GRACE_SECONDS if deadline_s else None
+    features_path = features_path_for(audio_path)
+    has_features = os.path.exists(features_path)
+    try:
+        # Endpoints come from MODEL_API_URLS / MODEL_API_URL (Docker service names)
+        with model_router.dispatch(meeting_type) as endpoint, \
+                span("model.request", endpoint=endpoint.url, transfer=MODEL_TRANSFER_MODE,
+                     precomputed_features=has_features) as request_span:
+            trace_headers = {"traceparent": current_traceparent()}
+            if MODEL_TRANSFER_MODE == "stream":
+                status_code = 404
+                if has_features:
+                    status_code, body = stream_audio(
+                        endpoint.url, features_path, options, trace_headers,
+                        route="/transcribe-features", timeout=timeout,
+                    )
+                # 404: a model service from before /transcribe-features
+                if status_code == 404:
+                    status_code, body = stream_audio(endpoint.url, audio_path, options, trace_headers, timeout=timeout)
+            else:
+                # Send file path to model service instead of uploading file again
+                payload = {"audio_path": audio_path, **options}
+                if has_features:
+                    payload["features_path"] = features_path
+                response = requests.post(
+                    f"{endpoint.url}/transcribe",
+                    json=payload,
+                    headers={"Content-Type": "application/json", **trace_headers},
+                    timeout=(MODEL_CONNECT_TIMEOUT_SECONDS, timeout) if timeout else None,
+                )
+                status_code, body = response.status_code, response.text
+            request_span.set_attribute("status_code", status_code)
+            # 504 is the model enforcing the job's deadline, not the endpoint failing
+            if status_code >= 500 and status_code != 504:
+                raise ModelEndpointError(f"Model API error {status_code} from {endpoint.url}: {body}")
 
-        if response.status_code == 200:
-            data = response.json()
+        if status_code == 409:
+            raise JobCancelled(f"Model job {job_token} was cancelled")
+        if status_code == 504:
+            raise ModelDeadlineExceeded(f"Model stopped job {job_token} at its deadline: {body}")
+        if status_code == 200:
+            data = json.loads(body)
             if "transcript" in data:
-                return {"transcript": data["transcript"]}
+                return {"transcript": data["transcript"], "profile": data.get("profile")}
             else:
                 raise RuntimeError(f"Unexpected response format: {data}")
         else:
-            raise RuntimeError(f"Model API error {response.status_code}: {response.text}")
+            raise RuntimeError(f"Model API error {status_code}: {body}")
 
+    except (requests.Timeout, socket.timeout) as e:
+        # The model never answered; make sure it isn't still working on the job
+        if job_token:
+            cancel_model_job(job_token)
+        raise ModelDeadlineExceeded(f"No answer from the model in time: {e}")
+    except (JobCancelled, ModelDeadlineExceeded):
+        raise
     except Exception as e:
         raise RuntimeError(f"Failed to call model API: {str(e)}")
@@ -1,17 +1,423 @@
 import time
 import os
 import glob
-from datetime import datetime
-
-from model_runner import run_model
-from utils import load_metadata_json, update_metadata_json, save_transcript
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from model_runner import (
+    FEATURES_API_URL,
+    JobCancelled,
+    ModelDeadlineExceeded,
+    features_path_for,
+    request_features,
+    run_model,
+)
+from model_router import model_router
+from admission import DEFERRED_LANE, ETA_REFRESH_SECONDS, estimator, is_off_peak
+from job_deadlines import WATCHDOG_INTERVAL_SECONDS, deadline_seconds, is_due, recover_stuck_jobs, requeue_or_fail
+from job_index import job_index
+from utils import (
+    add_metadata_listener,
+    load_metadata_json,
+    update_metadata_json,
+    transition_metadata_json,
+    discard_audio,
+    save_transcript,
+    transcode_to_wav_16k,
+    raw_upload_exists,
+    add_transcript_listener,
+)
 from config import JSON_FILES_DIR, AUDIO_FILES_DIR, TRANSCRIPTION_FILES_DIR
 from supabase_client import get_supabase_client
+from job_events import publish_job_event, require_job_events_token
+from search_index import search_index
+from tracing import record_span, span
+
+# Uploads are converted to 16kHz WAV here rather than in /transcribe. A small
+# pool converts queued uploads ahead of the model so decoding overlaps with
+# inference instead of adding to it. With FEATURES_API_URL set, the same pool
+# also has Whisper's features precomputed on a CPU host (model_runner.py).
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", "2"))
+
+
+# Jobs run concurrently on QUEUE_WORKERS threads, by default one per model
+# endpoint (see model_router.py), so a single endpoint keeps the original
+# one-at-a-time behaviour and each added endpoint adds a job in parallel.
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "0")) or len(model_router.endpoints)
+QUEUE_POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", "5"))
+
+# Converted audio is 16kHz mono 16-bit PCM
+WAV_BYTES_PER_SECOND = 16000 * 2
+
+
+def prepare_audio(audio_id: str, traceparent: Optional[str] = None,
+                  profile: Optional[str] = None) -> Tuple[str, float]:
+    """
+    Make sure <audio_id>.wav exists, converting the raw upload if needed, and
+    its features for `profile` if they are precomputed. Returns (path, seconds spent).
+    """
+    started = time.monotonic()
+    audio_path = os.path.join(AUDIO_FILES_DIR, f"{audio_id}.wav")
+    if raw_upload_exists(audio_id):
+        with span("audio.conversion", parent=traceparent, audio_id=audio_id):
+            print(f"[{datetime.now()}] Converting upload for {audio_id}")
+            audio_path = transcode_to_wav_16k(audio_id)
+            print(f"[{datetime.now()}] Converted {audio_id} -> {audio_path}")
+    if FEATURES_API_URL and os.path.exists(audio_path) and not os.path.exists(features_path_for(audio_path)):
+        with span("audio.features", parent=traceparent, audio_id=audio_id, profile=profile):
+            if request_features(audio_path, profile):
+                print(f"[{datetime.now()}] Precomputed features for {audio_id}")
+    return audio_path, time.monotonic() - started
+
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str, span_name: Optional[str] = None):
+    """Add the time spent in the block to timings[stage], and trace it as span_name (or the stage)."""
+    started = time.monotonic()
+    try:
+        with span(span_name or stage):
+            yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.monotonic() - started
+
+
+def process_job(audio_id: str, metadata: dict, conversion: Future) -> None:
+    """
+    Run one queued job end to end: model, transcript, metadata and DB updates.
+
+    Stage durations (queue wait, conversion, model, DB) are stored under
+    "timings" in the job metadata once the job completes, and each stage is
+    traced as a span of the trace the upload started.
+
+    The backend may cancel the job at any point (see job_cancellation.py). The
+    model call carries a fresh job token for that, and every status change here
+    is conditional, so a cancelled job is never marked completed or failed.
+
+    The model call has a deadline from the audio duration (job_deadlines.py);
+    a job that misses it is requeued with backoff rather than failed outright.
+    """
+    # Continue the trace /transcribe started (tracing.py)
+    traceparent = metadata.get("traceparent")
+    try:
+        record_span(
+            "queue.wait", datetime.fromisoformat(metadata["created_at"]).timestamp(), time.time(),
+            parent=traceparent, audio_id=audio_id,
+        )
+    except (KeyError, TypeError, ValueError):
+        pass
+    with span("job.process", parent=traceparent, audio_id=audio_id, meeting_type=metadata.get("meeting_type")):
+        _process_job(audio_id, metadata, conversion)
+
+
+def _process_job(audio_id: str, metadata: dict, conversion: Future) -> None:
+    print(f"[{datetime.now()}] ========== Processing audio_id: {audio_id} ==========")
+    timings: Dict[str, float] = {}
+    started = time.monotonic()
+    started_at = datetime.now()
+    try:
+        timings["queue_wait_s"] = (started_at - datetime.fromisoformat(metadata["created_at"])).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    # Update status to processing in file and DB, unless it was cancelled while queued
+    job_token = uuid.uuid4().hex
+    claimed = transition_metadata_json(
+        audio_id,
+        ("queued",),
+        {
+            "status": "processing",
+            "processing_started_at": started_at.isoformat(),
+            "model_job_token": job_token,
+            "attempts": int(metadata.get("attempts") or 0) + 1,
+        },
+    )
+    if claimed is None:
+        print(f"[{datetime.now()}] Skipping {audio_id}: no longer queued")
+        _discard_cancelled(audio_id, conversion)
+        return
+    publish_job_event(audio_id, "processing", metadata.get("user_id"))
+
+    try:
+        with _timed(timings, "db_s", "db.update audio_recordings status"):
+            supabase = get_supabase_client()
+            supabase.table("audio_recordings") \
+                .update({"status": "processing"}) \
+                .eq("audio_id", audio_id) \
+                .execute()
+        print(f"[{datetime.now()}] Updated database status to processing for {audio_id}")
+    except Exception as db_error:
+        print(f"[{datetime.now()}] Failed to update database status: {db_error}")
+
+    try:
+        # Wait for the converted audio
+        with _timed(timings, "conversion_wait_s", "audio.conversion_wait"):
+            audio_path, conversion_s = conversion.result()
+        timings["conversion_s"] = conversion_s
+        print(f"[{datetime.now()}] Looking for audio file: {audio_path}")
+
+        if load_metadata_json(audio_id).get("status") == "cancelled":
+            raise JobCancelled(f"{audio_id} was cancelled before transcription")
+
+        if not os.path.exists(audio_path):
+            raise Exception(f"Audio file not found: {audio_path}")
+
+        file_size = os.path.getsize(audio_path)
+        print(f"[{datetime.now()}] Audio file exists, size: {file_size} bytes")
+
+        deadline_s = deadline_seconds(max(file_size - 44, 0) / WAV_BYTES_PER_SECOND)
+        update_metadata_json(audio_id, {
+            "deadline_s": round(deadline_s),
+            "deadline_at": (datetime.now() + timedelta(seconds=deadline_s)).isoformat(),
+        })
+
+        # Run transcription
+        print(f"[{datetime.now()}] Starting transcription model (deadline {deadline_s:.0f}s)...")
+        with _timed(timings, "model_s", "model.run"):
+            result = run_model(
+                audio_path,
+                metadata.get("meeting_type"),
+                user_id=metadata.get("user_id"),
+                num_speakers=metadata.get("no_of_speakers"),
+                profile=metadata.get("profile"),
+                job_token=job_token,
+                deadline_s=deadline_s,
+            )
+        print(f"[{datetime.now()}] Transcription completed, result type: {type(result)}")
+
+        if not result or "transcript" not in result:
+            raise Exception("Model returned invalid result")
+
+        transcript_text = result["transcript"] or ""
+        print(f"[{datetime.now()}] Transcript length: {len(transcript_text)}")
+
+        # Correct audio_id based on appointment date/time from DB
+        # try:
+        #     appointment_id = metadata.get("appointment_id")
+        #     if appointment_id:
+        #         appt_data = supabase.table("appointments") \
+        #             .select("appointment_date, appointment_time") \
+        #             .eq("appointment_id", int(appointment_id)) \
+        #             .single() \
+        #             .execute()
+        #         if appt_data.data:
+        #             appt_date = appt_data.data["appointment_date"]  # e.g. "2025-08-09"
+        #             appt_time = appt_data.data["appointment_time"]  # e.g. "09:00:00"
+        #             dt = datetime.strptime(f"{appt_date} {appt_time}", "%Y-%m-%d %H:%M:%S")
+        #             ms = "000"
+        #             corrected_audio_id = f"{appointment_id}_{dt.strftime('%Y-%m-%dT%H-%M-%S-')}{ms}Z"
+        #             if corrected_audio_id != audio_id:
+        #                 print(f"[{datetime.now()}] Correcting audio_id from {audio_id} to {corrected_audio_id}")
+        #                 audio_id = corrected_audio_id
+        # except Exception as e:
+        #     print(f"[{datetime.now()}] Could not correct audio_id: {e}")
+
+        # Save transcript to file 
+        with span("transcript.save"):
+            transcript_path = save_transcript(audio_id, transcript_text)
+        print(f"[{datetime.now()}] Saved transcript to: {transcript_path}")
+
+        # Update file metadata with completion
+        completion_data = {
+            # "transcript": transcript_text,
+            "status": "completed",  # IMPORTANT: UI expects "completed"
+            "completed_at": datetime.now().isoformat(),
+            "transcript_path": transcript_path,
+            "profile": result.get("profile"),
+            # Exact length, for the rolling real-time factor behind upload estimates (admission.py)
+            "duration_s": round(max(file_size - 44, 0) / WAV_BYTES_PER_SECOND, 1),
+        }
+        if transition_metadata_json(audio_id, ("processing",), completion_data) is None:
+            raise JobCancelled(f"{audio_id} was cancelled while finishing")
+        publish_job_event(audio_id, "completed", metadata.get("user_id"), transcript=transcript_text)
+
+        # ====== Update DB: audio_recordings + transcriptions (with metadata fields) ======
+        db_started = time.monotonic()
+        try:
+            supabase = get_supabase_client()
+
+            # 1) Mark audio as transcribed
+            with span("db.update audio_recordings status"):
+                supabase.table("audio_recordings") \
+                    .update({"status": "transcribed"}) \
+                    .eq("audio_id", audio_id) \
+                    .execute()
+
+            # 2) Prepare metadata for transcriptions insert
+            meeting_type_raw = metadata.get("meeting_type") or "GP"
+            meeting_type = str(meeting_type_raw).upper()
+
+            # appointment_time in table is TIME -> need "HH:MM:SS"
+            appt_iso = metadata.get("appointment_time")  # e.g. "2025-08-09T09:00:00Z"
+            appt_time_only = None
+            if appt_iso:
+                try:
+                    appt_time_only = appt_iso.split("T", 1)[1].split("Z", 1)[0][:8]
+                except Exception:
+                    appt_time_only = None
+
+            transcription_record = {
+                "audio_id": audio_id,
+                "transcript_filename": f"{audio_id}.txt",
+                "metadata_filename": f"{audio_id}.json",
+                "transcript_storage_path": transcript_path,
+                "transcribed_at": datetime.now().isoformat(),
+
+                # New fields
+                "appointment_time": appt_time_only,                         # "HH:MM:SS" or None
+                "location": metadata.get("location"),                       # from appointments.room
+                "role": metadata.get("role"),                               # from users.role
+                "no_of_speakers": int(metadata.get("no_of_speakers", 2)),   # default 2
+                "meeting_type": meeting_type,                                # must match enum casing
+            }
+
+            with span("db.insert transcriptions"):
+                supabase.table("transcriptions").insert(transcription_record).execute()
+            print(f"[{datetime.now()}] Inserted transcription row for {audio_id}")
+
+            # Delete audio file after successful transcription
+            try:
+                if os.path.exists(features_path_for(audio_path)):
+                    os.remove(features_path_for(audio_path))
+                if os.path.exists(audio_path):
+                    os.remove(audio_path)
+                    print(f"[{datetime.now()}] Deleted audio file: {audio_path}")
+                    
+                    # Update deleted_at in audio_recordings
+                    with span("db.update audio_recordings deleted_at"):
+                        supabase.table("audio_recordings") \
+                            .update({"deleted_at": datetime.now().isoformat()}) \
+                            .eq("audio_id", audio_id) \
+                            .execute()
+                    print(f"[{datetime.now()}] Marked audio as deleted in DB for {audio_id}")
+                else:
+                    print(f"[{datetime.now()}] Audio file already missing: {audio_path}")
+            except Exception as delete_err:
+                print(f"[{datetime.now()}] Error deleting audio or updating DB: {delete_err}")
+
+        except Exception as db_error:
+            print(f"[{datetime.now()}] Failed to update database with completion: {db_error}")
+        timings["db_s"] = timings.get("db_s", 0.0) + time.monotonic() - db_started
+
+        timings["total_s"] = time.monotonic() - started
+        update_metadata_json(audio_id, {"timings": timings})
+        print(f"[{datetime.now()}] ✓ Completed transcription for {audio_id}")
+
+    except JobCancelled as e:
+        print(f"[{datetime.now()}] Stopped {audio_id}: {e}")
+        _discard_cancelled(audio_id, conversion)
+        update_metadata_json(audio_id, {"timings": {**timings, "total_s": time.monotonic() - started}})
+
+    except ModelDeadlineExceeded as e:
+        print(f"[{datetime.now()}] ✗ {audio_id} missed its deadline: {e}")
+        # The audio stays for the retry
+        if requeue_or_fail(audio_id, str(e)) is None:
+            _discard_cancelled(audio_id, conversion)
+
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[{datetime.now()}] ✗ Error processing {audio_id}: {error_msg}")
+
+        # Update file metadata with error, unless the job was cancelled meanwhile
+        failed = transition_metadata_json(
+            audio_id,
+            ("processing",),
+            {
+                "status": "error",
+                "error": error_msg,
+                "error_at": datetime.now().isoformat(),
+                "timings": {**timings, "total_s": time.monotonic() - started},
+            },
+        )
+        if failed is None:
+            _discard_cancelled(audio_id, conversion)
+            return
+        publish_job_event(audio_id, "error", metadata.get("user_id"), error=error_msg)
+
+        # Update DB with error
+        try:
+            with span("db.update audio_recordings status"):
+                supabase = get_supabase_client()
+                supabase.table("audio_recordings") \
+                    .update({"status": "error"}) \
+                    .eq("audio_id", audio_id) \
+                    .execute()
+            print(f"[{datetime.now()}] Updated database status to error for {audio_id}")
+        except Exception as db_error:
+            print(f"[{datetime.now()}] Failed to update database error status: {db_error}")
+
+
+def _discard_cancelled(audio_id: str, conversion: Future) -> None:
+    """Remove a cancelled job's audio and any transcript it got, once its conversion has finished."""
+    try:
+        conversion.result()
+    except Exception:
+        pass
+    discard_audio(audio_id)
+    transcript_path = os.path.join(TRANSCRIPTION_FILES_DIR, f"{audio_id}.txt")
+    if os.path.exists(transcript_path):
+        os.remove(transcript_path)
+        search_index.remove(audio_id)
+
+
+def find_queued_jobs() -> List[Tuple[str, dict]]:
+    """Queued jobs from the metadata files that are due (not backing off before a retry), oldest first."""
+    now = datetime.now()
+    return [(audio_id, metadata) for audio_id, metadata in find_jobs("queued") if is_due(metadata, now)]
+
+
+def find_jobs(status: str) -> List[Tuple[str, dict]]:
+    """Jobs with this status from the metadata files, oldest first."""
+    json_files = glob.glob(os.path.join(JSON_FILES_DIR, "*.json"))
+    print(f"[{datetime.now()}] Found {len(json_files)} JSON files to check")
+
+    items = []
+
+    for json_file in json_files:
+        audio_id = os.path.basename(json_file).replace(".json", "")
 
+        try:
+            metadata = load_metadata_json(audio_id)
+            if not metadata:
+                print(f"[{datetime.now()}] Failed to load metadata for {audio_id}")
+                continue
 
-def process_queue():
-    """File-based background processor for transcription queue"""
-    print(f"[{datetime.now()}] Starting queue processor...")
+            if metadata.get("status", "unknown") == status:
+                items.append((audio_id, metadata))
+        except Exception as e:
+            print(f"[{datetime.now()}] Error loading metadata for {audio_id}: {str(e)}")
+            continue
+
+    items.sort(key=lambda item: str(item[1].get("created_at") or ""))
+    return items
+
+
+def select_jobs(queued_items: List[Tuple[str, dict]], in_flight: int) -> List[Tuple[str, dict]]:
+    """
+    Jobs to start now. Deferred-lane jobs (admission.py) only run during
+    off-peak hours, or on workers that the normal lane would leave idle.
+    """
+    normal = [item for item in queued_items if item[1].get("lane") != DEFERRED_LANE]
+    deferred = [item for item in queued_items if item[1].get("lane") == DEFERRED_LANE]
+    if is_off_peak():
+        return normal + deferred
+    idle = max(QUEUE_WORKERS - in_flight - len(normal), 0)
+    return normal + deferred[:idle]
+
+
+def process_queue(stop_event: Optional[threading.Event] = None):
+    """
+    File-based background processor for transcription queue.
+
+    Runs until stop_event is set (forever if none is given); jobs already
+    started are finished before returning.
+    """
+    stop_event = stop_event or threading.Event()
+    require_job_events_token()
+    print(f"[{datetime.now()}] Starting queue processor ({QUEUE_WORKERS} worker(s))...")
     print(f"[{datetime.now()}] Monitoring directories:")
     print(f"  - JSON files: {JSON_FILES_DIR}")
     print(f"  - Audio files: {AUDIO_FILES_DIR}")
@@ -28,204 +434,69 @@ def process_queue():
         else:
             print(f"  ✗ {name} directory missing: {directory}")
 
-    while True:
-        try:
-            # Find queued items by scanning JSON files
-            json_files = glob.glob(os.path.join(JSON_FILES_DIR, "*.json"))
-            print(f"[{datetime.now()}] Found {len(json_files)} JSON files to check")
-
-            queued_items = []
-
-            for json_file in json_files:
-                audio_id = os.path.basename(json_file).replace(".json", "")
-                print(f"[{datetime.now()}] Checking file: {json_file} -> audio_id: {audio_id}")
-
-                try:
-                    metadata = load_metadata_json(audio_id)
-                    if not metadata:
-                        print(f"[{datetime.now()}] Failed to load metadata for {audio_id}")
-                        continue
-
-                    status = metadata.get("status", "unknown")
-                    print(f"[{datetime.now()}] Audio ID {audio_id} has status: {status}")
-
-                    if status == "queued":
-                        queued_items.append((audio_id, metadata))
-                        print(f"[{datetime.now()}] Added {audio_id} to processing queue")
-                except Exception as e:
-                    print(f"[{datetime.now()}] Error loading metadata for {audio_id}: {str(e)}")
-                    continue
-
-            print(f"[{datetime.now()}] Found {len(queued_items)} items queued for processing")
-
-            for audio_id, metadata in queued_items:
-                print(f"[{datetime.now()}] ========== Processing audio_id: {audio_id} ==========")
-
-                # Update status to processing in file and DB
-                update_metadata_json(
-                    audio_id,
-                    {"status": "processing", "processing_started_at": datetime.now().isoformat()},
-                )
-
-                try:
-                    supabase = get_supabase_client()
-                    supabase.table("audio_recordings") \
-                        .update({"status": "processing"}) \
-                        .eq("audio_id", audio_id) \
-                        .execute()
-                    print(f"[{datetime.now()}] Updated database status to processing for {audio_id}")
-                except Exception as db_error:
-                    print(f"[{datetime.now()}] Failed to update database status: {db_error}")
-
-                try:
-                    # Build audio path
-                    audio_path = os.path.join(AUDIO_FILES_DIR, f"{audio_id}.wav")
-                    print(f"[{datetime.now()}] Looking for audio file: {audio_path}")
-
-                    if not os.path.exists(audio_path):
-                        raise Exception(f"Audio file not found: {audio_path}")
-
-                    file_size = os.path.getsize(audio_path)
-                    print(f"[{datetime.now()}] Audio file exists, size: {file_size} bytes")
-
-                    # Run transcription
-                    print(f"[{datetime.now()}] Starting transcription model...")
-                    result = run_model(audio_path)
-                    print(f"[{datetime.now()}] Transcription completed, result type: {type(result)}")
-
-                    if not result or "transcript" not in result:
-                        raise Exception("Model returned invalid result")
-
-                    transcript_text = result["transcript"] or ""
-                    print(f"[{datetime.now()}] Transcript length: {len(transcript_text)}")
-
-                    # Correct audio_id based on appointment date/time from DB
-                    # try:
-                    #     appointment_id = metadata.get("appointment_id")
-                    #     if appointment_id:
-                    #         appt_data = supabase.table("appointments") \
-                    #             .select("appointment_date, appointment_time") \
-                    #             .eq("appointment_id", int(appointment_id)) \
-                    #             .single() \
-                    #             .execute()
-                    #         if appt_data.data:
-                    #             appt_date = appt_data.data["appointment_date"]  # e.g. "2025-08-09"
-                    #             appt_time = appt_data.data["appointment_time"]  # e.g. "09:00:00"
-                    #             dt = datetime.strptime(f"{appt_date} {appt_time}", "%Y-%m-%d %H:%M:%S")
-                    #             ms = "000"
-                    #             corrected_audio_id = f"{appointment_id}_{dt.strftime('%Y-%m-%dT%H-%M-%S-')}{ms}Z"
-                    #             if corrected_audio_id != audio_id:
-                    #                 print(f"[{datetime.now()}] Correcting audio_id from {audio_id} to {corrected_audio_id}")
-                    #                 audio_id = corrected_audio_id
-                    # except Exception as e:
-                    #     print(f"[{datetime.now()}] Could not correct audio_id: {e}")
-
-                    # Save transcript to file 
-                    transcript_path = save_transcript(audio_id, transcript_text)
-                    print(f"[{datetime.now()}] Saved transcript to: {transcript_path}")
-
-                    # Update file metadata with completion
-                    completion_data = {
-                        # "transcript": transcript_text,
-                        "status": "completed",  # IMPORTANT: UI expects "completed"
-                        "completed_at": datetime.now().isoformat(),
-                        "transcript_path": transcript_path,
-                    }
-                    update_metadata_json(audio_id, completion_data)
-
-                    # ====== Update DB: audio_recordings + transcriptions (with metadata fields) ======
-                    try:
-                        supabase = get_supabase_client()
-
-                        # 1) Mark audio as transcribed
-                        supabase.table("audio_recordings") \
-                            .update({"status": "transcribed"}) \
-                            .eq("audio_id", audio_id) \
-                            .execute()
-
-                        # 2) Prepare metadata for transcriptions insert
-                        meeting_type_raw = metadata.get("meeting_type") or "GP"
-                        meeting_type = str(meeting_type_raw).upper()
-
-                        # appointment_time in table is TIME -> need "HH:MM:SS"
-                        appt_iso = metadata.get("appointment_time")  # e.g. "2025-08-09T09:00:00Z"
-                        appt_time_only = None
-                        if appt_iso:
-                            try:
-                                appt_time_only = appt_iso.split("T", 1)[1].split("Z", 1)[0][:8]
-                            except Exception:
-                                appt_time_only = None
-
-                        transcription_record = {
-                            "audio_id": audio_id,
-                            "transcript_filename": f"{audio_id}.txt",
-                            "metadata_filename": f"{audio_id}.json",
-                            "transcript_storage_path": transcript_path,
-                            "transcribed_at": datetime.now().isoformat(),
-
-                            # New fields
-                            "appointment_time": appt_time_only,                         # "HH:MM:SS" or None
-                            "location": metadata.get("location"),                       # from appointments.room
-                            "role": metadata.get("role"),                               # from users.role
-                            "no_of_speakers": int(metadata.get("no_of_speakers", 2)),   # default 2
-                            "meeting_type": meeting_type,                                # must match enum casing
-                        }
-
-                        supabase.table("transcriptions").insert(transcription_record).execute()
-                        print(f"[{datetime.now()}] Inserted transcription row for {audio_id}")
-
-                        # Delete audio file after successful transcription
-                        try:
-                            if os.path.exists(audio_path):
-                                os.remove(audio_path)
-                                print(f"[{datetime.now()}] Deleted audio file: {audio_path}")
-                                
-                                # Update deleted_at in audio_recordings
-                                supabase.table("audio_recordings") \
-                                    .update({"deleted_at": datetime.now().isoformat()}) \
-                                    .eq("audio_id", audio_id) \
-                                    .execute()
-                                print(f"[{datetime.now()}] Marked audio as deleted in DB for {audio_id}")
-                            else:
-                                print(f"[{datetime.now()}] Audio file already missing: {audio_path}")
-                        except Exception as delete_err:
-                            print(f"[{datetime.now()}] Error deleting audio or updating DB: {delete_err}")
-
-                    except Exception as db_error:
-                        print(f"[{datetime.now()}] Failed to update database with completion: {db_error}")
-
-                    print(f"[{datetime.now()}] ✓ Completed transcription for {audio_id}")
-
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"[{datetime.now()}] ✗ Error processing {audio_id}: {error_msg}")
-
-                    # Update file metadata with error
-                    update_metadata_json(
-                        audio_id,
-                        {"status": "error", "error": error_msg, "error_at": datetime.now().isoformat()},
+    for endpoint in model_router.endpoints:
+        pinned = f" (meeting types: {', '.join(sorted(endpoint.meeting_types))})" if endpoint.meeting_types else ""
+        print(f"  - Model endpoint: {endpoint.url}{pinned}")
+    model_router.start()
+
+    # New transcripts become searchable as soon as they are saved
+    add_transcript_listener(search_index.index_transcript)
+
+    # Completed jobs feed the real-time factor behind job deadlines (job_deadlines.py)
+    job_index.rebuild()
+    add_metadata_listener(job_index.apply)
+    process_started_at = datetime.now()
+    last_watchdog = 0.0
+    last_eta_refresh = 0.0
+
+    converter = ThreadPoolExecutor(max_workers=CONVERSION_WORKERS, thread_name_prefix="convert")
+    workers = ThreadPoolExecutor(max_workers=QUEUE_WORKERS, thread_name_prefix="job")
+    in_flight: Dict[str, Future] = {}
+
+    try:
+        while not stop_event.is_set():
+            try:
+                # Forget finished jobs
+                for audio_id in [a for a, f in in_flight.items() if f.done()]:
+                    in_flight.pop(audio_id)
+
+                # Requeue jobs left processing by a crash or a hung call
+                if time.monotonic() - last_watchdog >= WATCHDOG_INTERVAL_SECONDS:
+                    last_watchdog = time.monotonic()
+                    recover_stuck_jobs(find_jobs("processing"), set(in_flight), process_started_at)
+
+                if time.monotonic() - last_eta_refresh >= ETA_REFRESH_SECONDS:
+                    last_eta_refresh = time.monotonic()
+                    estimator.refresh()
+
+                queued_items = [
+                    (audio_id, metadata) for audio_id, metadata in find_queued_jobs()
+                    if audio_id not in in_flight
+                ]
+                print(f"[{datetime.now()}] Found {len(queued_items)} new items queued for processing")
+                queued_items = select_jobs(queued_items, len(in_flight))
+
+                # Start converting every queued upload up front; each job waits
+                # for its own conversion only when a worker picks it up
+                for audio_id, metadata in queued_items:
+                    conversion = converter.submit(
+                        prepare_audio, audio_id, metadata.get("traceparent"),
+                        metadata.get("profile") or metadata.get("meeting_type"),
                     )
-
-                    # Update DB with error
-                    try:
-                        supabase = get_supabase_client()
-                        supabase.table("audio_recordings") \
-                            .update({"status": "error"}) \
-                            .eq("audio_id", audio_id) \
-                            .execute()
-                        print(f"[{datetime.now()}] Updated database status to error for {audio_id}")
-                    except Exception as db_error:
-                        print(f"[{datetime.now()}] Failed to update database error status: {db_error}")
-
-            # Sleep before checking again
-            if len(queued_items) == 0:
-                print(f"[{datetime.now()}] No items in queue, sleeping for 5 seconds...")
-            time.sleep(5)
-
-        except Exception as e:
-            print(f"[{datetime.now()}] ✗ Queue processor error: {str(e)}")
-            print(f"[{datetime.now()}] Sleeping for 10 seconds before retry...")
-            time.sleep(10)
+                    in_flight[audio_id] = workers.submit(process_job, audio_id, metadata, conversion)
+
+                # Sleep before checking again
+                if len(queued_items) == 0 and not in_flight:
+                    print(f"[{datetime.now()}] No items in queue, sleeping for {QUEUE_POLL_SECONDS:g} seconds...")
+                stop_event.wait(QUEUE_POLL_SECONDS)
+
+            except Exception as e:
+                print(f"[{datetime.now()}] ✗ Queue processor error: {str(e)}")
+                print(f"[{datetime.now()}] Sleeping for 10 seconds before retry...")
+                stop_event.wait(10)
+    finally:
+        workers.shutdown(wait=True)
+        converter.shutdown(wait=True)
 
 
 if __name__ == "__main__":
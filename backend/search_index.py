@@ -0,0 +1,361 @@
+# search_index.py
+"""
+Full-text search over transcripts (SQLite FTS5).
+
+Every transcript line ("[CLINICIAN 00:03.2 - 00:10.5]: text") is one row in
+segment_rows, mirrored into the segments_fts index by triggers. The index is
+kept current through utils.add_transcript_listener: a new transcript or an
+edit only rewrites the lines that changed, so there is never a full rescan.
+A search is two queries. The first ranks transcripts: each word of the query
+is looked up in the FTS index on its own, restricted by the per-transcript
+fields (user, meeting type, appointment date) and speaker label, and only
+transcripts where every word matches somewhere, not necessarily on the same
+line, are kept, ordered by the sum of each word's best line score. The second
+builds snippets, for the returned page of transcripts only; they are
+HTML-escaped, with the matched words wrapped in <mark>.
+
+The database lives next to the transcripts so the backend and the queue
+processor share it; WAL mode lets searches run while either one writes.
+"""
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import TRANSCRIPTION_FILES_DIR
+from utils import load_metadata_json
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(TRANSCRIPTION_FILES_DIR, "search_index.sqlite3"))
+
+# FTS5 wraps hits in these private-use characters; highlight() escapes the
+# text and only then turns them into <mark> tags
+SNIPPET_OPEN = "\ue000"
+SNIPPET_CLOSE = "\ue001"
+SNIPPET_TOKENS = 16
+# Words beyond this are ignored (each word is a subquery; SQLite caps compound SELECTs)
+MAX_QUERY_TERMS = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    audio_id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    appointment_id INTEGER,
+    meeting_type TEXT,
+    appointment_date TEXT,
+    version INTEGER NOT NULL,
+    indexed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_user_date ON transcripts (user_id, appointment_date);
+
+CREATE TABLE IF NOT EXISTS segment_rows (
+    id INTEGER PRIMARY KEY,
+    audio_id TEXT NOT NULL,
+    line_no INTEGER NOT NULL,
+    speaker TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    text TEXT NOT NULL,
+    UNIQUE (audio_id, line_no)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text,
+    content='segment_rows',
+    content_rowid='id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS segment_rows_ai AFTER INSERT ON segment_rows BEGIN
+    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segment_rows_ad AFTER DELETE ON segment_rows BEGIN
+    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segment_rows_au AFTER UPDATE ON segment_rows BEGIN
+    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+# Lines matching one word of the query, within the filters. RANK_SQL unions
+# one of these per word, then keeps transcripts that every word matched.
+TERM_HITS_SQL = """
+    SELECT {term} AS term, r.audio_id, bm25(segments_fts) AS score
+    FROM segments_fts
+    JOIN segment_rows r ON r.id = segments_fts.rowid
+    JOIN transcripts t ON t.audio_id = r.audio_id
+    WHERE segments_fts MATCH :term{term}
+      AND (:user_id IS NULL OR t.user_id = :user_id)
+      AND (:meeting_type IS NULL OR t.meeting_type = :meeting_type)
+      AND (:date_from IS NULL OR t.appointment_date >= :date_from)
+      AND (:date_to IS NULL OR t.appointment_date <= :date_to)
+      AND (:speaker IS NULL OR r.speaker = :speaker)
+"""
+
+RANK_SQL = """
+WITH term_hits AS MATERIALIZED (
+{term_hits}
+), best AS (
+    SELECT audio_id, term, MIN(score) AS score
+    FROM term_hits
+    GROUP BY audio_id, term
+)
+SELECT b.audio_id, t.user_id, t.appointment_id, t.meeting_type, t.appointment_date, SUM(b.score) AS score
+FROM best b
+JOIN transcripts t ON t.audio_id = b.audio_id
+GROUP BY b.audio_id
+HAVING COUNT(*) = :terms
+ORDER BY score
+LIMIT :limit OFFSET :offset
+"""
+
+# Best line per transcript of the page (most query words, by bm25), with a
+# snippet computed for that line alone. SQLite returns the bare rowid from
+# the row that produced MIN(score).
+SNIPPET_SQL = """
+WITH lines AS MATERIALIZED (
+    SELECT r.audio_id, segments_fts.rowid AS rowid, bm25(segments_fts) AS score
+    FROM segments_fts
+    JOIN segment_rows r ON r.id = segments_fts.rowid
+    WHERE segments_fts MATCH :query
+      AND r.audio_id IN (SELECT value FROM json_each(:audio_ids))
+      AND (:speaker IS NULL OR r.speaker = :speaker)
+), best AS (
+    SELECT audio_id, rowid, MIN(score) AS score, COUNT(*) AS matches
+    FROM lines
+    GROUP BY audio_id
+)
+SELECT best.audio_id, r.speaker, r.start_time, r.end_time,
+       snippet(segments_fts, 0, :open, :close, '…', :tokens) AS snippet, best.matches
+FROM segments_fts
+JOIN best ON best.rowid = segments_fts.rowid
+JOIN segment_rows r ON r.id = best.rowid
+WHERE segments_fts MATCH :query
+"""
+
+_LINE_RE = re.compile(r"^\[(\S+) (\d+:\d+(?:\.\d+)?) - (\d+:\d+(?:\.\d+)?)\]:\s*(.*)$")
+
+
+def parse_segments(text: str) -> List[Tuple[Optional[str], Optional[str], Optional[str], str]]:
+    """Split a transcript into (speaker, start, end, text) per non-empty line."""
+    segments = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = _LINE_RE.match(line)
+        if match:
+            segments.append(match.groups())
+        else:
+            segments.append((None, None, None, line))
+    return segments
+
+
+_HIT_RE = re.compile(f"{SNIPPET_OPEN}(.*?){SNIPPET_CLOSE}", re.S)
+
+
+def highlight(snippet: Optional[str]) -> Optional[str]:
+    """HTML-escape an FTS5 snippet and wrap its hits in <mark>; stray delimiters are dropped."""
+    if snippet is None:
+        return None
+    parts = _HIT_RE.split(snippet)
+    out = []
+    for i, part in enumerate(parts):
+        part = html.escape(part.replace(SNIPPET_OPEN, "").replace(SNIPPET_CLOSE, ""))
+        out.append(f"<mark>{part}</mark>" if i % 2 else part)
+    return "".join(out)
+
+
+def to_match_terms(query: str) -> List[str]:
+    """
+    Turn free text into one FTS5 query per distinct word: a trailing * means
+    prefix match, and FTS operators typed by users are taken literally.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        term = f'"{word}"' + ("*" if prefix else "")
+        if word and term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+class SearchIndex:
+    def __init__(self, path: str = SEARCH_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def index_transcript(self, audio_id: str, text: str, version: int) -> None:
+        """Bring one transcript's rows in line with text, touching only changed lines."""
+        metadata = load_metadata_json(audio_id) or {}
+        appointment_time = metadata.get("appointment_time") or metadata.get("created_at") or ""
+        meeting_type = metadata.get("meeting_type")
+        segments = parse_segments(text)
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """
+                INSERT INTO transcripts (audio_id, user_id, appointment_id, meeting_type,
+                                         appointment_date, version, indexed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (audio_id) DO UPDATE SET
+                    user_id = excluded.user_id,
+                    appointment_id = excluded.appointment_id,
+                    meeting_type = excluded.meeting_type,
+                    appointment_date = excluded.appointment_date,
+                    version = excluded.version,
+                    indexed_at = excluded.indexed_at
+                """,
+                (
+                    audio_id,
+                    metadata.get("user_id"),
+                    metadata.get("appointment_id"),
+                    str(meeting_type).lower() if meeting_type else None,
+                    str(appointment_time)[:10] or None,
+                    version,
+                    datetime.now().isoformat(),
+                ),
+            )
+
+            existing = {
+                row["line_no"]: tuple(row)[1:]
+                for row in conn.execute(
+                    "SELECT line_no, speaker, start_time, end_time, text FROM segment_rows WHERE audio_id = ?",
+                    (audio_id,),
+                )
+            }
+            for line_no, segment in enumerate(segments):
+                old = existing.pop(line_no, None)
+                if old is None:
+                    conn.execute(
+                        "INSERT INTO segment_rows (audio_id, line_no, speaker, start_time, end_time, text) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (audio_id, line_no, *segment),
+                    )
+                elif old != tuple(segment):
+                    conn.execute(
+                        "UPDATE segment_rows SET speaker = ?, start_time = ?, end_time = ?, text = ? "
+                        "WHERE audio_id = ? AND line_no = ?",
+                        (*segment, audio_id, line_no),
+                    )
+            if existing:
+                conn.executemany(
+                    "DELETE FROM segment_rows WHERE audio_id = ? AND line_no = ?",
+                    [(audio_id, line_no) for line_no in existing],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove(self, audio_id: str) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM segment_rows WHERE audio_id = ?", (audio_id,))
+            conn.execute("DELETE FROM transcripts WHERE audio_id = ?", (audio_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def backfill(self) -> int:
+        """Index transcripts written before the index existed (or while it was unavailable)."""
+        from transcript_store import read_state  # transcript_store imports utils
+
+        indexed = {row[0] for row in self._conn().execute("SELECT audio_id FROM transcripts")}
+        added = 0
+        for name in os.listdir(TRANSCRIPTION_FILES_DIR):
+            if not name.endswith(".txt"):
+                continue
+            audio_id = name[:-len(".txt")]
+            if audio_id in indexed:
+                continue
+            state = read_state(audio_id)
+            if state is None:
+                continue
+            try:
+                self.index_transcript(audio_id, state.text, state.version)
+                added += 1
+            except Exception as e:
+                print(f"[{datetime.now()}] Failed to index transcript {audio_id}: {e}")
+        return added
+
+    def search(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        meeting_type: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        speaker: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """Transcripts matching every word of query, best first, with a highlighted snippet."""
+        terms = to_match_terms(query)
+        if not terms:
+            return []
+        conn = self._conn()
+        params = {f"term{i}": term for i, term in enumerate(terms)}
+        params.update({
+            "terms": len(terms),
+            "user_id": user_id,
+            "meeting_type": meeting_type.lower() if meeting_type else None,
+            "date_from": date_from,
+            "date_to": date_to,
+            "speaker": speaker,
+            "limit": limit,
+            "offset": offset,
+        })
+        sql = RANK_SQL.format(term_hits="    UNION ALL".join(
+            TERM_HITS_SQL.format(term=i) for i in range(len(terms))
+        ))
+        results = [dict(row) for row in conn.execute(sql, params).fetchall()]
+        if not results:
+            return []
+
+        snippets = {
+            row["audio_id"]: dict(row)
+            for row in conn.execute(SNIPPET_SQL, {
+                "query": " OR ".join(terms),
+                "audio_ids": json.dumps([r["audio_id"] for r in results]),
+                "speaker": speaker,
+                "open": SNIPPET_OPEN,
+                "close": SNIPPET_CLOSE,
+                "tokens": SNIPPET_TOKENS,
+            })
+        }
+        for result in results:
+            best = snippets.get(result["audio_id"], {})
+            for key in ("speaker", "start_time", "end_time", "matches"):
+                result[key] = best.get(key)
+            result["snippet"] = highlight(best.get("snippet"))
+        return results
+
+
+search_index = SearchIndex()
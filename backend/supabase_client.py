@@ -1,25 +1,86 @@
 import os
+import threading
+from contextvars import ContextVar
 from supabase import create_client, Client
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Hashable, Tuple
+from cache import user_cache, appointment_cache
+
+# One client per process. The client keeps a single httpx session underneath,
+# so reusing it gives us keep-alive and HTTP/2 instead of a fresh TLS
+# handshake for every query.
+_client: Optional[Client] = None
+_client_lock = threading.Lock()
+
+# Per-request memo, installed by the HTTP middleware in main.py. Outside of a
+# request (e.g. the queue processor) there is no memo and lookups go straight
+# to the database.
+_request_memo: ContextVar[Optional[Dict[Hashable, Any]]] = ContextVar("supabase_request_memo", default=None)
 
 
 def get_supabase_client() -> Client:
-    """Create Supabase client using env vars."""
-    url = os.getenv("SUPABASE_URL")
-    # Prefer service role; if you insist on anon while RLS is off, set SUPABASE_ANON_KEY in env and fallback to it.
-    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
-    if not url or not key:
-        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY/ANON_KEY")
-    return create_client(url, key)
-    
+    """Return the process-wide Supabase client, creating it on first use."""
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            url = os.getenv("SUPABASE_URL")
+            # Prefer service role; if you insist on anon while RLS is off, set SUPABASE_ANON_KEY in env and fallback to it.
+            key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+            if not url or not key:
+                raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY/ANON_KEY")
+            _client = create_client(url, key)
+    return _client
+
+def begin_request_scope():
+    """Start a fresh query memo for the current request. Returns a reset token."""
+    return _request_memo.set({})
+
+def end_request_scope(token) -> None:
+    """Drop the memo created by begin_request_scope."""
+    _request_memo.reset(token)
+
+def memoized(key: Hashable, loader: Callable[[], Any]) -> Any:
+    """Run loader() at most once per request for the given key."""
+    memo = _request_memo.get()
+    if memo is None:
+        return loader()
+    if key not in memo:
+        memo[key] = loader()
+    return memo[key]
+
+def get_user_row(user_id: int) -> Optional[Dict[str, Any]]:
+    """Get the users row (name, role, location) for a user, cached and memoised per request"""
+    user_id = int(user_id)
+    def load():
+        supabase = get_supabase_client()
+        response = supabase.table('users').select(
+            'user_id, first_name, last_name, role, location'
+        ).eq('user_id', user_id).limit(1).execute()
+        return response.data[0] if response.data else None
+    return memoized(('users', user_id), lambda: user_cache.get_or_load(user_id, load))
+
+def get_appointment_row(appointment_id: int) -> Optional[Dict[str, Any]]:
+    """Get the raw appointments row, cached and memoised per request"""
+    appointment_id = int(appointment_id)
+    def load():
+        supabase = get_supabase_client()
+        response = supabase.table('appointments').select(
+            'appointment_id, user_id, patient_name, room, appointment_date, appointment_time, meeting_type, is_dummy'
+        ).eq('appointment_id', appointment_id).limit(1).execute()
+        return response.data[0] if response.data else None
+    return memoized(('appointments', appointment_id), lambda: appointment_cache.get_or_load(('row', appointment_id), load))
+
 def get_appointment_by_id(appointment_id: int) -> Optional[Dict[str, Any]]:
     """Get appointment details by ID"""
     try:
-        supabase = get_supabase_client()
-        
-        response = supabase.table('appointments').select(
-            'appointment_id, patient_name, room, appointment_date, appointment_time, user_id, users(first_name, last_name)'
-        ).eq('appointment_id', appointment_id).execute()
+        def load():
+            supabase = get_supabase_client()
+            return supabase.table('appointments').select(
+                'appointment_id, patient_name, room, appointment_date, appointment_time, user_id, users(first_name, last_name)'
+            ).eq('appointment_id', appointment_id).execute()
+
+        response = memoized(('appointment_details', int(appointment_id)), load)
         
         if response.data and len(response.data) > 0:
             row = response.data[0]
@@ -40,17 +101,27 @@ def get_appointment_by_id(appointment_id: int) -> Optional[Dict[str, Any]]:
         print(f"Supabase error: {e}")
     return None
 
-def get_appointments_by_user(user_id: int, is_dummy: bool = None) -> List[Dict[str, Any]]:
-    """Get appointments for a specific user, optionally filtered by is_dummy"""
+def get_appointments_by_user(
+    user_id: int,
+    is_dummy: bool = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    after: Optional[Tuple[str, str, int]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Get appointments for a specific user in (date, time, id) order, optionally
+    filtered by is_dummy and an inclusive date window. `after` is the
+    (date, time, appointment_id) of the last row already seen (keyset cursor).
+    """
     try:
         supabase = get_supabase_client()
         
         # First get user details to derive doctor name
-        user_response = supabase.table('users').select('first_name, last_name').eq('user_id', user_id).single().execute()
-        if not user_response.data:
+        user_data = get_user_row(user_id)
+        if not user_data:
             return []  # User not found
         
-        user_data = user_response.data
         doctor_name = f"Dr. {user_data['first_name']} {user_data['last_name']}"
         
         query = supabase.table('appointments').select(
@@ -59,8 +130,24 @@ def get_appointments_by_user(user_id: int, is_dummy: bool = None) -> List[Dict[s
         
         if is_dummy is not None:
             query = query.eq('is_dummy', is_dummy)
+        if date_from:
+            query = query.gte('appointment_date', date_from)
+        if date_to:
+            query = query.lte('appointment_date', date_to)
+        if after:
+            after_date, after_time, after_id = after
+            query = query.or_(
+                f"appointment_date.gt.{after_date},"
+                f"and(appointment_date.eq.{after_date},appointment_time.gt.{after_time}),"
+                f"and(appointment_date.eq.{after_date},appointment_time.eq.{after_time},appointment_id.gt.{int(after_id)})"
+            )
             
-        response = query.order('appointment_date', desc=False).order('appointment_time', desc=False).execute()
+        query = query.order('appointment_date', desc=False) \
+            .order('appointment_time', desc=False) \
+            .order('appointment_id', desc=False)
+        if limit is not None:
+            query = query.limit(limit)
+        response = query.execute()
         
         return [{
             'id': str(row['appointment_id']),
@@ -122,3 +209,67 @@ def get_transcription_by_appointment(appointment_id: int) -> Optional[Dict[str,
     except Exception as e:
         print(f"Supabase error: {e}")
     return None
+
+def get_appointment_status_rows(
+    appointment_ids: Optional[List[int]] = None,
+    user_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Get the inputs for appointment status for many appointments in one query.
+
+    Embeds audio_recordings and their transcriptions under each appointment,
+    so PostgREST resolves everything with a single joined SELECT. Returns
+    [{"appointment_id", "audio_status", "transcribed"}] where audio_status is
+    the status of the latest recording (or None).
+    """
+    supabase = get_supabase_client()
+    query = supabase.table('appointments').select(
+        'appointment_id, audio_recordings(status, upload_time, transcriptions(transcription_id))'
+    )
+    if appointment_ids:
+        query = query.in_('appointment_id', appointment_ids)
+    if user_id is not None:
+        query = query.eq('user_id', user_id)
+    if date_from:
+        query = query.gte('appointment_date', date_from)
+    if date_to:
+        query = query.lte('appointment_date', date_to)
+    response = query.execute()
+
+    rows = []
+    for row in response.data or []:
+        recordings = row.get('audio_recordings') or []
+        latest = max(recordings, key=lambda r: r.get('upload_time') or '', default=None)
+        rows.append({
+            'appointment_id': row['appointment_id'],
+            'audio_status': latest['status'] if latest else None,
+            'transcribed': any(r.get('transcriptions') for r in recordings),
+        })
+    return rows
+
+def get_user_ids_with_appointments_on(day: str) -> List[int]:
+    """Get the ids of users with at least one appointment on the given date"""
+    supabase = get_supabase_client()
+    response = supabase.table('appointments').select('user_id').eq('appointment_date', day).execute()
+    return sorted({row['user_id'] for row in response.data or []})
+
+# Columns of the appointments unique constraint used for duplicate detection
+APPOINTMENT_UNIQUE_COLUMNS = "patient_name,room,appointment_date,appointment_time,meeting_type"
+
+def insert_appointments(rows: List[Dict[str, Any]]) -> int:
+    """
+    Insert many appointments in one request, skipping duplicates.
+
+    Sent as a multi-row upsert with ignore_duplicates, which PostgREST runs as
+    INSERT ... ON CONFLICT DO NOTHING; only rows actually inserted come back,
+    so the return value is the inserted count.
+    """
+    if not rows:
+        return 0
+    supabase = get_supabase_client()
+    response = supabase.table('appointments').upsert(
+        rows, on_conflict=APPOINTMENT_UNIQUE_COLUMNS, ignore_duplicates=True
+    ).execute()
+    return len(response.data or [])
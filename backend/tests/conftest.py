@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other by bare name, as they do when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def transcripts_dir(tmp_path, monkeypatch):
+    """Point transcript storage at a fresh temp directory."""
+    import utils
+
+    monkeypatch.setattr(utils, "TRANSCRIPTION_FILES_DIR", str(tmp_path))
+    return tmp_path
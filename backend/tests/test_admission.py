@@ -0,0 +1,27 @@
+import json
+
+import admission
+import utils
+from admission import ETA_DEFAULT_RTF, CompletionEstimator
+from job_index import JobIndex
+
+
+def test_rtf_only_changes_on_refresh(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "JSON_FILES_DIR", str(tmp_path))
+    for audio_id, total_s in (("a", 30), ("b", 60), ("c", 90)):
+        with open(tmp_path / f"{audio_id}.json", "w") as f:
+            json.dump({"status": "completed", "duration_s": 60, "timings": {"total_s": total_s}}, f)
+    index = JobIndex(str(tmp_path))
+    index.rebuild()
+    estimator = CompletionEstimator(index, workers=1)
+
+    reads = []
+    load = admission.load_metadata_json
+    monkeypatch.setattr(admission, "load_metadata_json", lambda audio_id: reads.append(audio_id) or load(audio_id))
+    assert estimator.rtf() == ETA_DEFAULT_RTF
+    estimator.estimate(60)
+    assert reads == []
+
+    estimator.refresh()
+    assert estimator.rtf() == 1.0
+    assert sorted(reads) == ["a", "b", "c"]
@@ -0,0 +1,70 @@
+import json
+
+import job_index as job_index_module
+from job_index import JobIndex
+
+
+def write_metadata(directory, audio_id, **fields):
+    with open(directory / f"{audio_id}.json", "w") as f:
+        json.dump(fields, f)
+
+
+def scan_with(monkeypatch, during_scan):
+    """Make the next rebuild run during_scan() after it has listed the files."""
+    real_glob = job_index_module.glob.glob
+
+    def glob_then_change(pattern):
+        files = real_glob(pattern)
+        during_scan()
+        return files
+
+    monkeypatch.setattr(job_index_module.glob, "glob", glob_then_change)
+
+
+def test_rebuild_reads_metadata(tmp_path):
+    write_metadata(tmp_path, "a", status="queued", user_id=1)
+    (tmp_path / "b.json").write_text("{not json")
+    index = JobIndex(str(tmp_path))
+    index.rebuild()
+    assert index.get("a") == {"audio_id": "a", "status": "queued", "user_id": 1}
+    assert index.get("b")["status"] == "error"
+    assert index.counts() == {"queued": 1, "error": 1}
+
+
+def test_apply_tracks_counts_and_clears_none_fields():
+    index = JobIndex("/nonexistent")
+    index.apply("a", {"status": "processing", "error": "old"})
+    index.apply("a", {"status": "completed", "error": None})
+    assert index.get("a") == {"audio_id": "a", "status": "completed"}
+    assert index.counts() == {"completed": 1}
+    index.remove("a")
+    assert index.counts() == {}
+
+
+def test_rebuild_keeps_changes_applied_during_scan(tmp_path, monkeypatch):
+    write_metadata(tmp_path, "a", status="processing")
+    write_metadata(tmp_path, "b", status="queued")
+    index = JobIndex(str(tmp_path))
+    index.rebuild()
+
+    def during_scan():
+        index.apply("a", {"status": "completed"})
+        index.remove("b")
+        index.apply("c", {"status": "queued"})
+
+    scan_with(monkeypatch, during_scan)
+    index.rebuild()
+    assert index.get("a")["status"] == "completed"
+    assert index.get("b") is None
+    assert index.get("c")["status"] == "queued"
+    assert index.counts() == {"completed": 1, "queued": 1}
+
+
+def test_changes_after_rebuild_are_not_replayed(tmp_path):
+    write_metadata(tmp_path, "a", status="queued")
+    index = JobIndex(str(tmp_path))
+    index.rebuild()
+    index.apply("a", {"status": "completed"})
+    write_metadata(tmp_path, "a", status="failed")
+    index.rebuild()
+    assert index.get("a")["status"] == "failed"
@@ -0,0 +1,34 @@
+import pytest
+
+from search_index import SNIPPET_CLOSE, SNIPPET_OPEN, SearchIndex, highlight
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SearchIndex(str(tmp_path / "search.sqlite3"))
+
+
+def test_highlight_escapes_text_and_marks_hits():
+    snippet = f"<b>take {SNIPPET_OPEN}aspirin{SNIPPET_CLOSE} & rest{SNIPPET_OPEN}"
+    assert highlight(snippet) == "&lt;b&gt;take <mark>aspirin</mark> &amp; rest"
+
+
+def test_search_snippet_is_html_escaped(index):
+    index.index_transcript(
+        "a",
+        "[CLINICIAN 00:00.0 - 00:04.0]: <script>alert(1)</script> take aspirin\n"
+        "[SPEAKER_01 00:04.0 - 00:06.0]: thank you",
+        1,
+    )
+    [result] = index.search("aspirin")
+    assert result["speaker"] == "CLINICIAN"
+    assert "<script>" not in result["snippet"]
+    assert "&lt;script&gt;" in result["snippet"]
+    assert "<mark>aspirin</mark>" in result["snippet"]
+
+
+def test_search_requires_every_word(index):
+    index.index_transcript("a", "[CLINICIAN 00:00.0 - 00:04.0]: take aspirin\n[SPEAKER_01 00:04.0 - 00:06.0]: daily", 1)
+    index.index_transcript("b", "[CLINICIAN 00:00.0 - 00:04.0]: take aspirin", 1)
+    assert [r["audio_id"] for r in index.search("aspirin daily")] == ["a"]
+    assert [r["audio_id"] for r in index.search("daily", speaker="CLINICIAN")] == []
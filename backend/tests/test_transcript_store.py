@@ -0,0 +1,125 @@
+import json
+import os
+
+import pytest
+
+import transcript_store
+import utils
+from transcript_store import EditConflict, InvalidEdit, apply_ops, apply_patch, read_state, replace_text
+
+
+def insert(pos, text):
+    return [{"pos": pos, "delete": 0, "insert": text}]
+
+
+def test_apply_ops_in_order():
+    ops = [{"pos": 0, "delete": 5, "insert": "Goodbye"}, {"pos": 7, "delete": 0, "insert": ","}]
+    assert apply_ops("Hello world", ops) == "Goodbye, world"
+
+
+@pytest.mark.parametrize("op", [
+    {"pos": -1, "delete": 0, "insert": "x"},
+    {"pos": 3, "delete": 3, "insert": ""},
+    {"pos": "a", "delete": 0, "insert": ""},
+    "not an op",
+])
+def test_apply_ops_rejects_bad_ops(op):
+    with pytest.raises(InvalidEdit):
+        apply_ops("abcd", [op])
+
+
+def test_read_state_without_transcript(transcripts_dir):
+    assert read_state("missing") is None
+
+
+def test_patches_are_logged_and_replayed(transcripts_dir):
+    utils.save_transcript("a1", "hello world")
+    state = read_state("a1")
+    assert (state.text, state.version) == ("hello world", 0)
+
+    state = apply_patch("a1", 0, insert(5, ","), state)
+    state = apply_patch("a1", 1, insert(0, "Oh, "), state)
+
+    fresh = read_state("a1")
+    assert (fresh.text, fresh.version) == ("Oh, hello, world", 2)
+    assert fresh.log_size == os.path.getsize(utils._edits_path("a1"))
+
+
+def test_patch_against_old_version_conflicts(transcripts_dir):
+    utils.save_transcript("a1", "hello")
+    apply_patch("a1", 0, insert(5, "!"))
+    with pytest.raises(EditConflict) as conflict:
+        apply_patch("a1", 0, insert(0, "x"))
+    assert conflict.value.current_version == 1
+
+
+def test_snapshot_empties_the_log(transcripts_dir, monkeypatch):
+    monkeypatch.setattr(transcript_store, "TRANSCRIPT_SNAPSHOT_EVERY", 3)
+    utils.save_transcript("a1", "")
+    state = read_state("a1")
+    for i in range(4):
+        state = apply_patch("a1", state.version, insert(0, str(i)), state)
+
+    with open(utils._edits_path("a1"), "rb") as f:
+        assert len(f.read().splitlines()) == 1
+    with open(utils._txt_path("a1"), encoding="utf-8") as f:
+        assert f.read() == "210"
+    fresh = read_state("a1")
+    assert (fresh.text, fresh.version) == ("3210", 4)
+
+
+def test_log_entries_covered_by_snapshot_are_skipped(transcripts_dir, monkeypatch):
+    monkeypatch.setattr(transcript_store, "TRANSCRIPT_SNAPSHOT_EVERY", 2)
+    utils.save_transcript("a1", "")
+    apply_patch("a1", 0, insert(0, "a"))
+    apply_patch("a1", 1, insert(1, "b"))
+    # A crash after the snapshot was written but before the log was emptied
+    with open(utils._edits_path("a1"), "ab") as f:
+        for version, text in ((1, "a"), (2, "b")):
+            f.write((json.dumps({"version": version, "at": 0, "ops": insert(0, text)}) + "\n").encode())
+
+    assert (read_state("a1").text, read_state("a1").version) == ("ab", 2)
+    state = apply_patch("a1", 2, insert(2, "c"))
+    assert read_state("a1").text == state.text == "abc"
+
+
+def test_torn_line_then_append(transcripts_dir):
+    utils.save_transcript("a1", "hello")
+    apply_patch("a1", 0, insert(5, " world"))
+    # A crash mid-append leaves a final line without its newline
+    with open(utils._edits_path("a1"), "ab") as f:
+        f.write(b'{"version": 2, "at": 0, "ops": [{"pos": 0, "del')
+
+    torn = read_state("a1")
+    assert (torn.text, torn.version) == ("hello world", 1)
+
+    state = apply_patch("a1", 1, insert(11, "!"))
+    assert state.text == "hello world!"
+    fresh = read_state("a1")
+    assert (fresh.text, fresh.version) == ("hello world!", 2)
+    apply_patch("a1", 2, insert(0, ">"))
+    assert read_state("a1").text == ">hello world!"
+
+
+def test_replace_is_a_snapshot_not_a_log_entry(transcripts_dir):
+    utils.save_transcript("a1", "draft")
+    stale = apply_patch("a1", 0, insert(5, "!"))
+    state = replace_text("a1", "final text", stale)
+
+    assert state.version == 2
+    assert os.path.getsize(utils._edits_path("a1")) == 0
+    assert read_state("a1").text == "final text"
+    # A state cached before the replace must not be reused
+    with pytest.raises(EditConflict):
+        apply_patch("a1", stale.version, insert(0, "x"), stale)
+
+
+def test_new_model_transcript_starts_over(transcripts_dir):
+    utils.save_transcript("a1", "first")
+    apply_patch("a1", 0, insert(5, "!"))
+    replace_text("a1", "edited")
+
+    utils.save_transcript("a1", "second")
+    fresh = read_state("a1")
+    assert (fresh.text, fresh.version) == ("second", 0)
+    assert not os.path.exists(utils._snapshot_path("a1"))
@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+
+import upload_sessions
+from upload_sessions import (
+    Appender,
+    OffsetMismatch,
+    UploadFinished,
+    UploadNotFound,
+    create_upload,
+    finish_upload,
+    get_upload,
+)
+
+
+@pytest.fixture(autouse=True)
+def sessions_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_sessions, "UPLOAD_SESSIONS_DIR", str(tmp_path / "partial"))
+    monkeypatch.setattr(upload_sessions, "_raw_path", lambda audio_id: str(tmp_path / f"{audio_id}.upload"))
+    return tmp_path / "partial"
+
+
+def append(upload_id, offset, data):
+    appender = Appender(upload_id, offset)
+    appender.open()
+    try:
+        appender.write(data)
+    finally:
+        appender.close()
+
+
+def test_append_and_finish(tmp_path):
+    upload_id = create_upload({"user_id": "1"}, length=6)["upload_id"]
+    append(upload_id, 0, b"abc")
+    with pytest.raises(OffsetMismatch):
+        append(upload_id, 0, b"def")
+    append(upload_id, 3, b"def")
+    raw_path = finish_upload(upload_id, "job1")
+    assert open(raw_path, "rb").read() == b"abcdef"
+
+
+def test_finish_is_recorded_for_a_retry():
+    upload_id = create_upload({"user_id": "1"})["upload_id"]
+    append(upload_id, 0, b"abc")
+    finish_upload(upload_id, "job1")
+    session = get_upload(upload_id)
+    assert (session["audio_id"], session["offset"]) == ("job1", 3)
+    with pytest.raises(UploadFinished) as e:
+        finish_upload(upload_id, "job2")
+    assert e.value.audio_id == "job1"
+    with pytest.raises(UploadFinished):
+        Appender(upload_id, 3)
+
+
+def test_purge_drops_expired_finished_and_orphaned_uploads(sessions_dir, monkeypatch):
+    finished = create_upload({})["upload_id"]
+    append(finished, 0, b"abc")
+    finish_upload(finished, "job1")
+    orphan = create_upload({})["upload_id"]
+    os.remove(sessions_dir / f"{orphan}.part")
+    live = create_upload({})["upload_id"]
+
+    create_upload({})
+    with pytest.raises(UploadNotFound):
+        get_upload(orphan)
+    assert get_upload(finished)["audio_id"] == "job1"
+
+    old = time.time() - (upload_sessions.UPLOAD_SESSION_TTL_HOURS + 1) * 3600
+    os.utime(sessions_dir / f"{finished}.json", (old, old))
+    create_upload({})
+    with pytest.raises(UploadNotFound):
+        get_upload(finished)
+    assert get_upload(live)["offset"] == 0
@@ -0,0 +1,219 @@
+# tracing.py
+"""
+Lightweight distributed tracing for following one recording end to end.
+
+Trace context is the W3C `traceparent` header
+(00-<32 hex trace id>-<16 hex span id>-01). /transcribe starts (or continues)
+a trace and stores its traceparent in the job metadata; the queue processor
+picks it up from there, and run_model sends it to the model service, which
+continues the same trace (model/app/tracing.py is its copy of this module).
+
+Spans are handed to a background thread and exported as:
+  TRACE_FILE           JSON lines, one span per line
+  TRACE_OTLP_ENDPOINT  an OpenTelemetry collector's OTLP/HTTP JSON endpoint,
+                       e.g. http://otel-collector:4318/v1/traces
+With neither set, spans are still created (so context is propagated) but
+never serialised. Recording a span costs two random ids and a queue put; if
+the exporter falls behind, spans are dropped rather than slowing requests.
+TRACE_SERVICE_NAME names the process in exported spans.
+"""
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "backend")
+TRACE_EXPORT_INTERVAL_SECONDS = float(os.getenv("TRACE_EXPORT_INTERVAL_SECONDS", "2"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+TRACING_ENABLED = bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace_id, span_id) from a traceparent header, or None if absent or malformed."""
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any],
+                 start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        self.end_ns = end_ns or time.time_ns()
+        if TRACING_ENABLED:
+            _exporter.submit(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "service": TRACE_SERVICE_NAME,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def _new_span(name: str, parent: Optional[str], attributes: Dict[str, Any], start_ns: Optional[int] = None) -> Span:
+    context = parse_traceparent(parent)
+    if context is None and parent is None and _current.get() is not None:
+        current = _current.get()
+        context = (current.trace_id, current.span_id)
+    trace_id, parent_id = context if context else (os.urandom(16).hex(), None)
+    return Span(name, trace_id, parent_id, attributes, start_ns)
+
+
+@contextmanager
+def span(name: str, parent: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Time the block as a span. Its parent is the `parent` traceparent if given,
+    else the enclosing span, else it starts a new trace. Exceptions are
+    recorded on the span and re-raised.
+    """
+    current = _new_span(name, parent, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def record_span(name: str, start: float, end: float, parent: Optional[str] = None, **attributes: Any) -> None:
+    """Record a span measured after the fact (start/end in epoch seconds), e.g. time spent queued."""
+    _new_span(name, parent, attributes, start_ns=int(start * 1e9)).end(int(end * 1e9))
+
+
+def current_traceparent() -> Optional[str]:
+    current = _current.get()
+    return current.traceparent if current is not None else None
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "medical-transcription"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [
+                    {"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items() if v is not None
+                ],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+class _Exporter:
+    """Background thread that batches finished spans to TRACE_FILE and/or the collector."""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, finished: Span) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=TRACE_EXPORT_INTERVAL_SECONDS))
+            while len(batch) < 512:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self) -> None:
+        if TRACE_FILE and os.path.dirname(TRACE_FILE):
+            os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+        while True:
+            batch = self._drain()
+            if not batch:
+                continue
+            if TRACE_FILE:
+                try:
+                    with open(TRACE_FILE, "a") as f:
+                        f.writelines(json.dumps(s.to_dict(), default=str) + "\n" for s in batch)
+                except OSError as e:
+                    print(f"Trace export to {TRACE_FILE} failed: {e}")
+            if TRACE_OTLP_ENDPOINT:
+                try:
+                    request = urllib.request.Request(
+                        TRACE_OTLP_ENDPOINT,
+                        data=json.dumps(_otlp_payload(batch), default=str).encode("utf-8"),
+                        headers={"Content-Type": "application/json"},
+                    )
+                    urllib.request.urlopen(request, timeout=5).close()
+                except Exception as e:
+                    print(f"Trace export to {TRACE_OTLP_ENDPOINT} failed: {e}")
+
+
+_exporter = _Exporter()
@@ -0,0 +1,66 @@
+# transcript_cache.py
+"""
+Size-bounded LRU of recently read transcripts.
+
+Entries are transcript_store.TranscriptState objects, whose ETag and
+Last-Modified follow the transcript version, so transcript endpoints can
+answer conditional requests and repeat reads without touching disk. Edits
+made through the store put() their new state; anything else that rewrites a
+transcript must call invalidate().
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from transcript_store import TranscriptState, read_state
+
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+class TranscriptCache:
+    def __init__(self, max_bytes: int = TRANSCRIPT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, TranscriptState]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, audio_id: str) -> Optional[TranscriptState]:
+        """Return the current transcript, reading it from disk only on a miss."""
+        with self._lock:
+            entry = self._entries.get(audio_id)
+            if entry is not None:
+                self._entries.move_to_end(audio_id)
+                return entry
+
+        entry = read_state(audio_id)
+        if entry is None:
+            return None
+        with self._lock:
+            self._put(audio_id, entry)
+        return entry
+
+    def put(self, audio_id: str, entry: TranscriptState) -> None:
+        with self._lock:
+            self._put(audio_id, entry)
+
+    def _put(self, audio_id: str, entry: TranscriptState) -> None:
+        if entry.size > self.max_bytes:
+            return
+        old = self._entries.pop(audio_id, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[audio_id] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def invalidate(self, audio_id: str) -> None:
+        with self._lock:
+            old = self._entries.pop(audio_id, None)
+            if old is not None:
+                self._bytes -= old.size
+
+
+transcript_cache = TranscriptCache()
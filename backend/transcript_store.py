@@ -0,0 +1,228 @@
+# transcript_store.py
+"""
+Versioned transcript storage with delta edits.
+
+Files per recording, in TRANSCRIPTION_FILES_DIR:
+  <audio_id>.txt          the transcript produced by the model (version 0). It is
+                          rewritten at every snapshot, so plain readers are at
+                          most TRANSCRIPT_SNAPSHOT_EVERY edits behind
+  <audio_id>.edits.jsonl  log of the patches accepted since the last
+                          snapshot, one line each; emptied at every snapshot
+  <audio_id>.snap.json    latest snapshot: version and full text
+
+Current text = snapshot (or .txt at version 0) + log entries newer than the
+snapshot's version. A patch appends one small log line instead of rewriting
+the whole document; a full-document save is written as a snapshot only,
+never logged. Every write that replaces a file goes through temp file +
+rename; the log is emptied after the snapshot is in place, so a crash in
+between leaves only entries the snapshot already covers, which readers skip.
+Writers hold a file lock, so the backend and queue processor can't interleave.
+"""
+import json
+import os
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, List, Optional
+
+from utils import (
+    _txt_path,
+    _edits_path,
+    _snapshot_path,
+    atomic_write_text,
+    file_lock,
+    notify_transcript_listeners,
+)
+
+TRANSCRIPT_SNAPSHOT_EVERY = int(os.getenv("TRANSCRIPT_SNAPSHOT_EVERY", "50"))
+
+
+class EditConflict(Exception):
+    """The patch was made against a version that is no longer current."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Transcript is at version {current_version}")
+        self.current_version = current_version
+
+
+class InvalidEdit(ValueError):
+    pass
+
+
+@dataclass
+class TranscriptState:
+    text: str
+    version: int
+    lineage: str  # changes whenever the model writes a brand-new transcript
+    last_modified: float  # epoch seconds
+    log_size: int  # bytes of edit log consumed
+    edits_since_snapshot: int
+    # mtime of the .txt, rewritten at every snapshot; with log_size, detects writes by other processes
+    txt_mtime_ns: int = 0
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self.lineage}-{self.version}"'
+
+    @cached_property
+    def size(self) -> int:
+        return len(self.text.encode("utf-8"))
+
+
+def apply_ops(text: str, ops: List[Dict[str, Any]]) -> str:
+    """
+    Apply edit operations in order. Each op is {"pos", "delete", "insert"}:
+    remove `delete` characters at `pos`, then insert `insert` there. Positions
+    refer to the text as left by the previous op.
+    """
+    for op in ops:
+        try:
+            pos = int(op.get("pos", 0))
+            delete = int(op.get("delete", 0))
+            insert = str(op.get("insert", ""))
+        except (TypeError, ValueError, AttributeError):
+            raise InvalidEdit(f"Malformed edit operation: {op!r}")
+        if pos < 0 or delete < 0 or pos + delete > len(text):
+            raise InvalidEdit(f"Edit operation out of range: {op!r}")
+        text = text[:pos] + insert + text[pos + delete:]
+    return text
+
+
+def read_state(audio_id: str) -> Optional[TranscriptState]:
+    """Rebuild the current transcript from snapshot + edit log; None if there is no transcript."""
+    # Stat first: a snapshot written after this makes the state look stale, never fresh
+    try:
+        txt_mtime_ns = os.stat(_txt_path(audio_id)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    snapshot_path = _snapshot_path(audio_id)
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        text = snapshot["text"]
+        version = snapshot["version"]
+        lineage = snapshot["lineage"]
+        last_modified = snapshot["at"]
+    else:
+        try:
+            with open(_txt_path(audio_id), 'r', encoding='utf-8') as f:
+                st = os.fstat(f.fileno())
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        version = 0
+        lineage = f"{st.st_mtime_ns:x}"
+        last_modified = st.st_mtime
+
+    edits = 0
+    log_size = 0
+    edits_path = _edits_path(audio_id)
+    if os.path.exists(edits_path):
+        with open(edits_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn final write; it was never acknowledged
+                log_size += len(line)
+                entry = json.loads(line)
+                if entry["version"] <= version:
+                    continue  # already in the snapshot (crash before the log was emptied)
+                text = apply_ops(text, entry["ops"])
+                version = entry["version"]
+                last_modified = entry["at"]
+                edits += 1
+
+    return TranscriptState(text, version, lineage, last_modified, log_size, edits, txt_mtime_ns)
+
+
+def _write_snapshot(audio_id: str, state: TranscriptState) -> None:
+    """Persist state as the snapshot and empty the edit log it makes redundant. Hold the file lock."""
+    atomic_write_text(_snapshot_path(audio_id), json.dumps({
+        "version": state.version,
+        "text": state.text,
+        "lineage": state.lineage,
+        "at": state.last_modified,
+    }))
+    # Keep the plain .txt in step for readers that don't know about edits
+    atomic_write_text(_txt_path(audio_id), state.text)
+    with open(_edits_path(audio_id), 'wb') as f:
+        os.fsync(f.fileno())
+    state.log_size = 0
+    state.edits_since_snapshot = 0
+    state.txt_mtime_ns = os.stat(_txt_path(audio_id)).st_mtime_ns
+
+
+def _current(audio_id: str, cached: Optional[TranscriptState]) -> Optional[TranscriptState]:
+    """Reuse the caller's state unless another writer has appended or snapshotted since it was read."""
+    if cached is not None:
+        try:
+            log_size = os.path.getsize(_edits_path(audio_id))
+        except FileNotFoundError:
+            log_size = 0
+        try:
+            txt_mtime_ns = os.stat(_txt_path(audio_id)).st_mtime_ns
+        except FileNotFoundError:
+            txt_mtime_ns = None
+        if log_size == cached.log_size and txt_mtime_ns == cached.txt_mtime_ns:
+            return cached
+    return read_state(audio_id)
+
+
+def apply_patch(
+    audio_id: str,
+    base_version: int,
+    ops: List[Dict[str, Any]],
+    cached: Optional[TranscriptState] = None,
+) -> TranscriptState:
+    """
+    Apply ops made against base_version and return the new state.
+    Raises EditConflict if the transcript has moved on, InvalidEdit for bad ops,
+    FileNotFoundError if there is no transcript.
+    """
+    with file_lock(_edits_path(audio_id)):
+        state = _current(audio_id, cached)
+        if state is None:
+            raise FileNotFoundError(f"No transcript for {audio_id}")
+        if base_version != state.version:
+            raise EditConflict(state.version)
+
+        new_text = apply_ops(state.text, ops)
+        now = time.time()
+        line = (json.dumps({"version": state.version + 1, "at": now, "ops": ops}) + "\n").encode("utf-8")
+        with open(_edits_path(audio_id), 'ab') as f:
+            if os.fstat(f.fileno()).st_size > state.log_size:
+                # Drop a torn final line left by a crash mid-append, or this
+                # entry would be glued onto it and the log become unreadable
+                f.truncate(state.log_size)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        new_state = TranscriptState(
+            text=new_text,
+            version=state.version + 1,
+            lineage=state.lineage,
+            last_modified=now,
+            log_size=state.log_size + len(line),
+            edits_since_snapshot=state.edits_since_snapshot + 1,
+            txt_mtime_ns=state.txt_mtime_ns,
+        )
+        if new_state.edits_since_snapshot >= TRANSCRIPT_SNAPSHOT_EVERY:
+            _write_snapshot(audio_id, new_state)
+        notify_transcript_listeners(audio_id, new_state.text, new_state.version)
+        return new_state
+
+
+def replace_text(audio_id: str, text: str, cached: Optional[TranscriptState] = None) -> TranscriptState:
+    """
+    Full-document save: a new version written straight to the snapshot. It is
+    not logged, since a log line would only repeat the snapshot.
+    """
+    with file_lock(_edits_path(audio_id)):
+        state = _current(audio_id, cached)
+        if state is None:
+            raise FileNotFoundError(f"No transcript for {audio_id}")
+        new_state = TranscriptState(text, state.version + 1, state.lineage, time.time(), 0, 0)
+        _write_snapshot(audio_id, new_state)
+        notify_transcript_listeners(audio_id, new_state.text, new_state.version)
+        return new_state
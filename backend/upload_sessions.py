@@ -0,0 +1,235 @@
+# upload_sessions.py
+"""
+Resumable uploads for long recordings.
+
+A client creates an upload, appends the body in as many PATCH requests as it
+likes (each starting at the offset the server already has), asks for the
+current offset after a dropped connection, and finalises. Files per upload, in
+AUDIO_FILES_DIR/partial_uploads:
+  <upload_id>.json   the form fields from creation (appointment, user, room...)
+  <upload_id>.part   the bytes received so far; its size is the upload offset
+
+Chunks are written straight to the .part file as they arrive, and finalising
+renames it to <audio_id>.upload, the same raw file POST /transcribe spools, so
+nothing is ever assembled in memory or copied. Only one request can append to
+an upload at a time (a non-blocking flock on the .part file). A finalised
+upload keeps its .json, now recording the audio_id, so a finalise repeated
+after a lost response gets the same job back. Uploads that aren't finalised
+within UPLOAD_SESSION_TTL_HOURS are removed, as are finalised ones after the
+same time.
+"""
+import fcntl
+import json
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from config import AUDIO_FILES_DIR
+from utils import _raw_path, atomic_write_text
+
+UPLOAD_SESSIONS_DIR = os.path.join(AUDIO_FILES_DIR, "partial_uploads")
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+# Ward rounds can run for hours; 2 GiB is far beyond any real recording
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class OffsetMismatch(Exception):
+    """The client's Upload-Offset doesn't match what the server has."""
+
+    def __init__(self, current_offset: int):
+        super().__init__(f"Upload is at offset {current_offset}")
+        self.current_offset = current_offset
+
+
+class UploadBusy(Exception):
+    """Another request is appending to this upload."""
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadFinished(Exception):
+    """The upload was already finalised into a job."""
+
+    def __init__(self, audio_id: str):
+        super().__init__(f"Upload became job {audio_id}")
+        self.audio_id = audio_id
+
+
+def _paths(upload_id: str):
+    if not _UPLOAD_ID.match(upload_id or ""):
+        raise UploadNotFound(upload_id)
+    base = os.path.join(UPLOAD_SESSIONS_DIR, upload_id)
+    return base + ".json", base + ".part"
+
+
+def _purge_expired() -> None:
+    """
+    Drop uploads whose last chunk arrived, or that were finalised, more than
+    UPLOAD_SESSION_TTL_HOURS ago, and state files left without a .part.
+    """
+    cutoff = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+    for name in os.listdir(UPLOAD_SESSIONS_DIR):
+        upload_id, ext = os.path.splitext(name)
+        if ext != ".json":
+            continue
+        try:
+            state_path, part_path = _paths(upload_id)
+            if os.path.exists(part_path):
+                expired = os.path.getmtime(part_path) < cutoff
+            else:
+                with open(state_path, "r") as f:
+                    finished = json.load(f).get("audio_id") is not None
+                expired = not finished or os.path.getmtime(state_path) < cutoff
+            if expired:
+                for path in (part_path, state_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+        except (OSError, ValueError, UploadNotFound):
+            pass
+
+
+def create_upload(fields: Dict[str, Any], length: Optional[int] = None) -> Dict[str, Any]:
+    """Start an upload; `fields` are kept until finalise. `length` is the total size, if known."""
+    if length is not None and length > UPLOAD_MAX_BYTES:
+        raise UploadTooLarge(length)
+    os.makedirs(UPLOAD_SESSIONS_DIR, exist_ok=True)
+    _purge_expired()
+
+    upload_id = uuid.uuid4().hex
+    state_path, part_path = _paths(upload_id)
+    session = {"upload_id": upload_id, "length": length, "created_at": time.time(), "fields": fields}
+    open(part_path, "wb").close()
+    atomic_write_text(state_path, json.dumps(session))
+    return {**session, "offset": 0}
+
+
+def get_upload(upload_id: str) -> Dict[str, Any]:
+    """The upload's state; a finalised one carries the audio_id it became and its final offset."""
+    state_path, part_path = _paths(upload_id)
+    try:
+        with open(state_path, "r") as f:
+            session = json.load(f)
+        if session.get("audio_id") is None:
+            session["offset"] = os.path.getsize(part_path)
+    except FileNotFoundError:
+        raise UploadNotFound(upload_id)
+    return session
+
+
+def _unfinished_upload(upload_id: str) -> Dict[str, Any]:
+    session = get_upload(upload_id)
+    if session.get("audio_id") is not None:
+        raise UploadFinished(session["audio_id"])
+    return session
+
+
+def _open_part(upload_id: str):
+    """The .part file opened for appending. Never recreates one a finalise has moved away."""
+    _, part_path = _paths(upload_id)
+    try:
+        return os.fdopen(os.open(part_path, os.O_WRONLY | os.O_APPEND), "ab")
+    except FileNotFoundError:
+        _unfinished_upload(upload_id)
+        raise UploadNotFound(upload_id)
+
+
+def find_upload(user_id: str, upload_key: str) -> Optional[Dict[str, Any]]:
+    """The user's upload created with this Idempotency-Key, if any; it may already be finalised."""
+    if not os.path.isdir(UPLOAD_SESSIONS_DIR):
+        return None
+    for name in os.listdir(UPLOAD_SESSIONS_DIR):
+        upload_id, ext = os.path.splitext(name)
+        if ext != ".json":
+            continue
+        try:
+            session = get_upload(upload_id)
+        except (UploadNotFound, ValueError):
+            continue
+        fields = session.get("fields") or {}
+        if fields.get("upload_key") == upload_key and str(fields.get("user_id")) == str(user_id):
+            return session
+    return None
+
+
+class Appender:
+    """
+    Exclusive handle for one PATCH: open() takes the lock and checks the
+    client's offset, write() appends to the .part file, close() fsyncs and
+    releases. Call close() even when the client disconnects part way, so a
+    retry can resume from whatever was received.
+    """
+
+    def __init__(self, upload_id: str, offset: int):
+        self.session = _unfinished_upload(upload_id)
+        self.offset = offset
+        self._file = None
+
+    def open(self) -> None:
+        upload_id = self.session["upload_id"]
+        self._file = _open_part(upload_id)
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            raise UploadBusy(upload_id)
+        try:
+            # A finalise may have moved the file between opening and locking it
+            _unfinished_upload(upload_id)
+        except Exception:
+            self.close()
+            raise
+        current = os.fstat(self._file.fileno()).st_size
+        if current != self.offset:
+            self.close()
+            raise OffsetMismatch(current)
+
+    def write(self, chunk: bytes) -> None:
+        limit = self.session.get("length") or UPLOAD_MAX_BYTES
+        if self.offset + len(chunk) > limit:
+            raise UploadTooLarge(self.offset + len(chunk))
+        self._file.write(chunk)
+        self.offset += len(chunk)
+
+    def close(self) -> None:
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+
+
+def finish_upload(upload_id: str, audio_id: str) -> str:
+    """
+    Move the complete .part file into place as <audio_id>.upload for the queue
+    processor and record audio_id in the upload's state. Returns the raw
+    upload path; raises UploadFinished if the upload was already finalised.
+    """
+    state_path, part_path = _paths(upload_id)
+    with _open_part(upload_id) as part:
+        try:
+            fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy(upload_id)
+        session = _unfinished_upload(upload_id)
+        offset = os.fstat(part.fileno()).st_size
+        if offset == 0 or (session.get("length") is not None and offset != session["length"]):
+            raise OffsetMismatch(offset)
+        raw_path = _raw_path(audio_id)
+        os.replace(part_path, raw_path)
+        # Still under the lock, so a concurrent finalise sees the audio_id
+        atomic_write_text(state_path, json.dumps({
+            **session, "audio_id": audio_id, "offset": offset, "finished_at": time.time(),
+        }))
+    return raw_path
+
@@ -1,7 +1,6 @@
 # utils.py
-from pydub import AudioSegment
-from fastapi import UploadFile
-import json, os, io
+import fcntl, json, os, shutil, subprocess, tempfile
+from contextlib import contextmanager
 from datetime import datetime
 from config import AUDIO_FILES_DIR, JSON_FILES_DIR, TRANSCRIPTION_FILES_DIR
 
@@ -13,10 +12,18 @@ def _basename(audio_id_or_name: str) -> str:
             base = base[:-len(ext)]
     return base
 
+def _raw_path(audio_id_or_name: str) -> str:
+    base = _basename(audio_id_or_name)
+    return os.path.join(AUDIO_FILES_DIR, f"{base}.upload")
+
 def _wav_path(audio_id_or_name: str) -> str:
     base = _basename(audio_id_or_name)
     return os.path.join(AUDIO_FILES_DIR, f"{base}.wav")
 
+def _features_path(audio_id_or_name: str) -> str:
+    base = _basename(audio_id_or_name)
+    return os.path.join(AUDIO_FILES_DIR, f"{base}.feat")
+
 def _json_path(audio_id_or_name: str) -> str:
     base = _basename(audio_id_or_name)
     return os.path.join(JSON_FILES_DIR, f"{base}.json")
@@ -25,28 +32,131 @@ def _txt_path(audio_id_or_name: str) -> str:
     base = _basename(audio_id_or_name)
     return os.path.join(TRANSCRIPTION_FILES_DIR, f"{base}.txt")
 
-def convert_to_wav_16k(file: UploadFile, audio_id_or_name: str) -> str:
+def _edits_path(audio_id_or_name: str) -> str:
+    base = _basename(audio_id_or_name)
+    return os.path.join(TRANSCRIPTION_FILES_DIR, f"{base}.edits.jsonl")
+
+def _snapshot_path(audio_id_or_name: str) -> str:
+    base = _basename(audio_id_or_name)
+    return os.path.join(TRANSCRIPTION_FILES_DIR, f"{base}.snap.json")
+
+def atomic_write_text(path: str, text: str) -> None:
+    """Write via a temp file in the same directory + rename, so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock on <path>.lock, shared by the backend and queue processor"""
+    with open(path + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+def spool_upload(src, audio_id_or_name: str) -> str:
+    """
+    Copy an uploaded file object to <audio_id>.upload in AUDIO_FILES_DIR.
+
+    The body is copied in fixed-size chunks, so memory use doesn't depend on
+    recording length, then fsynced and renamed into place so the raw upload is
+    durable before we acknowledge it. Blocking; call from a worker thread.
+    """
+    raw_path = _raw_path(audio_id_or_name)
+    tmp_path = raw_path + ".part"
+    with open(tmp_path, 'wb') as out:
+        shutil.copyfileobj(src, out, UPLOAD_CHUNK_SIZE)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, raw_path)
+    return raw_path
+
+def transcode_to_wav_16k(audio_id_or_name: str) -> str:
     """
-    Convert uploaded audio to 16kHz mono WAV.
+    Convert the raw upload to 16kHz mono WAV.
 
     This function:
     - Reads arbitrary input format (e.g., webm/opus from browser).
     - Downmixes polyphonic/multi-channel audio to a single mono channel.
     - Resamples to 16kHz for model compatibility.
-    - Saves the result as <audio_id>.wav in AUDIO_FILES_DIR.
+    - Saves the result as <audio_id>.wav in AUDIO_FILES_DIR and removes the
+      raw upload.
+
+    ffmpeg decodes, resamples and writes frame by frame, so the recording is
+    never held in memory as a whole.
     """
-    content = file.file.read()
-    audio = AudioSegment.from_file(io.BytesIO(content))
-    audio = audio.set_frame_rate(16000).set_channels(1)
+    raw_path = _raw_path(audio_id_or_name)
     output_path = _wav_path(audio_id_or_name)
-    audio.export(output_path, format="wav")
+    tmp_path = output_path + ".part"
+    cmd = [
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", raw_path,
+        "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",
+        "-f", "wav", tmp_path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"ffmpeg failed to convert {raw_path}: {result.stderr.strip()}")
+    os.replace(tmp_path, output_path)
+    os.remove(raw_path)
     return output_path
 
+def probe_duration_seconds(path: str):
+    """Duration of an audio file in seconds, read by ffprobe from the container header; None if unknown"""
+    cmd = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", path,
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=30)
+        return float(result.stdout.strip())
+    except (OSError, subprocess.SubprocessError, ValueError):
+        # Browser webm recordings often carry no duration in the header
+        return None
+
+def raw_upload_exists(audio_id_or_name: str) -> bool:
+    """Check if an unconverted upload is waiting for <audio_id>"""
+    return os.path.exists(_raw_path(audio_id_or_name))
+
+def discard_audio(audio_id_or_name: str) -> None:
+    """Remove the raw upload, converted WAV and precomputed features of a job that won't be transcribed"""
+    for path in (_raw_path(audio_id_or_name), _wav_path(audio_id_or_name), _features_path(audio_id_or_name)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Callbacks run after every metadata write in this process, e.g. to keep the
+# backend's job index current without rescanning JSON_FILES_DIR
+_metadata_listeners = []
+
+def add_metadata_listener(listener) -> None:
+    """Register listener(audio_id, metadata), called after each metadata write"""
+    _metadata_listeners.append(listener)
+
 def save_metadata_json(audio_id_or_name: str, metadata: dict) -> str:
     """Save job metadata to <audio_id>.json"""
     json_path = _json_path(audio_id_or_name)
-    with open(json_path, 'w') as f:
-        json.dump(metadata, f, indent=2, default=str)
+    atomic_write_text(json_path, json.dumps(metadata, indent=2, default=str))
+    for listener in _metadata_listeners:
+        try:
+            listener(_basename(audio_id_or_name), metadata)
+        except Exception as e:
+            print(f"Metadata listener failed for {audio_id_or_name}: {e}")
     return json_path
 
 def load_metadata_json(audio_id_or_name: str) -> dict:
@@ -58,26 +168,65 @@ def load_metadata_json(audio_id_or_name: str) -> dict:
         return json.load(f)
 
 def update_metadata_json(audio_id_or_name: str, updates: dict) -> str:
-    """Update existing metadata JSON"""
-    metadata = load_metadata_json(audio_id_or_name)
-    metadata.update(updates)
-    metadata['updated_at'] = datetime.now().isoformat()
-    return save_metadata_json(audio_id_or_name, metadata)
+    """Update existing metadata JSON (read-modify-write under a file lock)"""
+    with file_lock(_json_path(audio_id_or_name)):
+        metadata = load_metadata_json(audio_id_or_name)
+        metadata.update(updates)
+        metadata['updated_at'] = datetime.now().isoformat()
+        return save_metadata_json(audio_id_or_name, metadata)
+
+def transition_metadata_json(audio_id_or_name: str, from_statuses, updates: dict):
+    """
+    Apply updates only if the job's current status is one of from_statuses,
+    checked and written under the same lock as update_metadata_json. Returns
+    the metadata as it was before the update, or None if the status didn't match
+    (e.g. the job was cancelled in the meantime).
+    """
+    with file_lock(_json_path(audio_id_or_name)):
+        metadata = load_metadata_json(audio_id_or_name)
+        if metadata.get("status") not in from_statuses:
+            return None
+        previous = dict(metadata)
+        metadata.update(updates)
+        metadata['updated_at'] = datetime.now().isoformat()
+        save_metadata_json(audio_id_or_name, metadata)
+        return previous
+
+_transcript_listeners = []
+
+def add_transcript_listener(listener) -> None:
+    """Register listener(audio_id, text, version), called after each transcript write or edit"""
+    _transcript_listeners.append(listener)
+
+def notify_transcript_listeners(audio_id_or_name: str, text: str, version: int) -> None:
+    for listener in _transcript_listeners:
+        try:
+            listener(_basename(audio_id_or_name), text, version)
+        except Exception as e:
+            print(f"Transcript listener failed for {audio_id_or_name}: {e}")
 
 def save_transcript(audio_id_or_name: str, transcript: str) -> str:
-    """Save transcript to <audio_id>.txt"""
+    """
+    Save a fresh transcript to <audio_id>.txt (atomically).
+
+    This starts a new transcript at version 0, so any edit log and snapshot
+    from a previous transcript of the same recording are discarded.
+    Edits to an existing transcript go through transcript_store instead.
+    """
     txt_path = _txt_path(audio_id_or_name)
-    with open(txt_path, 'w', encoding='utf-8') as f:
-        f.write(transcript)
+    with file_lock(_edits_path(audio_id_or_name)):
+        atomic_write_text(txt_path, transcript)
+        for path in (_snapshot_path(audio_id_or_name), _edits_path(audio_id_or_name)):
+            if os.path.exists(path):
+                os.remove(path)
+        notify_transcript_listeners(audio_id_or_name, transcript, 0)
     return txt_path
 
 def load_transcript(audio_id_or_name: str) -> str:
-    """Load transcript from <audio_id>.txt"""
-    txt_path = _txt_path(audio_id_or_name)
-    if not os.path.exists(txt_path):
-        return ""
-    with open(txt_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    """Load the current transcript text, including edits since the last snapshot"""
+    from transcript_store import read_state  # transcript_store imports utils
+    state = read_state(_basename(audio_id_or_name))
+    return state.text if state else ""
 
 def transcript_exists(audio_id_or_name: str) -> bool:
     """Check if transcript file exists"""
@@ -1,10 +1,20 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
 from tempfile import NamedTemporaryFile
-from .diarize_then_transcribe import diarize_then_transcribe
+from .diarize_then_transcribe import diarize_then_transcribe, decode_audio_bytes
+from .features import extract_features, load_features
+from .profiles import PROFILES, get_profile
+from .cancellation import DeadlineExceeded, JobCancelled, cancel, cancellable, check
+from .tracing import span
+from contextlib import contextmanager
+import hashlib
 import os
 import shutil
+import threading
+import time
 
 app = FastAPI()
 
@@ -17,11 +27,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Jobs that run the pipeline at once; the rest wait their turn and show up as
+# "queued" on /health, which the backend uses to pick the least-loaded host.
+# The endpoints are plain `def` so FastAPI runs them in its threadpool and
+# /health keeps answering while a job is on the GPU.
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", "1"))
+
+# Largest body accepted on /transcribe-stream (about 9h of 16kHz mono WAV)
+MODEL_STREAM_MAX_BYTES = int(os.getenv("MODEL_STREAM_MAX_BYTES", str(1 << 30)))
+
+_slots = threading.Semaphore(MODEL_CONCURRENCY)
+_stats_lock = threading.Lock()
+_stats = {"in_flight": 0, "running": 0, "served": 0}
+
+
+def _deadline(deadline_s: Optional[float]) -> Optional[float]:
+    """time.monotonic() deadline for a job given deadline_s seconds from now"""
+    return time.monotonic() + float(deadline_s) if deadline_s else None
+
+@contextmanager
+def _model_slot(job_token: Optional[str] = None, deadline: Optional[float] = None):
+    """
+    Count the request as in flight, then wait for a free pipeline slot. With a
+    job_token the job can be cancelled (see cancellation.py), including while
+    it waits for the slot; with a deadline it stops once that has passed,
+    including a wait for a slot that won't free up in time.
+    """
+    with _stats_lock:
+        _stats["in_flight"] += 1
+    try:
+        with cancellable(job_token, deadline):
+            with span("model.slot_wait"):
+                if deadline is None:
+                    _slots.acquire()
+                elif not _slots.acquire(timeout=max(deadline - time.monotonic(), 0.0)):
+                    raise DeadlineExceeded()
+            try:
+                check()
+                with _stats_lock:
+                    _stats["running"] += 1
+                try:
+                    yield
+                finally:
+                    with _stats_lock:
+                        _stats["running"] -= 1
+                        _stats["served"] += 1
+            finally:
+                _slots.release()
+    finally:
+        with _stats_lock:
+            _stats["in_flight"] -= 1
+
+
 class TranscribeRequest(BaseModel):
     audio_path: str
+    # Recording clinician, for speaker enrollment; omit for anonymous labels
+    user_id: Optional[int] = None
+    num_speakers: Optional[int] = 2
+    # Pipeline profile name (see profiles.py), usually the meeting type
+    profile: Optional[str] = None
+    # Lets the backend stop the job part way through, via /jobs/{token}/cancel
+    job_token: Optional[str] = None
+    # Feature bundle precomputed for this audio (features.py); audio_path is used without one
+    features_path: Optional[str] = None
+    # Seconds the job may take from now; it stops with 504 after that
+    deadline_s: Optional[float] = None
+
+@app.get("/health")
+async def health():
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        "status": "ok",
+        "capacity": MODEL_CONCURRENCY,
+        "in_flight": stats["in_flight"],
+        "running": stats["running"],
+        "queued": stats["in_flight"] - stats["running"],
+        "served": stats["served"],
+    }
+
+@app.get("/profiles")
+async def list_profiles():
+    return {name: profile.summary() for name, profile in PROFILES.items()}
+
+@app.post("/jobs/{job_token}/cancel")
+async def cancel_job(job_token: str):
+    """Stop the job sent with this token at its next chunk boundary (or as soon as it arrives)."""
+    return {"job_token": job_token, "cancelled": cancel(job_token)}
 
 @app.post("/transcribe")
-async def transcribe_audio(request: TranscribeRequest):
+def transcribe_audio(request: TranscribeRequest, traceparent: Optional[str] = Header(None)):
+    deadline = _deadline(request.deadline_s)
     try:
         # Check if the audio file exists
         if not os.path.exists(request.audio_path):
@@ -31,8 +127,18 @@ async def transcribe_audio(request: TranscribeRequest):
         with NamedTemporaryFile(suffix=".txt", delete=False) as temp_output:
             output_path = temp_output.name
 
-        # Run your model pipeline on the existing audio file
-        diarize_then_transcribe(request.audio_path, output_path)
+        # Run your model pipeline on the existing audio file, as part of the backend's trace
+        with span("model.transcribe", parent=traceparent, transfer="path"):
+            features = None
+            if request.features_path and os.path.exists(request.features_path):
+                with span("features.load"), open(request.features_path, "rb") as f:
+                    features = load_features(f.read())
+            with _model_slot(request.job_token, deadline):
+                profile = diarize_then_transcribe(
+                    request.audio_path, output_path,
+                    user_id=request.user_id, num_speakers=request.num_speakers,
+                    profile=get_profile(request.profile), features=features,
+                )
 
         # Return the transcript
         with open(output_path, "r") as f:
@@ -41,13 +147,131 @@ async def transcribe_audio(request: TranscribeRequest):
         # Clean up temp output file
         os.unlink(output_path)
 
-        return {"transcript": transcript}
+        return {"transcript": transcript, "profile": profile.name}
 
+    except DeadlineExceeded:
+        os.unlink(output_path)
+        raise HTTPException(status_code=504, detail="Job deadline exceeded")
+    except JobCancelled:
+        os.unlink(output_path)
+        raise HTTPException(status_code=409, detail="Job cancelled")
     except Exception as e:
         return {"error": str(e)}
 
+def _transcribe_bytes(data: bytearray, user_id: Optional[int], num_speakers: Optional[int],
+                      profile_name: Optional[str], job_token: Optional[str] = None,
+                      traceparent: Optional[str] = None, precomputed: bool = False,
+                      deadline: Optional[float] = None) -> dict:
+    """Transcribe a WAV held in memory, or a feature bundle (features.py) when precomputed."""
+    with span("model.transcribe", parent=traceparent, transfer="stream"):
+        waveform = features = None
+        if precomputed:
+            with span("features.load", bytes=len(data)):
+                features = load_features(data)
+        else:
+            with span("audio.decode", bytes=len(data)):
+                waveform = decode_audio_bytes(data)
+        with NamedTemporaryFile(suffix=".txt", delete=False) as temp_output:
+            output_path = temp_output.name
+        try:
+            with _model_slot(job_token, deadline):
+                profile = diarize_then_transcribe(
+                    None, output_path, waveform=waveform, user_id=user_id, num_speakers=num_speakers,
+                    profile=get_profile(profile_name), features=features,
+                )
+            with open(output_path, "r") as f:
+                return {"transcript": f.read(), "profile": profile.name}
+        finally:
+            os.unlink(output_path)
+
+async def _receive_body(request: Request, traceparent: Optional[str]) -> bytearray:
+    """The request body, checked against its X-Audio-SHA256 header as it arrives."""
+    expected = (request.headers.get("x-audio-sha256") or "").lower()
+    if not expected:
+        raise HTTPException(status_code=400, detail="X-Audio-SHA256 header is required")
+
+    digest = hashlib.sha256()
+    body = bytearray()
+    with span("model.receive_stream", parent=traceparent) as receive:
+        async for chunk in request.stream():
+            digest.update(chunk)
+            body += chunk
+            if len(body) > MODEL_STREAM_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Audio stream too large")
+        receive.set_attribute("bytes", len(body))
+    if digest.hexdigest() != expected:
+        raise HTTPException(status_code=400, detail="Audio checksum mismatch")
+    return body
+
+async def _transcribe_streamed(request: Request, precomputed: bool):
+    # The deadline counts from the request's arrival, receiving the body included
+    deadline = _deadline(request.headers.get("x-deadline-s"))
+    user_id = request.headers.get("x-user-id")
+    user_id = int(user_id) if user_id else None
+    num_speakers = request.headers.get("x-num-speakers")
+    num_speakers = int(num_speakers) if num_speakers else 2
+    profile_name = request.headers.get("x-profile")
+    job_token = request.headers.get("x-job-token")
+    traceparent = request.headers.get("traceparent")
+    body = await _receive_body(request, traceparent)
+
+    try:
+        return await run_in_threadpool(
+            _transcribe_bytes, body, user_id, num_speakers, profile_name, job_token, traceparent, precomputed,
+            deadline,
+        )
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Job deadline exceeded")
+    except JobCancelled:
+        raise HTTPException(status_code=409, detail="Job cancelled")
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.post("/transcribe-stream")
+async def transcribe_stream(request: Request):
+    """
+    Transcribe audio sent as the request body (chunked or with Content-Length),
+    so the model host needs no access to the backend's storage. The body is
+    hashed as it arrives and checked against the X-Audio-SHA256 header, then
+    decoded in memory. X-User-Id, X-Num-Speakers, X-Profile, X-Job-Token and
+    X-Deadline-S carry what /transcribe takes in its JSON body; traceparent
+    works the same on both.
+    """
+    return await _transcribe_streamed(request, precomputed=False)
+
+@app.post("/transcribe-features")
+async def transcribe_features(request: Request):
+    """
+    Like /transcribe-stream, but the body is a feature bundle from /features,
+    so this host skips feature extraction (and VAD) and runs only the models.
+    """
+    return await _transcribe_streamed(request, precomputed=True)
+
+@app.post("/features")
+async def compute_features(request: Request):
+    """
+    Precompute a recording's Whisper features for the profile in X-Profile
+    (features.py). Body and checksum as for /transcribe-stream; returns the
+    feature bundle. CPU work only: hosts without a GPU can serve this and
+    leave inference to the others.
+    """
+    traceparent = request.headers.get("traceparent")
+    body = await _receive_body(request, traceparent)
+
+    def extract() -> bytes:
+        with span("model.features", parent=traceparent):
+            with span("audio.decode", bytes=len(body)):
+                wav, sr = decode_audio_bytes(body)
+            return extract_features(wav, sr, get_profile(request.headers.get("x-profile")))
+
+    try:
+        data = await run_in_threadpool(extract)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Feature extraction failed: {e}")
+    return Response(content=data, media_type="application/octet-stream")
+
 @app.post("/transcribe-upload")
-async def transcribe_uploaded_audio(file: UploadFile = File(...)):
+def transcribe_uploaded_audio(file: UploadFile = File(...)):
     try:
         # Validate file type
         if not file.content_type or not file.content_type.startswith('audio/'):
@@ -64,7 +288,8 @@ async def transcribe_uploaded_audio(file: UploadFile = File(...)):
 
         try:
             # Run your model pipeline on the uploaded audio file
-            diarize_then_transcribe(temp_audio_path, output_path)
+            with _model_slot():
+                diarize_then_transcribe(temp_audio_path, output_path)
 
             # Return the transcript
             with open(output_path, "r") as f:
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Bulk (re)transcription of a backlog of recordings, e.g. after a model upgrade.
+
+Unlike the diarize_then_transcribe.py CLI, the models are loaded once and
+shared by a pool of worker threads. Every finished file is appended to a
+checkpoint manifest, so an interrupted run picks up where it stopped when it
+is started again with the same output directory.
+
+    python -m app.batch_transcribe /app/storage/audio_files out/ --workers 2
+    python -m app.batch_transcribe backlog.jsonl out/ --profile mdt
+
+The input is a directory (audio files, searched recursively) or a manifest:
+one audio path per line, or JSON lines with "audio_path" and optionally
+"user_id", "num_speakers", "profile" and "output" (file name in the output
+directory). Transcripts are written to <output dir>/<name>.txt, keeping the
+subfolders of an input directory. The
+checkpoint (<output dir>/checkpoint.jsonl by default) records each file's
+outcome; files recorded as done whose transcript still exists are skipped,
+failed ones are retried. A throughput summary (files/hour, real-time factor)
+is printed and written to <output dir>/summary.json at the end.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+try:
+    from .diarize_then_transcribe import (
+        diarize_then_transcribe,
+        get_asr_pipeline,
+        get_diarization_pipeline,
+        load_audio_mono,
+    )
+    from .profiles import get_profile
+except ImportError:  # run as a script
+    from diarize_then_transcribe import (
+        diarize_then_transcribe,
+        get_asr_pipeline,
+        get_diarization_pipeline,
+        load_audio_mono,
+    )
+    from profiles import get_profile
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".m4a", ".ogg", ".webm", ".upload")
+
+
+def read_items(source: str) -> List[Dict]:
+    """Work items ({"audio_path", ...}) from a directory or a manifest file."""
+    if os.path.isdir(source):
+        top = os.path.abspath(source)
+        paths = []
+        for root, _, names in os.walk(top):
+            paths.extend(os.path.join(root, n) for n in names if n.lower().endswith(AUDIO_EXTENSIONS))
+        # Transcripts mirror the directory layout, so same-named files in different folders don't collide
+        return [
+            {"audio_path": p, "output": os.path.splitext(os.path.relpath(p, top))[0] + ".txt"}
+            for p in sorted(paths)
+        ]
+
+    items = []
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line) if line.startswith("{") else {"audio_path": line}
+            # Relative paths are relative to the manifest
+            item["audio_path"] = os.path.join(base, item["audio_path"])
+            items.append(item)
+    return items
+
+
+def output_name(item: Dict) -> str:
+    if item.get("output"):
+        return item["output"]
+    return os.path.splitext(os.path.basename(item["audio_path"]))[0] + ".txt"
+
+
+class Checkpoint:
+    """Append-only JSON lines of finished files, fsynced per line so a crash loses at most the file in progress."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from an interrupted run
+                    if record.get("status") == "done":
+                        self.done.add(record["audio_path"])
+                    else:
+                        self.done.discard(record["audio_path"])
+
+    def record(self, **record) -> None:
+        record["at"] = datetime.now().isoformat()
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def transcribe_one(item: Dict, output_path: str, default_profile: Optional[str],
+                   default_speakers: Optional[int]) -> Dict:
+    """Transcribe one file to output_path (atomically). Returns its audio and processing seconds."""
+    started = time.monotonic()
+    wav, sr = load_audio_mono(item["audio_path"])
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = output_path + ".part"
+    profile = diarize_then_transcribe(
+        None, tmp_path, waveform=(wav, sr),
+        user_id=item.get("user_id"),
+        num_speakers=item.get("num_speakers") or default_speakers,
+        profile=get_profile(item.get("profile") or default_profile),
+    )
+    os.replace(tmp_path, output_path)
+    return {
+        "duration_s": len(wav) / float(sr),
+        "elapsed_s": time.monotonic() - started,
+        "profile": profile.name,
+    }
+
+
+def warm_up(items: List[Dict], default_profile: Optional[str]) -> None:
+    """Load every model the run needs once, before the workers start."""
+    for model_id in sorted({get_profile(item.get("profile") or default_profile).asr_model for item in items}):
+        print(f"Loading {model_id}…")
+        get_asr_pipeline(model_id)
+    print("Loading diarization pipeline…")
+    get_diarization_pipeline()
+
+
+def summarize(results: List[Dict], failed: int, skipped: int, wall_s: float) -> Dict:
+    audio_s = sum(r["duration_s"] for r in results)
+    processing_s = sum(r["elapsed_s"] for r in results)
+    hours = wall_s / 3600.0
+    return {
+        "files_done": len(results),
+        "files_failed": failed,
+        "files_skipped": skipped,
+        "audio_hours": round(audio_s / 3600.0, 3),
+        "wall_seconds": round(wall_s, 1),
+        "files_per_hour": round(len(results) / hours, 1) if hours else None,
+        "audio_hours_per_hour": round(audio_s / 3600.0 / hours, 2) if hours else None,
+        # Per-file processing time over audio time; below 1 is faster than real time
+        "real_time_factor": round(processing_s / audio_s, 3) if audio_s else None,
+        # Wall time over audio time for the whole run, i.e. including parallelism
+        "effective_real_time_factor": round(wall_s / audio_s, 3) if audio_s else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Transcribe a directory or manifest of recordings.")
+    parser.add_argument("source", help="directory of audio files, or a manifest (paths or JSON lines)")
+    parser.add_argument("output_dir", help="where transcripts, the checkpoint and the summary go")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="files transcribed at once; the models are shared, so this bounds GPU memory use")
+    parser.add_argument("--profile", help="pipeline profile for items without one (profiles.py)")
+    parser.add_argument("--num-speakers", type=int, help="speaker count for items without one")
+    parser.add_argument("--checkpoint", help="checkpoint manifest (default: <output_dir>/checkpoint.jsonl)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output_dir, "checkpoint.jsonl"))
+
+    items = read_items(args.source)
+    pending = []
+    for item in items:
+        output_path = os.path.join(args.output_dir, output_name(item))
+        if item["audio_path"] in checkpoint.done and os.path.exists(output_path):
+            continue
+        pending.append((item, output_path))
+    skipped = len(items) - len(pending)
+    print(f"{len(items)} files, {skipped} already done, {len(pending)} to transcribe with {args.workers} worker(s)")
+    if not pending:
+        return 0
+
+    warm_up([item for item, _ in pending], args.profile)
+
+    results: List[Dict] = []
+    failed = 0
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="batch")
+    try:
+        futures = {
+            executor.submit(transcribe_one, item, output_path, args.profile, args.num_speakers): (item, output_path)
+            for item, output_path in pending
+        }
+        for n, future in enumerate(as_completed(futures), 1):
+            item, output_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{n}/{len(pending)}] ✗ {item['audio_path']}: {e}")
+                checkpoint.record(audio_path=item["audio_path"], status="failed", error=str(e))
+                continue
+            results.append(result)
+            checkpoint.record(audio_path=item["audio_path"], status="done", output=output_path, **result)
+            print(f"[{n}/{len(pending)}] ✓ {item['audio_path']} "
+                  f"({result['duration_s']:.0f}s audio in {result['elapsed_s']:.0f}s)")
+    except KeyboardInterrupt:
+        print("Interrupted; finished files are in the checkpoint, rerun to resume")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+    finally:
+        executor.shutdown(wait=True)
+
+        summary = summarize(results, failed, skipped, time.monotonic() - started)
+        with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        print(json.dumps(summary, indent=2))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
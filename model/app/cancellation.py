@@ -0,0 +1,94 @@
+"""
+Cooperative cancellation of running jobs.
+
+The backend tags each job with a token (job_token in the JSON body, or the
+X-Job-Token header) and POSTs /jobs/{token}/cancel to stop it, for example
+when the recording has been superseded by a re-upload. The job's thread
+checks for that at every chunk boundary (each Whisper encoder batch, each
+pyannote step) and between stages, and stops by raising JobCancelled, which
+frees its pipeline slot straight away.
+
+A cancel can arrive before its job does (the audio may still be streaming in,
+and the backend tells every endpoint); such tokens are remembered for
+CANCELLED_TOKEN_TTL_SECONDS so the job stops as soon as it starts.
+
+A job can also carry a deadline (deadline_s from the backend); at the same
+checkpoints, a job past it stops with DeadlineExceeded.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+CANCELLED_TOKEN_TTL_SECONDS = float(os.getenv("CANCELLED_TOKEN_TTL_SECONDS", "600"))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class DeadlineExceeded(JobCancelled):
+    """The job ran past its deadline."""
+
+
+_lock = threading.Lock()
+_running: Dict[str, threading.Event] = {}
+_cancelled_early: Dict[str, float] = {}
+# The pipeline runs a job start to finish on one thread
+_current = threading.local()
+
+
+def cancel(token: str) -> bool:
+    """Stop the job with this token. Returns whether it was running here."""
+    with _lock:
+        event = _running.get(token)
+        if event is not None:
+            event.set()
+            return True
+        now = time.monotonic()
+        for stale in [t for t, at in _cancelled_early.items() if now - at > CANCELLED_TOKEN_TTL_SECONDS]:
+            del _cancelled_early[stale]
+        _cancelled_early[token] = now
+        return False
+
+
+@contextmanager
+def cancellable(token: Optional[str], deadline: Optional[float] = None):
+    """
+    Run the block as the job with this token; check() inside it raises once
+    it's cancelled, or once time.monotonic() passes `deadline`.
+    """
+    if not token and deadline is None:
+        yield
+        return
+    event = threading.Event()
+    if token:
+        with _lock:
+            if _cancelled_early.pop(token, None) is not None:
+                event.set()
+            _running[token] = event
+    previous = getattr(_current, "event", None), getattr(_current, "deadline", None)
+    _current.event, _current.deadline = event, deadline
+    try:
+        yield
+    finally:
+        _current.event, _current.deadline = previous
+        if token:
+            with _lock:
+                _running.pop(token, None)
+
+
+def check() -> None:
+    """Raise JobCancelled if the current thread's job has been cancelled, DeadlineExceeded if it's overdue."""
+    event = getattr(_current, "event", None)
+    if event is not None and event.is_set():
+        raise JobCancelled()
+    deadline = getattr(_current, "deadline", None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded()
+
+
+def pyannote_hook(*args, **kwargs) -> None:
+    """pyannote pipeline `hook`, called after each step and embedding batch."""
+    check()
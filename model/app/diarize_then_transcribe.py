@@ -1,14 +1,33 @@
 #!/usr/bin/env python3
+import io
 import os
 import re
 import sys
-from typing import List, Dict, Tuple, Optional
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional, Union
 import torch
 import numpy as np
+import soundfile as sf
 import torchaudio
 from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline as hf_pipeline
 from pyannote.audio import Pipeline as PyannotePipeline
 
+try:
+    from . import cancellation
+    from .features import FeatureBundle, speech_concatenation
+    from .profiles import PipelineProfile, get_profile
+    from .speaker_enrollment import diarize_with_enrollment, speech_regions
+    from .tracing import span
+except ImportError:  # run as a script
+    import cancellation
+    from features import FeatureBundle, speech_concatenation
+    from profiles import PipelineProfile, get_profile
+    from speaker_enrollment import diarize_with_enrollment, speech_regions
+    from tracing import span
+
+# Whisper checkpoints kept loaded at once (one per profile model in use)
+MODEL_PIPELINE_CACHE_SIZE = int(os.getenv("MODEL_PIPELINE_CACHE_SIZE", "2"))
+
 # ----------------------------- Formatting utils -----------------------------
 
 def fmt_ts(t: float) -> str:
@@ -72,29 +91,66 @@ def load_audio_mono(path: str) -> Tuple[np.ndarray, int]:
         wav = wav.mean(dim=0, keepdim=True)
     return wav[0].numpy(), sr
 
+def decode_audio_bytes(data: Union[bytes, bytearray]) -> Tuple[np.ndarray, int]:
+    """Decode a WAV (or other libsndfile format) held in memory, without a temp file."""
+    wav, sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)  # [T, C]
+    return wav.mean(axis=1), sr
+
 # ----------------------------- Diarization ----------------------------------
 
+@lru_cache(maxsize=1)
+def get_diarization_pipeline():
+    """pyannote pipeline, loaded once per process and moved to the GPU if there is one."""
+    hf_token = os.getenv("HF_TOKEN")
+    if not hf_token:
+        raise ValueError("HF_TOKEN environment variable not set")
+    dia = PyannotePipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=hf_token)
+    if torch.cuda.is_available():
+        dia.to(torch.device("cuda"))
+    return dia
+
 def run_diarization(
-    audio_path: str,
+    audio_path: Optional[str],
     min_turn: float = 0.5,
     merge_gap: float = 0.3,
-    num_speakers: int = 2,  
-) -> List[Dict]:
+    num_speakers: Optional[int] = 2,  
+    waveform: Optional[Tuple[np.ndarray, int]] = None,
+    return_embeddings: bool = False,
+    min_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
+):
     """
     Returns CLEANED diarization turns: list of {"speaker","start","end"}, sorted by start.
     - drop turns shorter than min_turn
     - merge adjacent same-speaker turns when 0 <= gap <= merge_gap
+    Diarizes `waveform` (mono samples, sample rate) instead of reading audio_path when given.
+    With return_embeddings, returns (turns, {speaker: centroid embedding}).
+    min/max_speakers bound the estimate when num_speakers is None.
     """
-    hf_token = os.getenv("HF_TOKEN")
-    if not hf_token:
-        raise ValueError("HF_TOKEN environment variable not set")
-
-    dia = PyannotePipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=hf_token)
+    dia = get_diarization_pipeline()
     kwargs = {}
     if num_speakers is not None:
         kwargs["num_speakers"] = int(num_speakers)
-
-    diarization = dia(audio_path, **kwargs)
+    else:
+        if min_speakers is not None:
+            kwargs["min_speakers"] = int(min_speakers)
+        if max_speakers is not None:
+            kwargs["max_speakers"] = int(max_speakers)
+
+    if waveform is not None:
+        wav, sr = waveform
+        samples = torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32)).unsqueeze(0)  # [1, T]
+        audio_input = {"waveform": samples, "sample_rate": sr}
+    else:
+        audio_input = audio_path
+    # The hook runs between pyannote steps and embedding batches, where a cancelled job stops
+    if return_embeddings:
+        diarization, centroids = dia(
+            audio_input, return_embeddings=True, hook=cancellation.pyannote_hook, **kwargs,
+        )
+        embeddings = {label: centroids[i] for i, label in enumerate(diarization.labels())}
+    else:
+        diarization = dia(audio_input, hook=cancellation.pyannote_hook, **kwargs)
 
     # Collect raw turns
     raw = []
@@ -121,6 +177,8 @@ def run_diarization(
     if cur:
         merged.append(cur)
 
+    if return_embeddings:
+        return merged, embeddings
     return merged  # CLEANED (UNPADDED) turns
 
 def pad_turns(turns: List[Dict], pad: float, max_time: float) -> List[Dict]:
@@ -158,8 +216,8 @@ def get_device_and_dtype() -> Tuple[str, torch.dtype, int]:
     return device, dtype, pipe_device
 
 def load_whisper_pipeline(device: str, dtype: torch.dtype, pipe_device: int,
-                          chunk_len: int = 30, stride: int = 5):
-    model_id = "openai/whisper-large-v3"
+                          chunk_len: int = 30, stride: int = 5,
+                          model_id: str = "openai/whisper-large-v3"):
     model = AutoModelForSpeechSeq2Seq.from_pretrained(
         model_id, torch_dtype=dtype, low_cpu_mem_usage=True, use_safetensors=True
     )
@@ -177,6 +235,77 @@ def load_whisper_pipeline(device: str, dtype: torch.dtype, pipe_device: int,
     )
     return asr
 
+@lru_cache(maxsize=MODEL_PIPELINE_CACHE_SIZE)
+def get_asr_pipeline(model_id: str):
+    """
+    Loaded Whisper pipeline per checkpoint; chunking and batching are set per call.
+    The encoder runs once per batch of chunks, so a cancelled job stops there.
+    """
+    device, dtype, pipe_device = get_device_and_dtype()
+    asr = load_whisper_pipeline(device, dtype, pipe_device, model_id=model_id)
+    asr.model.get_encoder().register_forward_pre_hook(lambda module, args: cancellation.check())
+    _accept_precomputed_features(asr)
+    return asr
+
+def _accept_precomputed_features(asr) -> None:
+    """
+    Let the pipeline take {"precomputed_chunks": ...} (FeatureBundle.chunks)
+    in place of audio: those chunks go to the model as they are, instead of
+    being cut and run through the feature extractor here.
+    """
+    preprocess = asr.preprocess
+
+    def preprocess_or_precomputed(inputs, **params):
+        if isinstance(inputs, dict) and "precomputed_chunks" in inputs:
+            yield from inputs["precomputed_chunks"]
+        else:
+            yield from preprocess(inputs, **params)
+
+    asr.preprocess = preprocess_or_precomputed
+
+def transcribe_words(asr, wav: np.ndarray, sr: int, profile: PipelineProfile,
+                     features: Optional[FeatureBundle] = None) -> List[Dict]:
+    """
+    Word timestamps for the recording. With profile.vad, only speech regions
+    are decoded (concatenated) and the timestamps mapped back. Precomputed
+    features (features.py) made for the same settings replace VAD and
+    feature extraction; otherwise both run here.
+    """
+    asr_kwargs = {
+        "return_timestamps": "word",
+        "chunk_length_s": profile.chunk_length_s,
+        "stride_length_s": (profile.stride_s, profile.stride_s),
+        "batch_size": profile.batch_size,
+    }
+    precomputed = features is not None and features.matches(profile)
+    if features is not None and not precomputed:
+        print(f"Precomputed features don't match profile {profile.name}; extracting them here")
+
+    if not profile.vad:
+        if precomputed:
+            inputs = {"precomputed_chunks": features.chunks(asr.model.dtype)}
+        else:
+            inputs = {"array": wav, "sampling_rate": sr}
+        return normalize_words_from_asr_result(asr(inputs, **asr_kwargs))
+
+    if precomputed:
+        regions = features.speech_regions
+    else:
+        with span("vad") as vad:
+            regions = speech_regions(wav, sr)
+            vad.set_attribute("regions", len(regions))
+    if not regions:
+        return []
+    speech, to_original = speech_concatenation(wav, sr, regions)
+    print(f"VAD kept {len(speech) / float(sr):.1f}s of {len(wav) / float(sr):.1f}s")
+
+    if precomputed:
+        inputs = {"precomputed_chunks": features.chunks(asr.model.dtype)}
+    else:
+        inputs = {"array": speech, "sampling_rate": sr}
+    words = normalize_words_from_asr_result(asr(inputs, **asr_kwargs))
+    return [{**w, "start": to_original(w["start"]), "end": to_original(w["end"])} for w in words]
+
 def normalize_words_from_asr_result(
     result: Dict,
     min_word_dur_s: float = 0.12,
@@ -367,36 +496,76 @@ def smooth_unknown_islands(words: List[Dict]) -> List[Dict]:
 
 # ------------------------------- Public API ---------------------------------
 
-def diarize_then_transcribe(audio_path: str, output_path: str):
-    print(">>> Pipeline: ASR + diarization + alignment")
-    device, dtype, pipe_device = get_device_and_dtype()
-    asr = load_whisper_pipeline(device, dtype, pipe_device)
-
-    wav, sr = load_audio_mono(audio_path)
-    sample = {"array": wav, "sampling_rate": sr}
+def diarize_then_transcribe(audio_path: Optional[str], output_path: str,
+                            waveform: Optional[Tuple[np.ndarray, int]] = None,
+                            user_id: Optional[int] = None, num_speakers: Optional[int] = None,
+                            profile: Optional[PipelineProfile] = None,
+                            features: Optional[FeatureBundle] = None) -> PipelineProfile:
+    """
+    Transcribe audio_path, or `waveform` (mono samples, sample rate) when the
+    audio was received in memory, e.g. streamed by the backend, or the audio
+    in `features` when Whisper's features were precomputed (features.py).
+    With the recording clinician's user_id, speakers are labelled against
+    their enrolled voice (see speaker_enrollment.py). `profile` (profiles.py)
+    picks the model and settings; returns the profile used.
+    """
+    profile = profile or get_profile(None)
+    print(f">>> Pipeline: ASR + diarization + alignment (profile: {profile.name})")
+    with span("asr.load", model=profile.asr_model):
+        asr = get_asr_pipeline(profile.asr_model)
+
+    if waveform is None and features is not None:
+        waveform = features.waveform()
+    if waveform is not None:
+        wav, sr = waveform
+    else:
+        with span("audio.load"):
+            wav, sr = load_audio_mono(audio_path)
     audio_dur = len(wav) / float(sr)
 
     print("Transcribing…")
-    result = asr(sample, return_timestamps="word")
-    words = collapse_nearby_duplicate_words(normalize_words_from_asr_result(result))
+    with span("asr.transcribe", profile=profile.name, audio_s=round(audio_dur, 1), vad=profile.vad,
+              precomputed=features is not None) as asr_span:
+        words = collapse_nearby_duplicate_words(transcribe_words(asr, wav, sr, profile, features))
+        asr_span.set_attribute("words", len(words))
 
+    cancellation.check()
     print("Running diarization…")
-    turns_clean = run_diarization(audio_path)
-    turns_padded = pad_turns(turns_clean, pad=0.25, max_time=audio_dur)
-    bounds = diarization_boundaries(turns_padded)
-
-    labeled_words = []
-    for w in words:
-        spk, _ = find_label_for_span(w["start"], w["end"], turns_padded, bounds, min_overlap=0.06)
-        labeled_words.append({**w, "speaker": spk})
-
-    labeled_words = smooth_unknown_islands(labeled_words)
-    labeled_words.sort(key=lambda x: (x["start"], x["end"]))
-
-    segments = group_labeled_words(labeled_words, max_merge_gap_out=0.6)
-    segments = coalesce_consecutive_same_speaker(segments)
-    for seg in segments:
-        seg["text"] = collapse_adjacent_repeated_ngrams(seg["text"], max_n=6)
+    speakers = profile.speaker_kwargs(num_speakers)
+
+    def diarize(**extra):
+        return run_diarization(
+            audio_path, min_turn=profile.min_turn_s, waveform=waveform,
+            num_speakers=speakers.get("num_speakers"),
+            min_speakers=speakers.get("min_speakers"), max_speakers=speakers.get("max_speakers"),
+            **extra,
+        )
+
+    with span("diarization", enrollment=user_id is not None) as diarization_span:
+        if user_id is not None:
+            turns_clean = diarize_with_enrollment(
+                (wav, sr), user_id, speakers.get("num_speakers"), lambda: diarize(return_embeddings=True),
+            )
+        else:
+            turns_clean = diarize()
+        diarization_span.set_attribute("turns", len(turns_clean))
+    cancellation.check()
+    with span("alignment", words=len(words)):
+        turns_padded = pad_turns(turns_clean, pad=profile.turn_padding_s, max_time=audio_dur)
+        bounds = diarization_boundaries(turns_padded)
+
+        labeled_words = []
+        for w in words:
+            spk, _ = find_label_for_span(w["start"], w["end"], turns_padded, bounds, min_overlap=0.06)
+            labeled_words.append({**w, "speaker": spk})
+
+        labeled_words = smooth_unknown_islands(labeled_words)
+        labeled_words.sort(key=lambda x: (x["start"], x["end"]))
+
+        segments = group_labeled_words(labeled_words, max_merge_gap_out=0.6)
+        segments = coalesce_consecutive_same_speaker(segments)
+        for seg in segments:
+            seg["text"] = collapse_adjacent_repeated_ngrams(seg["text"], max_n=6)
 
     with open(output_path, "w", encoding="utf-8") as f:
         for seg in segments:
@@ -408,6 +577,7 @@ def diarize_then_transcribe(audio_path: str, output_path: str):
             f.write(line)
 
     print(f"\nTranscript saved to {output_path}")
+    return profile
 
 
 
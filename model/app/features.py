@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Whisper input features computed ahead of inference, so GPU hosts only run the
+encoder and decoder.
+
+A CPU host (this image without a GPU, serving POST /features, or this module
+as a CLI) turns a recording into a feature bundle for a given profile:
+  - the VAD speech regions, when the profile skips silence
+  - the log-mel input_features of every Whisper chunk, exactly as the
+    transformers ASR pipeline would chunk and extract them (same chunk
+    length, stride and mel settings; over the concatenated speech regions
+    with VAD)
+  - the audio itself as 16-bit PCM, because pyannote's segmentation and
+    embedding models work on the raw waveform and have no front end that can
+    be split off
+The GPU host feeds the chunks straight into the pipeline (see
+get_asr_pipeline in diarize_then_transcribe.py). A bundle made for different
+settings than the job's profile is still usable: it falls back to extracting
+features from the PCM.
+
+Bundle format, little-endian:
+    MAGIC (8 bytes) | header length (uint32) | JSON header | arrays
+The header holds the settings, the speech regions, each chunk's stride and
+is_last flag, and for every array its dtype, shape and offset from the start
+of the array data. Mel features are stored as float16 by default
+(FEATURES_DTYPE), about 38 KB per second of audio with the default 30s/5s
+chunking, plus 32 KB/s of PCM.
+
+    python -m app.features recording.wav recording.feat --profile mdt
+"""
+import argparse
+import bisect
+import json
+import os
+import struct
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .profiles import PipelineProfile, get_profile
+    from .tracing import span
+except ImportError:  # run as a script
+    from profiles import PipelineProfile, get_profile
+    from tracing import span
+
+MAGIC = b"DTTFEAT1"
+FEATURES_DTYPE = os.getenv("FEATURES_DTYPE", "float16")
+
+
+@lru_cache(maxsize=4)
+def get_feature_extractor(model_id: str):
+    """The checkpoint's Whisper feature extractor; needs only its preprocessor config, not the weights."""
+    from transformers import AutoFeatureExtractor
+    return AutoFeatureExtractor.from_pretrained(model_id)
+
+
+def profile_settings(profile: PipelineProfile) -> Dict:
+    """What a bundle's features depend on; a job can use them only if its profile agrees."""
+    return {
+        "asr_model": profile.asr_model,
+        "chunk_length_s": profile.chunk_length_s,
+        "stride_s": profile.stride_s,
+        "vad": profile.vad,
+    }
+
+
+def speech_concatenation(wav: np.ndarray, sr: int, regions: List[Tuple[float, float]]):
+    """
+    The speech regions of wav back to back, and a function mapping a time in
+    that audio to the original recording.
+    """
+    pieces, offsets, originals = [], [], []
+    position = 0.0
+    for start, end in regions:
+        piece = wav[int(start * sr):int(end * sr)]
+        pieces.append(piece)
+        offsets.append(position)
+        originals.append(start)
+        position += len(piece) / float(sr)
+
+    def to_original(t: float) -> float:
+        i = max(bisect.bisect_right(offsets, t) - 1, 0)
+        return originals[i] + (t - offsets[i])
+
+    return np.concatenate(pieces), to_original
+
+
+def chunk_features(feature_extractor, audio: np.ndarray, chunk_length_s: float,
+                   stride_s: float) -> Iterator[Tuple[np.ndarray, Tuple[int, int, int], bool]]:
+    """
+    (input_features [1, n_mels, frames], stride, is_last) per chunk, matching
+    the chunking of the transformers ASR pipeline (chunk_iter) for these settings.
+    """
+    sr = feature_extractor.sampling_rate
+    chunk_len = int(round(chunk_length_s * sr))
+    stride = int(round(stride_s * sr))
+    step = chunk_len - 2 * stride
+    for chunk_start in range(0, len(audio), step):
+        chunk_end = chunk_start + chunk_len
+        chunk = audio[chunk_start:chunk_end]
+        stride_left = 0 if chunk_start == 0 else stride
+        is_last = chunk_end >= len(audio)
+        stride_right = 0 if is_last else stride
+        if len(chunk) > stride_left:
+            processed = feature_extractor(chunk, sampling_rate=sr, return_tensors="np")
+            yield processed["input_features"], (len(chunk), stride_left, stride_right), is_last
+        if is_last:
+            break
+
+
+def _pack(header: Dict, arrays: Dict[str, np.ndarray]) -> bytes:
+    offset = 0
+    header["arrays"] = {}
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset, "nbytes": array.nbytes,
+        }
+        offset += array.nbytes
+    encoded = json.dumps(header).encode("utf-8")
+    return b"".join(
+        [MAGIC, struct.pack("<I", len(encoded)), encoded]
+        + [np.ascontiguousarray(a).tobytes() for a in arrays.values()]
+    )
+
+
+def extract_features(wav: np.ndarray, sr: int, profile: Optional[PipelineProfile] = None) -> bytes:
+    """Feature bundle for a mono recording under `profile` (default profile if None)."""
+    profile = profile or get_profile(None)
+    feature_extractor = get_feature_extractor(profile.asr_model)
+    if sr != feature_extractor.sampling_rate:
+        import torch
+        import torchaudio
+
+        wav = torchaudio.functional.resample(
+            torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32)), sr, feature_extractor.sampling_rate,
+        ).numpy()
+        sr = feature_extractor.sampling_rate
+
+    regions = None
+    audio = wav
+    if profile.vad:
+        try:
+            from .speaker_enrollment import speech_regions
+        except ImportError:  # run as a script
+            from speaker_enrollment import speech_regions
+        with span("vad") as vad:
+            regions = speech_regions(wav, sr)
+            vad.set_attribute("regions", len(regions))
+        audio = speech_concatenation(wav, sr, regions)[0] if regions else wav[:0]
+
+    mels, chunks = [], []
+    with span("features.log_mel", profile=profile.name) as mel_span:
+        if len(audio):
+            for input_features, stride, is_last in chunk_features(
+                    feature_extractor, audio, profile.chunk_length_s, profile.stride_s):
+                mels.append(input_features[0].astype(FEATURES_DTYPE))
+                chunks.append({"stride": list(stride), "is_last": is_last})
+        mel_span.set_attribute("chunks", len(chunks))
+    mel = np.stack(mels) if mels else np.zeros((0, feature_extractor.feature_size, 0), dtype=FEATURES_DTYPE)
+
+    # Lossless for the 16-bit WAV the backend converts uploads to
+    pcm = np.clip(np.round(wav * 32768.0), -32768, 32767).astype("<i2")
+    header = {
+        "sample_rate": sr,
+        "num_samples": len(wav),
+        "settings": profile_settings(profile),
+        "speech_regions": regions,
+        "chunks": chunks,
+    }
+    return _pack(header, {"pcm": pcm, "mel": mel.astype(mel.dtype.newbyteorder("<"))})
+
+
+@dataclass
+class FeatureBundle:
+    header: Dict
+    pcm: np.ndarray
+    mel: np.ndarray
+
+    @property
+    def sample_rate(self) -> int:
+        return self.header["sample_rate"]
+
+    @property
+    def speech_regions(self) -> Optional[List[Tuple[float, float]]]:
+        regions = self.header.get("speech_regions")
+        return [tuple(r) for r in regions] if regions is not None else None
+
+    def waveform(self) -> Tuple[np.ndarray, int]:
+        """(mono float32 samples, sample rate), as decode_audio_bytes returns them."""
+        return self.pcm.astype(np.float32) / 32768.0, self.sample_rate
+
+    def matches(self, profile: PipelineProfile) -> bool:
+        return self.header.get("settings") == profile_settings(profile)
+
+    def chunks(self, dtype=None) -> Iterator[Dict]:
+        """Pipeline model inputs, one per chunk, in the form the ASR pipeline's preprocess yields them."""
+        import torch
+
+        for i, chunk in enumerate(self.header["chunks"]):
+            input_features = torch.from_numpy(np.array(self.mel[i:i + 1], dtype=np.float32))
+            if dtype is not None:
+                input_features = input_features.to(dtype=dtype)
+            yield {"is_last": chunk["is_last"], "stride": tuple(chunk["stride"]), "input_features": input_features}
+
+
+def load_features(data: bytes) -> FeatureBundle:
+    """Parse a bundle made by extract_features; ValueError if it isn't one."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a feature bundle")
+    (header_len,) = struct.unpack_from("<I", data, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(bytes(data[start:start + header_len]).decode("utf-8"))
+    base = start + header_len
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        arrays[name] = np.frombuffer(
+            data, dtype=np.dtype(spec["dtype"]), count=int(np.prod(spec["shape"])), offset=base + spec["offset"],
+        ).reshape(spec["shape"])
+    return FeatureBundle(header, arrays["pcm"], arrays["mel"])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute Whisper features for a recording.")
+    parser.add_argument("audio", help="audio file")
+    parser.add_argument("output", help="feature bundle to write")
+    parser.add_argument("--profile", help="pipeline profile the features are for (profiles.py)")
+    args = parser.parse_args(argv)
+
+    try:
+        from .diarize_then_transcribe import load_audio_mono
+    except ImportError:  # run as a script
+        from diarize_then_transcribe import load_audio_mono
+    wav, sr = load_audio_mono(args.audio)
+    data = extract_features(wav, sr, get_profile(args.profile))
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print(f"Wrote {len(data)} bytes of features for {len(wav) / float(sr):.1f}s of audio to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
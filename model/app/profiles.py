@@ -0,0 +1,104 @@
+"""
+Named pipeline profiles, chosen per job.
+
+The backend asks for a profile by name (the appointment's meeting type unless
+it says otherwise); unknown names fall back to "default", which is the
+configuration every job used before profiles existed. Profiles can be
+replaced or added without a rebuild through a JSON file named by
+MODEL_PROFILES_FILE: {"gp": {"asr_model": "...", "batch_size": 4}, ...}.
+Fields not given keep the built-in value, or the dataclass default for a new
+profile.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, Optional
+
+DEFAULT_PROFILE = "default"
+
+
+@dataclass(frozen=True)
+class PipelineProfile:
+    name: str
+    # Whisper checkpoint (transformers ASR pipeline); smaller models trade accuracy for latency
+    asr_model: str = "openai/whisper-large-v3"
+    chunk_length_s: int = 30
+    stride_s: int = 5
+    # Chunks of one recording decoded together; only pays off on GPU
+    batch_size: int = 1
+    # Exact speaker count (the job's count wins if it sends one); None -> estimate within bounds
+    num_speakers: Optional[int] = 2
+    min_speakers: Optional[int] = None
+    max_speakers: Optional[int] = None
+    # Run ASR on VAD speech regions only, skipping silence
+    vad: bool = False
+    turn_padding_s: float = 0.25
+    min_turn_s: float = 0.5
+
+    def speaker_kwargs(self, requested: Optional[int] = None) -> Dict[str, int]:
+        """pyannote speaker-count arguments for this profile and the job's requested count."""
+        if self.num_speakers is not None:
+            return {"num_speakers": int(requested or self.num_speakers)}
+        kwargs = {}
+        if self.min_speakers is not None:
+            kwargs["min_speakers"] = self.min_speakers
+        if self.max_speakers is not None:
+            kwargs["max_speakers"] = self.max_speakers
+        return kwargs
+
+    def summary(self) -> Dict:
+        return asdict(self)
+
+
+PROFILES: Dict[str, PipelineProfile] = {
+    DEFAULT_PROFILE: PipelineProfile(DEFAULT_PROFILE),
+    # One-to-one consultations, reviewed straight after the appointment:
+    # distilled model, two speakers, nothing extra
+    "gp": PipelineProfile(
+        "gp",
+        asr_model="distil-whisper/distil-large-v3",
+        chunk_length_s=25,
+        stride_s=3,
+        batch_size=8,
+        num_speakers=2,
+    ),
+    # Long multi-speaker meetings, nobody waiting on them: full model, large
+    # batches, silence skipped, speaker count estimated
+    "mdt": PipelineProfile(
+        "mdt",
+        batch_size=16,
+        num_speakers=None,
+        min_speakers=2,
+        max_speakers=10,
+        vad=True,
+        turn_padding_s=0.15,
+        min_turn_s=0.3,
+    ),
+    # Ward rounds: moving between bays, lots of silence and background
+    "ward": PipelineProfile(
+        "ward",
+        batch_size=8,
+        num_speakers=None,
+        min_speakers=2,
+        max_speakers=6,
+        vad=True,
+    ),
+}
+
+
+def _load_overrides() -> None:
+    path = os.getenv("MODEL_PROFILES_FILE")
+    if not path:
+        return
+    with open(path, "r") as f:
+        overrides = json.load(f)
+    for name, fields in overrides.items():
+        base = PROFILES.get(name, PipelineProfile(name))
+        PROFILES[name] = replace(base, **{**fields, "name": name})
+
+
+_load_overrides()
+
+
+def get_profile(name: Optional[str]) -> PipelineProfile:
+    return PROFILES.get((name or "").lower()) or PROFILES[DEFAULT_PROFILE]
@@ -0,0 +1,286 @@
+"""
+Per-clinician speaker enrollment.
+
+Every consultation has the recording clinician as one of the speakers, so we
+keep a voice embedding per user_id on disk (SPEAKER_EMBEDDINGS_DIR/<user_id>.npz)
+and use it to:
+  - label that speaker CLINICIAN in every transcript, with the other speakers
+    numbered SPEAKER_01, SPEAKER_02... in order of first appearance, so labels
+    mean the same thing across recordings
+  - skip clustering altogether for small meetings: speech regions from VAD are
+    cut into short windows, each window is embedded and assigned to the nearer
+    of the clinician centroid and a centroid of everything else
+
+Enrollment needs no separate step. Until a user has a centroid, each full
+diarization stores its per-speaker embeddings as candidates; once
+ENROLL_BOOTSTRAP_RECORDINGS recordings are in, the voice that recurs across
+them is the clinician and its mean becomes the centroid. Later confident
+matches keep refining it as a running mean.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+SPEAKER_EMBEDDINGS_DIR = os.getenv("SPEAKER_EMBEDDINGS_DIR", "/models/speaker_embeddings")
+# Cosine similarity above which a speaker is taken to be the enrolled clinician
+ENROLL_MATCH_THRESHOLD = float(os.getenv("ENROLL_MATCH_THRESHOLD", "0.5"))
+ENROLL_BOOTSTRAP_RECORDINGS = int(os.getenv("ENROLL_BOOTSTRAP_RECORDINGS", "3"))
+# Recordings whose candidates are kept for bootstrapping
+ENROLL_MAX_RECORDINGS = 20
+# Meetings with at most this many speakers skip clustering once enrolled
+ENROLL_FAST_PATH_MAX_SPEAKERS = int(os.getenv("ENROLL_FAST_PATH_MAX_SPEAKERS", "2"))
+# The fast path is abandoned for full diarization if fewer windows than this match the clinician
+ENROLL_FAST_PATH_MIN_SHARE = 0.1
+
+EMBEDDING_MODEL = "pyannote/wespeaker-voxceleb-resnet34-LM"
+VAD_MODEL = "pyannote/segmentation-3.0"
+WINDOW_SECONDS = 1.5
+WINDOW_STEP = 0.75
+
+CLINICIAN_LABEL = "CLINICIAN"
+
+_profile_lock = threading.Lock()
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norm, 1e-8)
+
+
+@dataclass
+class ClinicianProfile:
+    user_id: str
+    centroid: Optional[np.ndarray] = None
+    count: int = 0
+    candidates: np.ndarray = field(default_factory=lambda: np.zeros((0, 0), dtype=np.float32))
+    candidate_recordings: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    recordings: int = 0
+
+    @property
+    def path(self) -> str:
+        return os.path.join(SPEAKER_EMBEDDINGS_DIR, f"{self.user_id}.npz")
+
+    @classmethod
+    def load(cls, user_id: str) -> "ClinicianProfile":
+        profile = cls(str(user_id))
+        if os.path.exists(profile.path):
+            with np.load(profile.path) as data:
+                centroid = data["centroid"]
+                profile.centroid = centroid if centroid.size else None
+                profile.count = int(data["count"])
+                profile.candidates = data["candidates"]
+                profile.candidate_recordings = data["candidate_recordings"]
+                profile.recordings = int(data["recordings"])
+        return profile
+
+    def save(self) -> None:
+        os.makedirs(SPEAKER_EMBEDDINGS_DIR, exist_ok=True)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroid=self.centroid if self.centroid is not None else np.zeros(0, dtype=np.float32),
+            count=self.count,
+            candidates=self.candidates,
+            candidate_recordings=self.candidate_recordings,
+            recordings=self.recordings,
+        )
+        os.replace(tmp_path, self.path)
+
+    @property
+    def enrolled(self) -> bool:
+        return self.centroid is not None
+
+    def match(self, embeddings: np.ndarray) -> Optional[int]:
+        """Index of the embedding closest to the clinician, if it is close enough."""
+        if not self.enrolled or len(embeddings) == 0:
+            return None
+        sims = _normalize(embeddings) @ self.centroid
+        best = int(np.argmax(sims))
+        return best if sims[best] >= ENROLL_MATCH_THRESHOLD else None
+
+    def update(self, embedding: np.ndarray) -> None:
+        """Fold a confident clinician embedding into the running mean."""
+        embedding = _normalize(embedding)
+        self.count += 1
+        self.centroid = _normalize(self.centroid + (embedding - self.centroid) / self.count)
+
+    def add_candidates(self, embeddings: np.ndarray) -> None:
+        """Remember one recording's speaker embeddings and try to bootstrap a centroid."""
+        embeddings = _normalize(embeddings.astype(np.float32))
+        if self.candidates.size == 0:
+            self.candidates = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+        self.candidates = np.concatenate([self.candidates, embeddings])
+        self.candidate_recordings = np.concatenate([
+            self.candidate_recordings, np.full(len(embeddings), self.recordings, dtype=np.int64),
+        ])
+        self.recordings += 1
+        keep = self.candidate_recordings > self.recordings - 1 - ENROLL_MAX_RECORDINGS
+        self.candidates = self.candidates[keep]
+        self.candidate_recordings = self.candidate_recordings[keep]
+        self._bootstrap()
+
+    def _bootstrap(self) -> None:
+        recordings = np.unique(self.candidate_recordings)
+        if len(recordings) < ENROLL_BOOTSTRAP_RECORDINGS:
+            return
+        sims = self.candidates @ self.candidates.T
+        # For each candidate, its best match in every other recording
+        best_per_recording = np.stack([
+            np.where(self.candidate_recordings == r, sims, -1.0).max(axis=1) for r in recordings
+        ], axis=1)
+        own = recordings[None, :] == self.candidate_recordings[:, None]
+        recurrence = np.where(own, 0.0, best_per_recording >= ENROLL_MATCH_THRESHOLD).sum(axis=1)
+        anchor = int(np.argmax(recurrence))
+        if recurrence[anchor] + 1 < ENROLL_BOOTSTRAP_RECORDINGS:
+            return
+        members = [
+            int(np.argmax(np.where(self.candidate_recordings == r, sims[anchor], -1.0)))
+            for r in recordings
+        ]
+        members = [m for m in members if sims[anchor, m] >= ENROLL_MATCH_THRESHOLD]
+        self.centroid = _normalize(self.candidates[members].mean(axis=0))
+        self.count = len(members)
+        print(f"Enrolled clinician {self.user_id} from {len(members)} recordings")
+
+
+def stable_labels(turns: List[Dict], clinician_label: Optional[str]) -> Dict[str, str]:
+    """Map diarization labels to CLINICIAN / SPEAKER_01.. (others in order of first appearance)."""
+    mapping: Dict[str, str] = {}
+    if clinician_label is not None:
+        mapping[clinician_label] = CLINICIAN_LABEL
+    n = 0
+    for turn in sorted(turns, key=lambda t: t["start"]):
+        if turn["speaker"] not in mapping:
+            n += 1
+            mapping[turn["speaker"]] = f"SPEAKER_{n:02d}"
+    return mapping
+
+
+# ----------------------------- Fast path ------------------------------------
+
+@lru_cache(maxsize=1)
+def _embedding_model():
+    from pyannote.audio import Model
+    return Model.from_pretrained(EMBEDDING_MODEL, use_auth_token=os.getenv("HF_TOKEN"))
+
+
+@lru_cache(maxsize=1)
+def _vad_pipeline():
+    from pyannote.audio import Model
+    from pyannote.audio.pipelines import VoiceActivityDetection
+    vad = VoiceActivityDetection(segmentation=Model.from_pretrained(VAD_MODEL, use_auth_token=os.getenv("HF_TOKEN")))
+    vad.instantiate({"min_duration_on": 0.0, "min_duration_off": 0.0})
+    return vad
+
+
+def speech_regions(wav: np.ndarray, sr: int) -> List[Tuple[float, float]]:
+    """(start, end) seconds of speech, from the same VAD the fast path uses."""
+    audio = {"waveform": torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32)).unsqueeze(0), "sample_rate": sr}
+    return [(float(s.start), float(s.end)) for s in _vad_pipeline()(audio).get_timeline().support()]
+
+
+def _window_embeddings(audio: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Embeddings of WINDOW_SECONDS windows inside speech, and each window's (start, end)."""
+    from pyannote.audio import Inference
+
+    speech = list(_vad_pipeline()(audio).get_timeline().support())
+    inference = Inference(_embedding_model(), window="sliding", duration=WINDOW_SECONDS, step=WINDOW_STEP)
+    features = inference(audio)
+
+    vectors, spans = [], []
+    region = 0
+    for i, vector in enumerate(features.data):
+        middle = features.sliding_window[i].middle
+        while region < len(speech) and speech[region].end < middle:
+            region += 1
+        if region == len(speech):
+            break
+        if speech[region].start > middle or np.isnan(vector).any():
+            continue
+        vectors.append(vector)
+        spans.append((
+            max(middle - WINDOW_STEP / 2, speech[region].start),
+            min(middle + WINDOW_STEP / 2, speech[region].end),
+        ))
+    return np.asarray(vectors, dtype=np.float32), np.asarray(spans, dtype=np.float32)
+
+
+def assign_to_clinician(audio: Dict, profile: ClinicianProfile) -> Optional[Tuple[List[Dict], np.ndarray]]:
+    """
+    Two-speaker diarization by nearest centroid: CLINICIAN vs everyone else.
+    Returns (turns, clinician embedding), or None when the clinician doesn't
+    clearly appear and full diarization should run instead.
+    """
+    vectors, spans = _window_embeddings(audio)
+    if len(vectors) == 0:
+        return None
+    x = _normalize(vectors)
+    to_clinician = x @ profile.centroid
+    confident = to_clinician >= ENROLL_MATCH_THRESHOLD
+    if confident.mean() < ENROLL_FAST_PATH_MIN_SHARE or confident.all():
+        return None
+
+    # One refinement step: centroid of the rest, then nearest of the two
+    other = _normalize(x[~confident].mean(axis=0))
+    is_clinician = to_clinician >= x @ other
+
+    turns: List[Dict] = []
+    for (start, end), clinician in zip(spans, is_clinician):
+        speaker = CLINICIAN_LABEL if clinician else "SPEAKER_01"
+        if turns and turns[-1]["speaker"] == speaker and start - turns[-1]["end"] <= WINDOW_STEP:
+            turns[-1]["end"] = float(end)
+        else:
+            turns.append({"speaker": speaker, "start": float(start), "end": float(end)})
+    return turns, x[confident].mean(axis=0)
+
+
+# ----------------------------- Entry point ----------------------------------
+
+def diarize_with_enrollment(
+    waveform: Tuple[np.ndarray, int],
+    user_id,
+    num_speakers: Optional[int],
+    full_diarization: Callable[[], Tuple[List[Dict], Dict[str, np.ndarray]]],
+) -> List[Dict]:
+    """
+    Diarize a recording made by user_id. full_diarization() runs the normal
+    clustering pipeline and returns (turns, {label: embedding}); it is only
+    called when the enrolled fast path can't be used.
+    """
+    with _profile_lock:
+        profile = ClinicianProfile.load(user_id)
+
+    wav, sr = waveform
+    if profile.enrolled and num_speakers is not None and num_speakers <= ENROLL_FAST_PATH_MAX_SPEAKERS:
+        audio = {"waveform": torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32)).unsqueeze(0), "sample_rate": sr}
+        result = assign_to_clinician(audio, profile)
+        if result is not None:
+            turns, clinician_embedding = result
+            with _profile_lock:
+                profile = ClinicianProfile.load(user_id)
+                profile.update(clinician_embedding)
+                profile.save()
+            print(f"Assigned speakers by enrolled voice for user {user_id}")
+            return turns
+
+    turns, embeddings = full_diarization()
+    labels = [label for label, vector in embeddings.items() if not np.isnan(vector).any()]
+    vectors = np.asarray([embeddings[label] for label in labels], dtype=np.float32)
+
+    with _profile_lock:
+        profile = ClinicianProfile.load(user_id)
+        matched = profile.match(vectors) if len(labels) else None
+        if matched is not None:
+            profile.update(vectors[matched])
+        elif not profile.enrolled and len(labels):
+            profile.add_candidates(vectors)
+            matched = profile.match(vectors)
+        profile.save()
+
+    mapping = stable_labels(turns, labels[matched] if matched is not None else None)
+    return [{**turn, "speaker": mapping[turn["speaker"]]} for turn in turns]
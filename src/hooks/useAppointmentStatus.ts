@@ -1,34 +1,78 @@
 import { useState, useEffect } from 'react';
 import type { AppointmentStatus } from '@/components/AppointmentCard';
 
+type StatusListener = (status: AppointmentStatus | null) => void;
+
+// All mounted cards share one poller: every 10 seconds the ids of every
+// subscribed card go to the backend in a single batch request.
+const POLL_INTERVAL_MS = 10000;
+const listeners = new Map<string, Set<StatusListener>>();
+let pollTimer: ReturnType<typeof setInterval> | null = null;
+let pendingFetch: ReturnType<typeof setTimeout> | null = null;
+
+async function fetchStatuses() {
+  const ids = Array.from(listeners.keys());
+  if (ids.length === 0) return;
+
+  let statuses: Record<string, AppointmentStatus> = {};
+  try {
+    const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+    const response = await fetch(`${apiUrl}/appointments/status`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ appointment_ids: ids }),
+    });
+
+    if (response.ok) {
+      const result = await response.json();
+      statuses = result.statuses || {};
+    }
+  } catch (error) {
+    console.log('Failed to fetch appointment statuses:', error);
+    // Keep current statuses on error
+  }
+
+  for (const id of ids) {
+    listeners.get(id)?.forEach((listener) => listener(statuses[id] ?? null));
+  }
+}
+
+// Cards mount in a burst; coalesce them into one request instead of one each
+function scheduleFetch() {
+  if (pendingFetch) return;
+  pendingFetch = setTimeout(() => {
+    pendingFetch = null;
+    fetchStatuses();
+  }, 0);
+}
+
+function subscribe(appointmentId: string, listener: StatusListener) {
+  if (!listeners.has(appointmentId)) listeners.set(appointmentId, new Set());
+  listeners.get(appointmentId)!.add(listener);
+
+  scheduleFetch();
+  if (!pollTimer) pollTimer = setInterval(fetchStatuses, POLL_INTERVAL_MS);
+
+  return () => {
+    const set = listeners.get(appointmentId);
+    set?.delete(listener);
+    if (set && set.size === 0) listeners.delete(appointmentId);
+    if (listeners.size === 0 && pollTimer) {
+      clearInterval(pollTimer);
+      pollTimer = null;
+    }
+  };
+}
+
 export function useAppointmentStatus(appointmentId: string) {
   const [status, setStatus] = useState<AppointmentStatus>('Not started');
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    const fetchStatus = async () => {
-      try {
-        const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-        const response = await fetch(`${apiUrl}/appointments/${appointmentId}/status`);
-        
-        if (response.ok) {
-          const result = await response.json();
-          setStatus(result.status as AppointmentStatus);
-        }
-      } catch (error) {
-        console.log('Failed to fetch appointment status:', error);
-        // Keep default status on error
-      } finally {
-        setLoading(false);
-      }
-    };
-
-    fetchStatus();
-    
-    // Poll for status updates every 10 seconds
-    const interval = setInterval(fetchStatus, 10000);
-    
-    return () => clearInterval(interval);
+    return subscribe(appointmentId, (next) => {
+      if (next) setStatus(next);
+      setLoading(false);
+    });
   }, [appointmentId]);
 
   return { status, loading };
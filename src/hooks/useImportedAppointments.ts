@@ -10,7 +10,19 @@ interface ImportedAppointment {
   time: string;
 }
 
-export function useImportedAppointments() {
+const toDateParam = (date: Date) => {
+  const y = date.getFullYear();
+  const m = String(date.getMonth() + 1).padStart(2, '0');
+  const d = String(date.getDate()).padStart(2, '0');
+  return `${y}-${m}-${d}`;
+};
+
+// Keep in step with DASHBOARD_PAGE_SIZE in backend/data_access.py, which pre-warms this page
+const PAGE_SIZE = 500;
+
+// Only the selected day's appointments are fetched; the list is paged by keyset cursor
+export function useImportedAppointments(selectedDate: Date) {
+  const day = toDateParam(selectedDate);
   const [appointments, setAppointments] = useState<ImportedAppointment[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
@@ -25,16 +37,24 @@ export function useImportedAppointments() {
     try {
       setLoading(true);
       const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-      const response = await fetch(`${apiUrl}/appointments/user/${user.user_id}?is_dummy=false`);
-      
-      if (!response.ok) {
-        throw new Error('Failed to fetch imported appointments');
-      }
-      
-      const data = await response.json();
+      const rows: any[] = [];
+      let cursor: string | null = null;
+      do {
+        const params = new URLSearchParams({ is_dummy: 'false', date_from: day, date_to: day, limit: String(PAGE_SIZE) });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${apiUrl}/appointments/user/${user.user_id}?${params}`);
+
+        if (!response.ok) {
+          throw new Error('Failed to fetch imported appointments');
+        }
+
+        const data = await response.json();
+        rows.push(...data.appointments);
+        cursor = data.next_cursor;
+      } while (cursor);
       
       // Transform the data to match expected format and add time formatting
-      const formattedAppointments = data.appointments.map((apt: any) => ({
+      const formattedAppointments = rows.map((apt: any) => ({
         ...apt,
         time: formatTime(apt.time)
       }));
@@ -48,7 +68,7 @@ export function useImportedAppointments() {
     } finally {
       setLoading(false);
     }
-  }, [user]);
+  }, [user, day]);
 
   useEffect(() => {
     fetchImportedAppointments();
@@ -2,8 +2,43 @@ import { useState, useEffect, useCallback, useRef } from 'react';
 import { useToast } from '@/hooks/use-toast';
 import { useAudioRecording } from '@/hooks/useAudioRecording';
 import { useAuth } from '@/hooks/useAuth';
+import { connectTranscriptionEvents, waitForTranscript } from '@/lib/transcriptionEvents';
 
 const LS_KEY = (appointmentId: string) => `mt:lastAudioId:${appointmentId}`;
+const TRANSCRIPTION_TIMEOUT_MS = 120000;
+
+// Last transcript text and version known to be on the server; edits are sent as a patch against it
+interface SavedTranscript {
+  text: string;
+  version: number;
+}
+
+interface EditOp {
+  pos: number;
+  delete: number;
+  insert: string;
+}
+
+// One op replacing the span between the common prefix and suffix. Positions
+// count code points, as the backend's Python strings do (not UTF-16 units).
+function diffOps(before: string, after: string): EditOp[] {
+  const a = Array.from(before);
+  const b = Array.from(after);
+  let prefix = 0;
+  while (prefix < a.length && prefix < b.length && a[prefix] === b[prefix]) prefix++;
+  let suffix = 0;
+  while (
+    suffix < a.length - prefix &&
+    suffix < b.length - prefix &&
+    a[a.length - 1 - suffix] === b[b.length - 1 - suffix]
+  ) suffix++;
+  if (prefix === a.length && prefix === b.length) return [];
+  return [{
+    pos: prefix,
+    delete: a.length - prefix - suffix,
+    insert: b.slice(prefix, b.length - suffix).join(''),
+  }];
+}
 
 export function useTranscription(
   appointmentId?: string,
@@ -20,6 +55,7 @@ export function useTranscription(
   const { toast } = useToast();
   const { user } = useAuth();
   const isLoadingRef = useRef(false);
+  const savedRef = useRef<SavedTranscript | null>(null);
 
   const {
     recordingState,
@@ -42,6 +78,9 @@ export function useTranscription(
       if (!r.ok) return null;
       const data = await r.json();
       const t: string | undefined = data?.transcript;
+      if (t !== undefined && typeof data?.version === 'number') {
+        savedRef.current = { text: t, version: data.version };
+      }
       return (t && t.trim()) ? t : null;
     } catch (error) {
       console.log('Error fetching transcript:', error);
@@ -181,6 +220,7 @@ export function useTranscription(
         formData.append("manual_tags", JSON.stringify(manualTags));
       }
 
+      await connectTranscriptionEvents(backendUrl, user.user_id);
       const response = await fetch(`${backendUrl}/transcribe`, { method: 'POST', body: formData });
       if (!response.ok) {
         const msg = await response.text();
@@ -194,27 +234,14 @@ export function useTranscription(
       localStorage.setItem(LS_KEY(appointmentId), uploadedAudioId);
       setTranscriptionSent(true);
 
-      // Poll for transcription result
-      const maxAttempts = 60;
-      for (let i = 0; i < maxAttempts; i++) {
-        const s = await fetch(`${backendUrl}/transcribe/status/${uploadedAudioId}`);
-        if (!s.ok) throw new Error(`Status check failed: ${s.status}`);
-        const statusData = await s.json();
-
-        if (statusData.status === 'completed' && statusData.transcript) {
-          setTranscriptionText(statusData.transcript);
-          setIsProcessing(false);
-          resetRecording();
-          toast({ title: "Transcription Complete", description: "Your audio has been successfully transcribed." });
-          return;
-        }
-        if (statusData.status === 'error') {
-          throw new Error('Transcription failed on server');
-        }
-        await new Promise(res => setTimeout(res, 2000));
-      }
-
-      throw new Error('Transcription timeout - please try again');
+      // Wait for the pushed transcription result
+      const transcript = await waitForTranscript(backendUrl, user.user_id, uploadedAudioId, TRANSCRIPTION_TIMEOUT_MS);
+      // A fresh model transcript starts at version 0
+      savedRef.current = { text: transcript, version: 0 };
+      setTranscriptionText(transcript);
+      setIsProcessing(false);
+      resetRecording();
+      toast({ title: "Transcription Complete", description: "Your audio has been successfully transcribed." });
     } catch (error) {
       console.error('Error sending for transcription:', error);
       setIsProcessing(false);
@@ -252,6 +279,7 @@ export function useTranscription(
         formData.append("manual_tags", JSON.stringify(manualTags));
       }
 
+      await connectTranscriptionEvents(backendUrl, user.user_id);
       const response = await fetch(`${backendUrl}/transcribe`, {
         method: "POST",
         body: formData,
@@ -268,25 +296,12 @@ export function useTranscription(
       localStorage.setItem(LS_KEY(appointmentId), uploadedAudioId);
       setTranscriptionSent(true);
 
-      const maxAttempts = 60;
-      for (let i = 0; i < maxAttempts; i++) {
-        const s = await fetch(`${backendUrl}/transcribe/status/${uploadedAudioId}`);
-        if (!s.ok) throw new Error(`Status check failed: ${s.status}`);
-        const statusData = await s.json();
-
-        if (statusData.status === "completed" && statusData.transcript) {
-          setTranscriptionText(statusData.transcript);
-          setIsProcessing(false);
-          toast({ title: "Transcription Complete", description: "Your audio has been successfully transcribed." });
-          return;
-        }
-        if (statusData.status === "error") {
-          throw new Error("Transcription failed on server");
-        }
-        await new Promise((res) => setTimeout(res, 2000));
-      }
-
-      throw new Error("Transcription timeout - please try again");
+      const transcript = await waitForTranscript(backendUrl, user.user_id, uploadedAudioId, TRANSCRIPTION_TIMEOUT_MS);
+      // A fresh model transcript starts at version 0
+      savedRef.current = { text: transcript, version: 0 };
+      setTranscriptionText(transcript);
+      setIsProcessing(false);
+      toast({ title: "Transcription Complete", description: "Your audio has been successfully transcribed." });
     } catch (err) {
       setIsProcessing(false);
       setTranscriptionSent(false);
@@ -307,18 +322,34 @@ export function useTranscription(
       const audioId = localStorage.getItem(LS_KEY(appointmentId));
       if (!audioId) throw new Error("Missing audio ID");
 
-      const formData = new FormData();
-      formData.append("new_text", transcriptionText);
-
-      const res = await fetch(`${backendUrl}/transcribe/update/${audioId}`, {
-        method: "POST",
-        body: formData,
-      });
-
-      if (!res.ok) {
-        const msg = await res.text();
-        throw new Error(`Update failed: ${msg}`);
+      const edited = transcriptionText;
+      const sendPatch = async (base: SavedTranscript) => {
+        const ops = diffOps(base.text, edited);
+        if (ops.length === 0) return base;
+        const res = await fetch(`${backendUrl}/transcribe/patch/${audioId}`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ base_version: base.version, ops }),
+        });
+        if (res.status === 409) return null;
+        if (!res.ok) {
+          const msg = await res.text();
+          throw new Error(`Update failed: ${msg}`);
+        }
+        const data = await res.json();
+        return { text: edited, version: data.version as number };
+      };
+
+      let saved = savedRef.current ? await sendPatch(savedRef.current) : null;
+      if (!saved) {
+        // Unknown or outdated base (saved elsewhere meanwhile): diff against the server's current text once more
+        savedRef.current = null;
+        await fetchTranscriptById(audioId);
+        if (!savedRef.current) throw new Error("Update failed: transcript not found");
+        saved = await sendPatch(savedRef.current);
+        if (!saved) throw new Error("Update failed: the transcript was changed elsewhere, please try again");
       }
+      savedRef.current = saved;
 
       toast({
         title: "Transcription Saved",
@@ -0,0 +1,171 @@
+// Per-user Server-Sent Events stream of transcription status changes.
+// One EventSource per user is shared by every recording that user is waiting on.
+// Events carry ids: after a dropped connection the server replays what was
+// missed (Last-Event-ID), and each recording still awaited gets a status check.
+
+export interface TranscriptionEvent {
+  audio_id: string;
+  status: string;
+  user_id: number | null;
+  transcript?: string;
+  error?: string;
+  superseded_by?: string;
+}
+
+type EventListener = (event: TranscriptionEvent) => void;
+
+interface UserStream {
+  backendUrl: string;
+  userId: number;
+  source: EventSource;
+  // Each listener with the audio_id it waits for
+  listeners: Map<EventListener, string>;
+  // Latest event per audio_id, so a waiter that attaches late still sees it
+  latest: Map<string, TranscriptionEvent>;
+  lastEventId: string;
+  disconnected: boolean;
+  opened: Promise<void>;
+}
+
+// Delay before reopening a stream the browser gave up on
+const REOPEN_DELAY_MS = 3000;
+
+const streams = new Map<number, UserStream>();
+
+function deliver(stream: UserStream, event: TranscriptionEvent) {
+  stream.latest.set(event.audio_id, event);
+  stream.listeners.forEach((_, listener) => listener(event));
+}
+
+function checkStatus(stream: UserStream, audioId: string) {
+  fetch(`${stream.backendUrl}/transcribe/status/${audioId}`)
+    .then((r) => (r.ok ? r.json() : null))
+    .then((statusData) => {
+      if (statusData) deliver(stream, { ...statusData, user_id: stream.userId });
+    })
+    .catch(() => {
+      // Stream will still deliver the result
+    });
+}
+
+function openSource(stream: UserStream): EventSource {
+  // EventSource sends Last-Event-ID itself when it reconnects, but not on a new instance
+  const resume = stream.lastEventId ? `&last_event_id=${encodeURIComponent(stream.lastEventId)}` : '';
+  const source = new EventSource(`${stream.backendUrl}/transcribe/events?user_id=${stream.userId}${resume}`);
+
+  source.addEventListener('status', (e) => {
+    const message = e as MessageEvent;
+    if (message.lastEventId) stream.lastEventId = message.lastEventId;
+    deliver(stream, JSON.parse(message.data));
+  });
+
+  source.addEventListener('open', () => {
+    if (!stream.disconnected) return;
+    stream.disconnected = false;
+    // Anything older than the server's replay window is gone; ask for each job still awaited
+    new Set(stream.listeners.values()).forEach((audioId) => checkStatus(stream, audioId));
+  });
+
+  source.addEventListener('error', () => {
+    stream.disconnected = true;
+    if (source.readyState !== EventSource.CLOSED) return; // the browser is reconnecting
+    setTimeout(() => {
+      if (streams.get(stream.userId) === stream && stream.source === source) {
+        stream.source = openSource(stream);
+      }
+    }, REOPEN_DELAY_MS);
+  });
+
+  return source;
+}
+
+function getStream(backendUrl: string, userId: number): UserStream {
+  const existing = streams.get(userId);
+  if (existing) return existing;
+
+  const stream = {
+    backendUrl,
+    userId,
+    listeners: new Map(),
+    latest: new Map(),
+    lastEventId: '',
+    disconnected: false,
+  } as UserStream;
+  stream.source = openSource(stream);
+  stream.opened = new Promise((resolve) => {
+    stream.source.addEventListener('open', () => resolve(), { once: true });
+    // Don't hold up uploads if the stream can't connect; waiters fall back to a status check
+    setTimeout(resolve, 2000);
+  });
+
+  streams.set(userId, stream);
+  return stream;
+}
+
+function releaseStream(userId: number) {
+  const stream = streams.get(userId);
+  if (stream && stream.listeners.size === 0) {
+    stream.source.close();
+    streams.delete(userId);
+  }
+}
+
+/** Open (or reuse) the user's stream. Call before uploading so no event is missed. */
+export function connectTranscriptionEvents(backendUrl: string, userId: number): Promise<void> {
+  return getStream(backendUrl, userId).opened;
+}
+
+/**
+ * Resolve with the transcript once `audioId` completes; reject on error, cancellation or timeout.
+ * Does a status read up front in case the job finished before we subscribed, and
+ * again whenever the stream reconnects.
+ */
+export function waitForTranscript(
+  backendUrl: string,
+  userId: number,
+  audioId: string,
+  timeoutMs: number
+): Promise<string> {
+  const stream = getStream(backendUrl, userId);
+
+  return new Promise((resolve, reject) => {
+    let timer: ReturnType<typeof setTimeout>;
+
+    const finish = (fn: () => void) => {
+      clearTimeout(timer);
+      stream.listeners.delete(listener);
+      releaseStream(userId);
+      fn();
+    };
+
+    const listener: EventListener = (event) => {
+      if (event.audio_id !== audioId) return;
+      if (event.status === 'completed') {
+        // An empty transcript (silent recording) is still a finished job
+        const transcript = event.transcript ?? '';
+        finish(() => resolve(transcript));
+      } else if (event.status === 'error') {
+        finish(() => reject(new Error('Transcription failed on server')));
+      } else if (event.status === 'cancelled') {
+        const reason = event.superseded_by
+          ? 'Transcription cancelled - replaced by a newer recording'
+          : 'Transcription cancelled';
+        finish(() => reject(new Error(reason)));
+      }
+    };
+
+    stream.listeners.set(listener, audioId);
+    timer = setTimeout(
+      () => finish(() => reject(new Error('Transcription timeout - please try again'))),
+      timeoutMs
+    );
+
+    const seen = stream.latest.get(audioId);
+    if (seen) {
+      listener(seen);
+      return;
+    }
+
+    checkStatus(stream, audioId);
+  });
+}
@@ -6,9 +6,9 @@ import { useImportedAppointments } from "@/hooks/useImportedAppointments";
 import { useState } from "react";
 
 const Index = () => {
-  const { appointments: dummyAppointments, loading: dummyLoading, error: dummyError } = useDummyAppointments();
-  const { appointments: importedAppointments, loading: importedLoading, error: importedError, refreshAppointments: refreshImportedAppointments } = useImportedAppointments();
   const [selectedDate, setSelectedDate] = useState<Date>(new Date());
+  const { appointments: dummyAppointments, loading: dummyLoading, error: dummyError } = useDummyAppointments();
+  const { appointments: importedAppointments, loading: importedLoading, error: importedError, refreshAppointments: refreshImportedAppointments } = useImportedAppointments(selectedDate);
 
   const handleImportComplete = async () => {
     // Refresh the imported appointments list
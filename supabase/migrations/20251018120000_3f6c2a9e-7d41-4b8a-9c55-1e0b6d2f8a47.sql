@@ -0,0 +1,15 @@
+-- Composite indexes backing the windowed, keyset-paginated appointment list
+-- and the latest-recording / latest-transcription lookups per appointment
+
+-- /appointments/user/{user_id}: WHERE user_id = ? AND appointment_date in window,
+-- ordered by (appointment_date, appointment_time, appointment_id)
+CREATE INDEX IF NOT EXISTS idx_appointments_user_date_time
+    ON public.appointments (user_id, appointment_date, appointment_time, appointment_id);
+
+-- Latest recording per appointment (ORDER BY upload_time DESC LIMIT 1)
+CREATE INDEX IF NOT EXISTS idx_audio_recordings_appointment_upload_time
+    ON public.audio_recordings (appointment_id, upload_time DESC);
+
+-- Latest transcription per recording (ORDER BY transcribed_at DESC)
+CREATE INDEX IF NOT EXISTS idx_transcriptions_audio_transcribed_at
+    ON public.transcriptions (audio_id, transcribed_at DESC);
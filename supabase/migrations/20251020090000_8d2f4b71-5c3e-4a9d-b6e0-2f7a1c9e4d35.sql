@@ -0,0 +1,6 @@
+-- Recordings can be cancelled, by the user or because a newer recording of
+-- the same appointment supersedes them
+ALTER TABLE public.audio_recordings DROP CONSTRAINT IF EXISTS audio_recordings_status_check;
+ALTER TABLE public.audio_recordings
+    ADD CONSTRAINT audio_recordings_status_check
+    CHECK (status IN ('queued', 'processing', 'transcribed', 'error', 'cancelled'));